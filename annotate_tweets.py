@@ -43,6 +43,8 @@ async def main():
     parser.add_argument('--limit', type=int, default=None, help='最多标注数量')
     parser.add_argument('--author', type=str, default=None, help='只标注特定作者')
     parser.add_argument('--batch-size', type=int, default=10, help='每批处理数量')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='最多同时标注的批次数 (默认读取 XSKILL_ANNOTATE_CONCURRENCY，按限流自动下调)')
     
     # 导出选项
     parser.add_argument('--export', action='store_true', help='标注完成后导出 Excel')
@@ -101,8 +103,8 @@ async def main():
             # 保存 Schema
             sm.save_schema(schema)
             
-            # 确保数据库有对应列
-            sm.ensure_schema_columns(schema)
+            # 确保数据库有对应的标注表
+            sm.ensure_schema_table(schema)
             
             print(f"\n✅ Schema '{schema['schema_name']}' 已保存并可使用")
             print(f"\n💡 现在可以使用此 Schema 进行标注:")
@@ -145,28 +147,33 @@ async def run_annotation(schema: dict, sm: StorageManager, args):
     annotator = DynamicAnnotator(
         schema=schema,
         storage_manager=sm,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        concurrency=args.concurrency
     )
     
-    # 执行标注
+    # 执行标注（结果写入该 Schema 的标注表）
+    total = sm.count_tweets(author=args.author)
+    if args.limit:
+        total = min(total, args.limit)
+    
     result = await annotator.annotate_all(
         max_tweets=args.limit,
-        author=args.author
+        author=args.author,
+        persist=True
     )
     
     # 显示结果
     print("\n" + "=" * 60)
     print("📊 标注完成")
     print("=" * 60)
-    print(f"Schema: {result.get('schema_name', 'N/A')}")
-    print(f"总计: {result['total']} 条")
-    print(f"成功: {result['annotated']} 条")
-    print(f"批次: {result.get('batches', 0)} 个")
-    if result['total'] > 0:
-        print(f"成功率: {result['annotated']/result['total']*100:.1f}%")
+    print(f"Schema: {schema.get('schema_name', 'N/A')}")
+    print(f"总计: {total} 条")
+    print(f"成功: {len(result)} 条")
+    if total > 0:
+        print(f"成功率: {len(result)/total*100:.1f}%")
     
     # 导出 Excel
-    if args.export and result['annotated'] > 0:
+    if args.export and result:
         print("\n📤 正在导出带标注的数据...")
         
         from core.exporter import Exporter
@@ -181,36 +188,17 @@ async def run_annotation(schema: dict, sm: StorageManager, args):
 
 def export_with_schema(exporter, schema: dict, author: str = None) -> str:
     """根据 Schema 导出已标注数据"""
-    import sqlite3
     import pandas as pd
     from pathlib import Path
     from datetime import datetime
     
-    # 获取已标注数据
-    conn = sqlite3.connect(exporter.sm.db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    # 使用第一个字段判断是否已标注
-    first_field = schema['fields'][0]['name']
-    query = f"SELECT * FROM content WHERE {first_field} IS NOT NULL"
-    params = []
-    
-    if author:
-        query += " AND author = ?"
-        params.append(author)
-    
-    query += " ORDER BY publish_time DESC"
-    
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
+    # 获取已标注数据（content JOIN 标注表）
+    tweets = exporter.sm.get_annotated_tweets(schema['schema_name'], author=author)
     
-    if not rows:
+    if not tweets:
         print("⚠️ 没有已标注的数据")
         return None
     
-    tweets = [dict(row) for row in rows]
     df = pd.DataFrame(tweets)
     
     # 列映射
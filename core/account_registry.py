@@ -0,0 +1,558 @@
+"""
+account_registry.py - 账号池注册表
+
+核心职责:
+1. 在 SQLite (data/accounts.db) 中维护一级 / 二级账号池，取代整文件重写的 JSON
+2. 按 screen_name（不区分大小写）的主键索引做 O(1) 成员判断与查询
+3. 批量 upsert：来源标签按集合合并，非空新值覆盖旧值，整批在一个事务内原子写入
+4. 兼容旧 JSON：accounts.json / accounts_level1.json / accounts_level2.json 变化时自动导入，
+   并可导出为原格式供查看
+5. AccountIndex：账号池的内存索引（screen_name / name 字典 + 描述分词倒排），按修订号失效
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .connection_manager import ConnectionManager
+
+
+LEVEL_PRIMARY = 1    # 一级账号：推荐名单 / 手动添加
+LEVEL_SECONDARY = 2  # 二级账号：从一级账号的 following 中发现
+
+# accounts.json 中属于一级账号的来源（与 scripts/split_accounts_by_level.py 一致）
+PRIMARY_SOURCES = {"Zara Zhang", "张咋啦推荐", "手动添加"}
+
+ACCOUNT_FIELDS = [
+    "name", "screen_name", "url", "description",
+    "followers_count", "verified", "discovered_at", "updated_at"
+]
+
+
+def normalize_sources(source) -> List[str]:
+    """规范化 source 字段为列表"""
+    if isinstance(source, list):
+        return [s for s in source if s]
+    if isinstance(source, str) and source:
+        return [source]
+    return []
+
+
+class AccountRegistry:
+    """账号池：一行一个账号，来源标签单独成表"""
+
+    def __init__(self, data_dir: str = None, sync_json: bool = True):
+        """
+        Args:
+            data_dir: 数据目录，默认为项目 data/
+            sync_json: 是否导入有变化的旧 JSON 账号文件
+        """
+        if data_dir is None:
+            data_dir = Path(__file__).parent.parent / "data"
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+
+        self.db_path = self.data_dir / "accounts.db"
+        self.db = ConnectionManager(self.db_path, pool_size=2)
+
+        with self.db.transaction() as conn:
+            self._create_tables(conn)
+
+        if sync_json:
+            self.sync_json()
+
+    def _create_tables(self, conn):
+        """建表"""
+        # 普通 rowid 表：rowid 保留加入顺序，与旧 JSON 列表顺序一致
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS accounts (
+                screen_name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+                name TEXT,
+                url TEXT,
+                description TEXT,
+                followers_count INTEGER,
+                verified INTEGER,
+                level INTEGER NOT NULL,
+                discovered_at TEXT,
+                updated_at TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_accounts_level ON accounts(level)')
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS account_sources (
+                screen_name TEXT NOT NULL COLLATE NOCASE,
+                source TEXT NOT NULL,
+                PRIMARY KEY (screen_name, source)
+            ) WITHOUT ROWID
+        ''')
+
+        # 修订号：每次写入加一，内存索引据此判断是否过期
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS registry_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO registry_meta (key, value) VALUES ('revision', 0)")
+
+        # 已导入的 JSON 文件及其 mtime，文件未变化时跳过
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS json_imports (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL
+            )
+        ''')
+
+    def close(self):
+        self.db.close()
+
+    # ==================== 查询 ====================
+
+    def contains(self, screen_name: str) -> bool:
+        """账号是否在池中（主键索引，O(1)）"""
+        with self.db.reader() as conn:
+            return conn.execute(
+                "SELECT 1 FROM accounts WHERE screen_name = ?", (screen_name,)
+            ).fetchone() is not None
+
+    def get(self, screen_name: str) -> Optional[Dict]:
+        """按 screen_name 查询（不区分大小写）"""
+        accounts = self._select("WHERE a.screen_name = ?", [screen_name])
+        return accounts[0] if accounts else None
+
+    def get_many(self, screen_names: Iterable[str]) -> Dict[str, Dict]:
+        """
+        批量查询
+
+        Returns:
+            {小写 screen_name: 账号}，不存在的不出现
+        """
+        names = list(dict.fromkeys(name.lower() for name in screen_names if name))
+        result = {}
+        # 分块避免超过 SQLite 参数上限
+        for i in range(0, len(names), 500):
+            part = names[i:i + 500]
+            for acc in self._select(f"WHERE a.screen_name IN ({', '.join(['?'] * len(part))})", part):
+                result[acc["screen_name"].lower()] = acc
+        return result
+
+    def all(self, level: int = None) -> List[Dict]:
+        """
+        全部账号（旧 JSON 列表格式），按加入顺序
+
+        Args:
+            level: 只返回某一级账号，None 为全部
+        """
+        if level is None:
+            return self._select()
+        return self._select("WHERE a.level = ?", [level])
+
+    def handles(self, level: int = None) -> Set[str]:
+        """全部 screen_name（小写）"""
+        sql = "SELECT screen_name FROM accounts"
+        params = []
+        if level is not None:
+            sql += " WHERE level = ?"
+            params.append(level)
+        with self.db.reader() as conn:
+            return {row[0].lower() for row in conn.execute(sql, params)}
+
+    def count(self, level: int = None) -> int:
+        sql = "SELECT COUNT(*) FROM accounts"
+        params = []
+        if level is not None:
+            sql += " WHERE level = ?"
+            params.append(level)
+        with self.db.reader() as conn:
+            return conn.execute(sql, params).fetchone()[0]
+
+    def revision(self) -> int:
+        """修订号：任何写入后都会变化"""
+        with self.db.reader() as conn:
+            return conn.execute("SELECT value FROM registry_meta WHERE key = 'revision'").fetchone()[0]
+
+    def signature(self) -> tuple:
+        """
+        账号池版本签名：修订号 + 旧 JSON 文件的 mtime
+
+        JSON 被手动修改时签名同样变化，调用方可据此先 sync_json 再重建索引。
+        """
+        mtimes = tuple(
+            path.stat().st_mtime if path.exists() else None
+            for path, _ in self._json_files()
+        )
+        return (self.revision(), mtimes)
+
+    def _select(self, where: str = "", params: List = None) -> List[Dict]:
+        with self.db.reader() as conn:
+            rows = conn.execute(f'''
+                SELECT a.name, a.screen_name, a.url, a.description, a.followers_count,
+                       a.verified, a.discovered_at, a.updated_at, a.level,
+                       (SELECT json_group_array(s.source) FROM account_sources s
+                        WHERE s.screen_name = a.screen_name) AS sources
+                FROM accounts a {where}
+                ORDER BY a.rowid
+            ''', params or []).fetchall()
+        return [self._row_to_account(row) for row in rows]
+
+    @staticmethod
+    def _row_to_account(row) -> Dict:
+        """数据库行 → 旧 JSON 账号格式（单个来源为字符串，多个为列表）"""
+        account = {
+            "name": row["name"],
+            "screen_name": row["screen_name"],
+            "url": row["url"],
+            "description": row["description"] or "",
+        }
+        sources = sorted(json.loads(row["sources"]))
+        account["source"] = sources[0] if len(sources) == 1 else sources
+        if row["followers_count"] is not None:
+            account["followers_count"] = row["followers_count"]
+        if row["verified"] is not None:
+            account["verified"] = bool(row["verified"])
+        account["discovered_at"] = row["discovered_at"]
+        account["updated_at"] = row["updated_at"]
+        account["level"] = row["level"]
+        return account
+
+    # ==================== 写入 ====================
+
+    def upsert(self, account: Dict, level: int = LEVEL_SECONDARY) -> bool:
+        """
+        写入单个账号
+
+        Returns:
+            是否为新账号
+        """
+        added, _ = self.upsert_many([account], level)
+        return added == 1
+
+    def upsert_many(self, accounts: Iterable[Dict], level: int = LEVEL_SECONDARY) -> Tuple[int, int]:
+        """
+        批量 upsert（同一事务）
+
+        已存在的账号：来源标签取并集，name / url / description 以非空的新值为准
+        （改名、改简介会被刷新，新值为空时保留旧值），粉丝数等以新值为准，
+        级别取较高的一级（数值较小）。
+
+        Args:
+            accounts: 账号列表，来源可写在 source 或 sources 中（字符串或列表）
+            level: 新账号的级别
+
+        Returns:
+            (新增数, 更新数)
+        """
+        now = datetime.now().isoformat()
+        rows, source_rows = {}, []
+        for acc in accounts:
+            screen_name = acc.get("screen_name")
+            if not screen_name:
+                continue
+            verified = acc.get("verified")
+            name, url, description = acc.get("name") or "", acc.get("url") or "", acc.get("description") or ""
+            rows[screen_name.lower()] = (
+                screen_name,
+                name or screen_name,
+                url or f"https://x.com/{screen_name}",
+                description,
+                acc.get("followers_count"),
+                None if verified is None else int(bool(verified)),
+                acc.get("level") or level,
+                acc.get("discovered_at") or now,
+                acc.get("updated_at") or now,
+                # 更新已有账号时只用调用方真正给出的值，不用占位默认值覆盖
+                name, url, description
+            )
+            for source in normalize_sources(acc.get("sources") or acc.get("source")):
+                source_rows.append((screen_name, source))
+
+        if not rows:
+            return 0, 0
+
+        with self.db.transaction() as conn:
+            existing = set()
+            names = list(rows)
+            for i in range(0, len(names), 500):
+                part = names[i:i + 500]
+                existing.update(
+                    row[0].lower() for row in conn.execute(
+                        f"SELECT screen_name FROM accounts WHERE screen_name IN ({', '.join(['?'] * len(part))})",
+                        part
+                    )
+                )
+
+            conn.executemany('''
+                INSERT INTO accounts (
+                    screen_name, name, url, description, followers_count,
+                    verified, level, discovered_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(screen_name) DO UPDATE SET
+                    name = COALESCE(NULLIF(?, ''), name),
+                    url = COALESCE(NULLIF(?, ''), url),
+                    description = COALESCE(NULLIF(?, ''), description),
+                    followers_count = COALESCE(excluded.followers_count, followers_count),
+                    verified = COALESCE(excluded.verified, verified),
+                    level = MIN(level, excluded.level),
+                    updated_at = excluded.updated_at
+            ''', list(rows.values()))
+            conn.executemany(
+                "INSERT OR IGNORE INTO account_sources (screen_name, source) VALUES (?, ?)",
+                source_rows
+            )
+            conn.execute("UPDATE registry_meta SET value = value + 1 WHERE key = 'revision'")
+
+        added = len(rows) - len(existing)
+        return added, len(existing)
+
+    # ==================== 旧 JSON 兼容 ====================
+
+    def _json_files(self) -> List[Tuple[Path, Optional[int]]]:
+        """需要同步的旧 JSON 文件及其级别（None 表示按来源推断）"""
+        return [
+            (self.data_dir / "accounts_level1.json", LEVEL_PRIMARY),
+            (self.data_dir / "accounts.json", None),
+            (self.data_dir / "accounts_level2.json", LEVEL_SECONDARY),
+        ]
+
+    def sync_json(self) -> int:
+        """
+        导入 mtime 有变化的旧 JSON 账号文件（upsert 幂等，重复导入无副作用）
+
+        Returns:
+            导入的账号数
+        """
+        with self.db.reader() as conn:
+            imported = {row[0]: row[1] for row in conn.execute("SELECT path, mtime FROM json_imports")}
+
+        total = 0
+        for path, level in self._json_files():
+            if not path.exists():
+                continue
+            mtime = path.stat().st_mtime
+            if imported.get(path.name) == mtime:
+                continue
+
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    accounts = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"⚠️ 账号文件读取失败，已跳过 {path.name}: {e}")
+                continue
+
+            with self.db.transaction() as conn:
+                for acc_level in (LEVEL_PRIMARY, LEVEL_SECONDARY):
+                    batch = [
+                        acc for acc in accounts
+                        if isinstance(acc, dict) and (level or self._infer_level(acc)) == acc_level
+                    ]
+                    self.upsert_many(batch, acc_level)
+                self._record_import(conn, path.name, mtime)
+            total += len(accounts)
+            print(f"📦 已导入账号文件 {path.name}: {len(accounts)} 个账号")
+        return total
+
+    @staticmethod
+    def _infer_level(account: Dict) -> int:
+        sources = normalize_sources(account.get("source") or account.get("sources"))
+        return LEVEL_PRIMARY if PRIMARY_SOURCES.intersection(sources) else LEVEL_SECONDARY
+
+    @staticmethod
+    def _record_import(conn, name: str, mtime: float):
+        conn.execute('''
+            INSERT INTO json_imports (path, mtime) VALUES (?, ?)
+            ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime
+        ''', (name, mtime))
+
+    def export_json(self, path: Path, level: int = None):
+        """
+        导出为旧 JSON 列表格式（原子写入）
+
+        导出后记录文件 mtime，下次 sync_json 不会把自己导出的文件再导入一遍。
+        """
+        path = Path(path)
+        accounts = [
+            {k: v for k, v in acc.items() if k != "level"}
+            for acc in self.all(level)
+        ]
+        temp_path = path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(accounts, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+        if path.parent.resolve() == self.data_dir.resolve():
+            with self.db.transaction() as conn:
+                self._record_import(conn, path.name, path.stat().st_mtime)
+
+
+_LATIN_TOKEN = re.compile(r"[a-z0-9_]+")
+_CJK_RUN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> Set[str]:
+    """
+    分词：拉丁字母按单词，中日韩文字按相邻二字 (bigram)，单个汉字保留单字
+    """
+    text = (text or "").lower()
+    tokens = set(_LATIN_TOKEN.findall(text))
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.add(run)
+        else:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class AccountIndex:
+    """
+    账号池的只读内存索引
+
+    - by_handle / by_name：小写 screen_name / name → 账号，O(1)
+    - 倒排索引：name + screen_name + description 的分词 → 账号序号；
+      查询词在拼接后的词表中做子串定位，因此单词中间、单个汉字同样能命中
+    """
+
+    def __init__(self, accounts: List[Dict]):
+        self.accounts = accounts
+        self.by_handle: Dict[str, Dict] = {}
+        self.by_name: Dict[str, Dict] = {}
+        self._haystacks: List[str] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._fingerprint: Optional[str] = None
+
+        for i, acc in enumerate(accounts):
+            self.by_handle.setdefault((acc.get("screen_name") or "").lower(), acc)
+            self.by_name.setdefault((acc.get("name") or "").lower(), acc)
+
+            haystack = "\n".join(
+                (acc.get(field) or "").lower() for field in ("name", "screen_name", "description")
+            )
+            self._haystacks.append(haystack)
+            for token in tokenize(haystack):
+                self._postings.setdefault(token, []).append(i)
+
+        # 词表拼接为字符串，查询词用 str.find 定位所在的词（词本身不含换行）；
+        # 拉丁词与中文词分开拼接，拉丁词表保持单字节字符串，查找更快
+        self._vocabularies = {
+            latin: self._build_vocabulary([w for w in self._postings if bool(_LATIN_TOKEN.fullmatch(w)) == latin])
+            for latin in (True, False)
+        }
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def token_postings(self) -> Dict[str, List[int]]:
+        """倒排表：词项 → 账号序号列表（升序，只读）"""
+        return self._postings
+
+    @property
+    def fingerprint(self) -> str:
+        """账号池成员指纹（screen_name 集合的哈希），首次访问时计算"""
+        if self._fingerprint is None:
+            digest = hashlib.sha256("\n".join(sorted(self.by_handle)).encode("utf-8"))
+            self._fingerprint = digest.hexdigest()[:16]
+        return self._fingerprint
+
+    @staticmethod
+    def _build_vocabulary(words: List[str]) -> Tuple[str, List[int], List[str]]:
+        offsets, offset = [], 0
+        for word in words:
+            offsets.append(offset)
+            offset += len(word) + 1
+        return "\n".join(words), offsets, words
+
+    def _token_candidates(self, token: str) -> Set[int]:
+        """包含该查询词（作为子串）的所有词对应的账号"""
+        candidates = set()
+        text, offsets, vocabulary = self._vocabularies[bool(_LATIN_TOKEN.fullmatch(token))]
+        pos = text.find(token)
+        while pos != -1:
+            word = bisect.bisect_right(offsets, pos) - 1
+            candidates.update(self._postings[vocabulary[word]])
+            if word + 1 == len(offsets):
+                break
+            pos = text.find(token, offsets[word + 1])
+        return candidates
+
+    def search(self, query: str) -> List[Dict]:
+        """
+        在名称、screen_name、简介中做子串搜索
+
+        包含查询串的文本必然包含查询的每个分词（作为某个词的子串），
+        因此倒排索引求得的候选集是完整的，再逐个做子串校验即可；
+        查询中没有可分的词（例如只有标点）时退回线性扫描。
+        """
+        query = (query or "").lower().strip()
+        if not query:
+            return []
+
+        tokens = tokenize(query)
+        if not tokens:
+            return [acc for acc, haystack in zip(self.accounts, self._haystacks) if query in haystack]
+
+        candidates = None
+        for token in sorted(tokens, key=len, reverse=True):
+            found = self._token_candidates(token)
+            candidates = found if candidates is None else candidates & found
+            if not candidates:
+                return []
+        return [self.accounts[i] for i in sorted(candidates) if query in self._haystacks[i]]
+
+    def find_name(self, name: str) -> Optional[Dict]:
+        """名称精确匹配优先，否则返回第一个名称包含该词的账号"""
+        name = (name or "").lower().strip()
+        if not name:
+            return None
+        if name in self.by_name:
+            return self.by_name[name]
+        for acc in self.search(name):
+            if name in (acc.get("name") or "").lower():
+                return acc
+        return None
+
+
+# 测试代码
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(Path(tmp) / "accounts_level1.json", 'w', encoding='utf-8') as f:
+            json.dump([{"name": "Andrej Karpathy", "screen_name": "karpathy", "source": "Zara Zhang"}], f)
+
+        registry = AccountRegistry(data_dir=tmp)
+        added, updated = registry.upsert_many([
+            {"screen_name": "alice", "name": "Alice", "sources": ["karpathy推荐"]},
+            {"screen_name": "Karpathy", "sources": ["swyx推荐"], "description": "AI"},
+        ])
+        registry.upsert({"screen_name": "ALICE", "source": "swyx推荐", "followers_count": 42})
+        print(f"新增 {added}，更新 {updated}，alice 在池中: {registry.contains('Alice')}")
+        print(f"karpathy: {registry.get('karpathy')}")
+        print(f"二级账号: {registry.all(level=LEVEL_SECONDARY)}")
+
+        registry.export_json(Path(tmp) / "accounts_level2.json", level=LEVEL_SECONDARY)
+        print(f"再次同步导入: {registry.sync_json()} 个账号，签名: {registry.signature()[0]}")
+        registry.close()
+
+    # 索引规模测试：5 万个账号
+    import time
+
+    accounts = [
+        {"name": f"User {i}", "screen_name": f"user{i}", "description": f"研究大模型 agent 第{i % 97}组"}
+        for i in range(50_000)
+    ]
+    accounts.append({"name": "Andrej Karpathy", "screen_name": "karpathy", "description": "AI 研究员, 前特斯拉"})
+    start = time.time()
+    index = AccountIndex(accounts)
+    built = time.time()
+    for query in ["karp", "arpath", "特斯拉", "斯", "Andrej Karpathy"]:
+        t = time.perf_counter()
+        hits = index.search(query)
+        print(f"搜索 {query!r}: {len(hits)} 个结果，{(time.perf_counter() - t) * 1000:.3f} ms")
+    t = time.perf_counter()
+    index.by_handle["karpathy"], index.find_name("andrej karpathy")
+    print(f"建索引 {built - start:.2f}s，按 handle / name 查询 {(time.perf_counter() - t) * 1000:.4f} ms")
@@ -5,17 +5,19 @@ annotator.py - 动态推文标注引擎 (完全重构版)
 1. 根据用户提供的 Schema 动态生成标注 Prompt
 2. 批量调用 LLM 进行标注
 3. 解析结构化返回数据
-4. 动态写入数据库对应列
+4. 写入每个 Schema 独立的标注表 (annotations_<schema_name>)
+5. 多批次并发标注：AIMD 自适应并发、失败批次单独重试、结果保持原始顺序
 """
 
 import os
 import json
-import sqlite3
+import math
 import asyncio
-from typing import List, Dict, Optional, Union
+from itertools import islice
+from typing import Iterator, List, Dict, Optional, Union
 from datetime import datetime
 
-import requests
+from core.llm_client import AdaptiveLimiter, LLMError, backoff_delay, get_llm_client
 
 
 class DynamicAnnotator:
@@ -27,12 +29,18 @@ class DynamicAnnotator:
         storage_manager=None,
         openrouter_api_key: str = None,
         model: str = "google/gemini-2.5-flash-preview-09-2025",
-        batch_size: int = 10
+        batch_size: int = 10,
+        concurrency: int = None,
+        batch_retries: int = None
     ):
         """
         Args:
             schema: 标注 Schema 定义（由 SchemaGenerator 生成或从数据库加载）
             storage_manager: StorageManager 实例
+            concurrency: annotate_all 最大并发批次数，默认读取 XSKILL_ANNOTATE_CONCURRENCY
+                (未设置时与 LLM 客户端并发上限一致)
+            batch_retries: annotate_all 中单个批次失败后的重试次数，默认与 LLM 客户端的
+                最大重试次数一致（批次层是该路径唯一的重试层）
             others: API 配置
         """
         from core.storage_manager import StorageManager
@@ -40,9 +48,42 @@ class DynamicAnnotator:
         self.schema = schema
         self.storage = storage_manager or StorageManager()
         self.api_key = openrouter_api_key or os.getenv("OPENROUTER_API_KEY")
-        self.api_base = "https://openrouter.ai/api/v1/chat/completions"
+        self.llm = get_llm_client(self.api_key)
         self.model = model
         self.batch_size = batch_size
+        self.concurrency = concurrency or int(
+            os.getenv("XSKILL_ANNOTATE_CONCURRENCY", str(self.llm.concurrency))
+        )
+        self.batch_retries = batch_retries if batch_retries is not None else self.llm.max_retries
+    
+    # 标注时读取的标准字段，避免取到数据库中可能存在的旧标注字段
+    CLEAN_FIELDS = [
+        'tweet_id', 'author', 'text', 'publish_time', 'url', 
+        'platform', 'is_retweet', 'like_count', 'retweet_count', 
+        'reply_count', 'quote_count', 'view_count', 'lang', 
+        'author_followers'
+    ]
+    
+    def iter_unannotated_tweets(
+        self,
+        limit: int = None,
+        author: Union[str, List[str], None] = None
+    ) -> Iterator[Dict]:
+        """
+        流式获取需要标注的推文（无状态模式）
+        
+        Args:
+            limit: 最多返回数量
+            author: 可选，单个作者或作者列表
+            
+        Yields:
+            推文字典（只包含 CLEAN_FIELDS）
+        """
+        return self.storage.iter_tweets(
+            author=author,
+            columns=self.CLEAN_FIELDS,
+            limit=limit
+        )
     
     def get_unannotated_tweets(
         self,
@@ -59,40 +100,7 @@ class DynamicAnnotator:
         Returns:
             推文列表
         """
-        conn = sqlite3.connect(self.storage.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # 无状态模式下，获取所有符合条件的推文进行标注
-        # ✅ 关键修复：只获取标准字段，避免获取到数据库中可能存在的旧标注字段
-        clean_fields = [
-            'tweet_id', 'author', 'text', 'publish_time', 'url', 
-            'platform', 'is_retweet', 'like_count', 'retweet_count', 
-            'reply_count', 'quote_count', 'view_count', 'lang', 
-            'author_followers'
-        ]
-        fields_str = ", ".join(clean_fields)
-        
-        query = f"SELECT {fields_str} FROM content WHERE 1=1"
-        params = []
-        
-        if author:
-            if isinstance(author, list):
-                placeholders = ', '.join(['?'] * len(author))
-                query += f" AND author IN ({placeholders})"
-                params.extend(author)
-            else:
-                query += " AND author = ?"
-                params.append(author)
-        
-        if limit:
-            query += f" LIMIT {limit}"
-        
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [dict(row) for row in rows]
+        return list(self.iter_unannotated_tweets(limit=limit, author=author))
     
     async def annotate_batch(self, tweets: List[Dict]) -> List[Dict]:
         """
@@ -210,35 +218,23 @@ class DynamicAnnotator:
         
         return prompt
     
-    async def _call_llm(self, prompt: str, max_tokens: int = 3000) -> str:
-        """调用 OpenRouter API"""
+    async def _call_llm(self, prompt: str, max_tokens: int = 3000, max_retries: int = None) -> str:
+        """调用 OpenRouter API（max_retries 为 None 时使用客户端默认重试）"""
         if not self.api_key:
             raise ValueError("未配置 OPENROUTER_API_KEY")
         
         try:
-            response = requests.post(
-                self.api_base,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                    "HTTP-Referer": "https://github.com/xskill",
-                    "X-Title": "XSkill Dynamic Annotator"
-                },
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.3,
-                    "max_tokens": max_tokens
-                },
-                timeout=180
+            return await self.llm.chat(
+                prompt,
+                model=self.model,
+                temperature=0.3,
+                max_tokens=max_tokens,
+                timeout=180,
+                title="XSkill Dynamic Annotator",
+                max_retries=max_retries
             )
-            response.raise_for_status()
-            
-            result = response.json()
-            return result['choices'][0]['message']['content']
-            
-        except Exception as e:
-            raise Exception(f"LLM 调用失败: {str(e)}")
+        except LLMError as e:
+            raise LLMError(f"LLM 调用失败: {e}", e.status_code, e.retryable, e.retry_after) from e
     
     def _parse_annotations(self, response: str) -> List[Dict]:
         """解析 LLM 返回的 JSON"""
@@ -262,27 +258,19 @@ class DynamicAnnotator:
     
     def save_annotations(self, tweets: List[Dict], annotations: List[Dict]) -> int:
         """
-        动态保存标注结果到数据库
+        保存标注结果到该 Schema 的标注表 (annotations_<schema_name>)
         
         Args:
             tweets: 原始推文列表
             annotations: 标注结果列表（按 id 索引）
             
         Returns:
-            成功更新的数量
+            成功保存的数量
         """
-        conn = sqlite3.connect(self.storage.db_path)
-        cursor = conn.cursor()
-        
-        updated = 0
-        
         # 创建 id -> annotation 的映射
-        ann_map = {ann['id']: ann for ann in annotations}
-        
-        # 动态构建 UPDATE SQL
-        field_names = [field['name'] for field in self.schema['fields']]
-        set_clause = ", ".join([f"{name} = ?" for name in field_names])
+        ann_map = {ann.get('id'): ann for ann in annotations}
         
+        rows = []
         for idx, tweet in enumerate(tweets, 1):
             tweet_id = tweet.get('tweet_id')
             if not tweet_id:
@@ -294,89 +282,168 @@ class DynamicAnnotator:
                 print(f"⚠️ 推文 {tweet_id} 没有对应的标注")
                 continue
             
-            try:
-                # 提取字段值
-                values = []
-                for field in self.schema['fields']:
-                    value = ann.get(field['name'])
-                    
-                    # 类型转换
-                    if field['type'] == 'boolean':
-                        value = 1 if value else 0
-                    elif field['type'] in ['integer', 'float', 'enum', 'text']:
-                        pass  # 保持原样
-                    
-                    values.append(value)
+            row = {'tweet_id': tweet_id}
+            for field in self.schema['fields']:
+                value = ann.get(field['name'])
                 
-                # 执行更新
-                cursor.execute(f'''
-                    UPDATE content
-                    SET {set_clause}
-                    WHERE tweet_id = ?
-                ''', values + [tweet_id])
+                # 类型转换
+                if field['type'] == 'boolean':
+                    value = 1 if value else 0
+                elif isinstance(value, (list, dict)):
+                    value = json.dumps(value, ensure_ascii=False)
                 
-                if cursor.rowcount > 0:
-                    updated += 1
-                    
-            except Exception as e:
-                print(f"❌ 保存标注失败 (tweet_id={tweet_id}): {e}")
-        
-        conn.commit()
-        conn.close()
+                row[field['name']] = value
+            rows.append(row)
         
-        return updated
+        try:
+            return self.storage.save_annotation_rows(self.schema, rows)
+        except Exception as e:
+            print(f"❌ 保存标注失败: {e}")
+            return 0
     
     async def annotate_all(
         self, 
         max_tweets: int = None,
-        author: str = None
+        author: str = None,
+        persist: bool = False,
+        concurrency: int = None
     ) -> List[Dict]:
         """
-        标注所有符合条件的推文 (无状态)
+        标注所有符合条件的推文 (默认无状态)
+        
+        多个批次同时在途，并发数由 AdaptiveLimiter 按 429 与延迟自适应调整；
+        失败的批次单独退避重试，不阻塞其他批次。结果保持原始顺序。
         
         Args:
             max_tweets: 最多标注数量
             author: 可选，只标注特定作者
+            persist: 是否同时写入该 Schema 的标注表
+            concurrency: 最大并发批次数，默认使用实例配置；1 为逐批串行
             
         Returns:
             带有标注字段的新列表
         """
-        tweets = self.get_unannotated_tweets(limit=max_tweets, author=author)
+        total = self.storage.count_tweets(author=author)
+        if max_tweets:
+            total = min(total, max_tweets)
         
-        if not tweets:
+        if not total:
             return []
+        if not self.api_key:
+            print("❌ 未配置 OPENROUTER_API_KEY，无法标注")
+            return []
+        
+        max_concurrency = max(1, concurrency or self.concurrency)
+        num_batches = math.ceil(total / self.batch_size)
+        print(f"📋 正在标注 {total} 条符合条件的推文 ({num_batches} 批，最多 {max_concurrency} 批并发)...")
         
-        print(f"📋 正在标注 {len(tweets)} 条符合条件的推文...")
+        limiter = AdaptiveLimiter(max_concurrency)
+        # 已读入内存、尚未完成的批次数上限：数据库仍按需流式读取
+        pending = asyncio.Semaphore(max_concurrency * 2)
+        results: Dict[int, List[Dict]] = {}
+        stats = {"done": 0, "failed": 0}
+        
+        async def run(batch_idx: int, batch: List[Dict]):
+            try:
+                annotations = await self._annotate_batch_with_retry(batch, batch_idx, num_batches, limiter)
+                if annotations:
+                    if persist:
+                        self.save_annotations(batch, annotations)
+                    results[batch_idx] = self._merge_annotations(batch, annotations)
+                else:
+                    stats["failed"] += 1
+                stats["done"] += 1
+                print(f"🔄 批次 {batch_idx}/{num_batches} 完成 ({len(batch)} 条，"
+                      f"进度 {stats['done']}/{num_batches}，并发上限 {int(limiter.limit)})")
+            finally:
+                pending.release()
+        
+        # 按批次从数据库流式读取，不预先加载全部推文
+        tweets = self.iter_unannotated_tweets(limit=max_tweets, author=author)
+        batches = iter(lambda: list(islice(tweets, self.batch_size)), [])
+        
+        tasks = []
+        try:
+            for batch_idx, batch in enumerate(batches, 1):
+                await pending.acquire()
+                tasks.append(asyncio.create_task(run(batch_idx, batch)))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        if stats["failed"]:
+            print(f"⚠️ {stats['failed']} 个批次重试后仍失败，已跳过")
+        print(f"📈 峰值并发 {limiter.peak} 批")
         
         annotated_results = []
-        batches = [tweets[i:i + self.batch_size] 
-                   for i in range(0, len(tweets), self.batch_size)]
+        for batch_idx in sorted(results):
+            annotated_results.extend(results[batch_idx])
+        return annotated_results
+    
+    async def _annotate_batch_with_retry(
+        self,
+        batch: List[Dict],
+        batch_idx: int,
+        num_batches: int,
+        limiter: AdaptiveLimiter
+    ) -> List[Dict]:
+        """
+        标注单个批次，失败时退避后单独重试
         
-        for batch_idx, batch in enumerate(batches, 1):
-            print(f"🔄 处理批次 {batch_idx}/{len(batches)} ({len(batch)} 条)...")
-            
-            # 批量获取 AI 标注
-            annotations = await self.annotate_batch(batch)
-            
-            if annotations:
-                # 组合数据 (不存数据库)
-                ann_map = {ann['id']: ann for ann in annotations}
-                for idx, tweet in enumerate(batch, 1):
-                    ann = ann_map.get(idx, {})
-                    # 合并字段
-                    annotated_tweet = tweet.copy()
-                    annotated_tweet.update(ann)
-                    # 移除 AI 标注中可能带有的 id (标注序号)
-                    if 'id' in annotated_tweet and annotated_tweet['id'] != tweet.get('id'):
-                        del annotated_tweet['id']
-                    
-                    annotated_results.append(annotated_tweet)
+        这是该路径唯一的重试层：LLM 客户端以 max_retries=0 调用，每次尝试只发一个请求，
+        429 直接反馈给 AdaptiveLimiter，退避遵守 Retry-After 且不占用并发名额；
+        认证、参数错误等不可重试的 LLMError 直接放弃。
+        
+        Returns:
+            标注结果列表，重试用尽后为空列表
+        """
+        prompt = self._generate_annotation_prompt(batch)
+        
+        for attempt in range(self.batch_retries + 1):
+            ticket = await limiter.acquire()
+            throttled, ok, retry_after = False, False, None
+            try:
+                annotations = self._parse_annotations(await self._call_llm(prompt, max_retries=0))
+                ok = bool(annotations)
+                if ok:
+                    return annotations
+                error = "响应中没有可用的标注"
+            except LLMError as e:
+                throttled, retry_after = e.status_code == 429, e.retry_after
+                if e.status_code and not e.retryable:
+                    print(f"❌ 批次 {batch_idx}/{num_batches} 标注失败: {e}")
+                    return []
+                error = e
+            except Exception as e:
+                error = e
+            finally:
+                await limiter.release(ticket, throttled, ok)
             
-            # 避免 API 限流
-            if batch_idx < len(batches):
-                await asyncio.sleep(1)
+            if attempt < self.batch_retries:
+                wait = backoff_delay(attempt, retry_after)
+                print(f"⚠️ 批次 {batch_idx}/{num_batches} 失败 ({error})，{wait:.1f}s 后重试")
+                await asyncio.sleep(wait)
         
-        return annotated_results
+        print(f"❌ 批次 {batch_idx}/{num_batches} 标注失败: {error}")
+        return []
+    
+    @staticmethod
+    def _merge_annotations(batch: List[Dict], annotations: List[Dict]) -> List[Dict]:
+        """把标注字段合并回推文（按标注序号 id 对应）"""
+        ann_map = {ann.get('id'): ann for ann in annotations if isinstance(ann, dict)}
+        merged = []
+        for idx, tweet in enumerate(batch, 1):
+            ann = ann_map.get(idx, {})
+            # 合并字段
+            annotated_tweet = tweet.copy()
+            annotated_tweet.update(ann)
+            # 移除 AI 标注中可能带有的 id (标注序号)
+            if 'id' in annotated_tweet and annotated_tweet['id'] != tweet.get('id'):
+                del annotated_tweet['id']
+            
+            merged.append(annotated_tweet)
+        return merged
 
 
 # ==================== 测试代码 ====================
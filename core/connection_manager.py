@@ -0,0 +1,243 @@
+"""
+connection_manager.py - SQLite 连接池与事务管理
+
+核心职责:
+1. 维护一个长连接写入器 (writer)，所有写操作串行经过它
+2. 维护一个只读连接池 (readers)，读操作与写入并发进行
+3. 启用 WAL 日志模式，并按 profile 调整 synchronous / cache_size / mmap_size
+4. 提供上下文管理的事务
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Union
+
+
+# PRAGMA 调优档位
+# - safe: 每次提交都 fsync，适合数据比速度重要的场景
+# - balanced: WAL 下 NORMAL 已足够安全，默认使用
+# - fast: 批量导入/重建索引时使用，断电可能丢失最近事务
+PRAGMA_PROFILES = {
+    "safe": {
+        "synchronous": "FULL",
+        "cache_size": -16000,       # 16 MB
+        "mmap_size": 0,
+    },
+    "balanced": {
+        "synchronous": "NORMAL",
+        "cache_size": -64000,       # 64 MB
+        "mmap_size": 268435456,     # 256 MB
+    },
+    "fast": {
+        "synchronous": "OFF",
+        "cache_size": -256000,      # 256 MB
+        "mmap_size": 1073741824,    # 1 GB
+    },
+}
+
+
+class ConnectionManager:
+    """SQLite 连接管理器：单写多读 + WAL"""
+
+    def __init__(
+        self,
+        db_path: Union[str, Path],
+        profile: str = "balanced",
+        pool_size: int = 4,
+        busy_timeout: int = 5000
+    ):
+        """
+        Args:
+            db_path: 数据库文件路径
+            profile: PRAGMA 档位 (safe / balanced / fast)
+            pool_size: 只读连接池大小
+            busy_timeout: 等待锁的毫秒数
+        """
+        if profile not in PRAGMA_PROFILES:
+            raise ValueError(f"未知的 PRAGMA 档位: {profile} (可选: {', '.join(PRAGMA_PROFILES)})")
+
+        self.db_path = Path(db_path)
+        self.profile = profile
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+
+        self._write_lock = threading.RLock()
+        self._tx_depth = 0
+        self._writer = self._open_writer()
+
+        self._readers = queue.LifoQueue(maxsize=pool_size)
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._closed = False
+
+    def _apply_pragmas(self, conn: sqlite3.Connection):
+        """应用当前档位的 PRAGMA"""
+        settings = PRAGMA_PROFILES[self.profile]
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+        conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+        conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+
+    def _open_writer(self) -> sqlite3.Connection:
+        """打开写连接并切换到 WAL 模式"""
+        conn = sqlite3.connect(
+            self.db_path,
+            isolation_level=None,       # 手动管理事务
+            check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        self._apply_pragmas(conn)
+        return conn
+
+    def _open_reader(self) -> sqlite3.Connection:
+        """打开只读连接"""
+        uri = f"{self.db_path.resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        self._apply_pragmas(conn)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def set_profile(self, profile: str):
+        """切换 PRAGMA 档位（对已打开的连接立即生效）"""
+        if profile not in PRAGMA_PROFILES:
+            raise ValueError(f"未知的 PRAGMA 档位: {profile}")
+        self.profile = profile
+        with self._write_lock:
+            self._apply_pragmas(self._writer)
+        # 空闲的读连接在下次取用时重建
+        self._drain_readers()
+
+    # ==================== 写操作 ====================
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        写事务上下文
+
+        正常退出时提交，异常时回滚。嵌套调用会并入最外层事务，
+        因此一个方法内部可以放心调用其他写方法。
+
+        Example:
+            with db.transaction() as conn:
+                conn.execute("INSERT ...")
+        """
+        with self._write_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("ConnectionManager 已关闭")
+
+            outermost = self._tx_depth == 0
+            if outermost:
+                self._writer.execute("BEGIN IMMEDIATE")
+            self._tx_depth += 1
+            try:
+                yield self._writer
+            except BaseException:
+                self._tx_depth -= 1
+                if outermost:
+                    self._writer.execute("ROLLBACK")
+                raise
+            else:
+                self._tx_depth -= 1
+                if outermost:
+                    self._writer.execute("COMMIT")
+
+    # 写连接与事务是同一个概念，提供别名便于阅读
+    writer = transaction
+
+    # ==================== 读操作 ====================
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """
+        从只读连接池借出一个连接
+
+        WAL 模式下读连接看到的是事务开始时的快照，不会被写入阻塞。
+        连接在退出上下文后归还连接池。
+        """
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn)
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        if self._closed:
+            raise sqlite3.ProgrammingError("ConnectionManager 已关闭")
+
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._reader_lock:
+            if self._reader_count < self.pool_size:
+                self._reader_count += 1
+                try:
+                    return self._open_reader()
+                except Exception:
+                    self._reader_count -= 1
+                    raise
+
+        # 池已满，等待其他调用方归还；超时与写连接的 busy_timeout 一致，抛 sqlite3 异常
+        try:
+            return self._readers.get(timeout=self.busy_timeout / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError("database reader pool exhausted") from None
+
+    def _release_reader(self, conn: sqlite3.Connection):
+        if self._closed or conn.in_transaction:
+            # 未正常结束的读事务不回池，直接丢弃
+            self._discard_reader(conn)
+            return
+        try:
+            self._readers.put_nowait(conn)
+        except queue.Full:
+            self._discard_reader(conn)
+
+    def _discard_reader(self, conn: sqlite3.Connection):
+        try:
+            conn.close()
+        finally:
+            with self._reader_lock:
+                self._reader_count -= 1
+
+    def _drain_readers(self):
+        while True:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                break
+            self._discard_reader(conn)
+
+    # ==================== 生命周期 ====================
+
+    def checkpoint(self, mode: str = "PASSIVE"):
+        """手动触发 WAL checkpoint"""
+        with self._write_lock:
+            self._writer.execute(f"PRAGMA wal_checkpoint({mode})")
+
+    def close(self):
+        """关闭所有连接"""
+        if self._closed:
+            return
+        self._closed = True
+        self._drain_readers()
+        with self._write_lock:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -4,14 +4,18 @@ discoverer.py - 账号发现引擎
 核心职责:
 1. 监控 Zara 推荐页面 (https://zara.faces.site/ai)
 2. 增量识别新增博主
-3. 只增不减策略保留历史数据
+3. 只增不减策略保留历史数据（账号池存于 AccountRegistry）
 4. 新博主提醒功能
+5. 条件请求 (ETag / Last-Modified) + 内容哈希，页面未变化时不解析；
+   最小刷新间隔内直接跳过网络请求
 
 基于原 zara.py 的 AccountDiscoverer 类重构
 """
 
+import hashlib
 import json
 import os
+import time
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 from pathlib import Path
@@ -19,6 +23,8 @@ from pathlib import Path
 import requests
 from bs4 import BeautifulSoup
 
+from .account_registry import AccountRegistry, AccountIndex, LEVEL_PRIMARY
+
 
 class AccountDiscoverer:
     """账号发现器：负责爬取页面并维护增量账号池"""
@@ -26,55 +32,139 @@ class AccountDiscoverer:
     def __init__(
         self, 
         target_url: str = "https://zara.faces.site/ai", 
-        data_dir: str = None
+        data_dir: str = None,
+        min_refresh_interval: float = None
     ):
+        """
+        Args:
+            target_url: 推荐页面地址
+            data_dir: 数据目录，默认为项目 data/
+            min_refresh_interval: 两次检查页面的最小间隔（秒），默认读取
+                XSKILL_DISCOVERY_INTERVAL (3600)，0 表示每次都检查
+        """
         self.target_url = target_url
+        self.min_refresh_interval = (
+            min_refresh_interval if min_refresh_interval is not None
+            else float(os.getenv("XSKILL_DISCOVERY_INTERVAL", "3600"))
+        )
         
         if data_dir is None:
             data_dir = Path(__file__).parent.parent / "data"
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
         
-        self.accounts_path = self.data_dir / "accounts.json"
+        # 账号池：data/accounts.db，旧 accounts.json 有变化时自动导入
+        self.registry = AccountRegistry(self.data_dir)
+        
+        # 页面检查状态：ETag / Last-Modified / 内容哈希 / 上次检查时间
+        self.state_path = self.data_dir / "discovery_state.json"
+        
+        # 内存索引，账号池签名变化时重建
+        self._index: Optional[AccountIndex] = None
+        self._index_signature = None
         
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         }
     
     def _load_accounts(self) -> List[Dict]:
-        """加载现有账号池"""
-        if self.accounts_path.exists():
-            with open(self.accounts_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
-    
-    def _save_accounts(self, accounts: List[Dict]):
-        """保存账号池"""
-        with open(self.accounts_path, 'w', encoding='utf-8') as f:
-            json.dump(accounts, f, ensure_ascii=False, indent=2)
-    
-    def fetch_and_update(self) -> Tuple[int, List[Dict]]:
+        """加载现有账号池（旧 JSON 列表格式）"""
+        return list(self.index.accounts)
+    
+    @property
+    def index(self) -> AccountIndex:
+        """
+        账号池内存索引
+        
+        每次访问只比较签名（修订号 + 旧 JSON 的 mtime），未变化时直接复用；
+        JSON 被手动修改时先导入再重建。
+        """
+        signature = self.registry.signature()
+        if self._index is None or signature != self._index_signature:
+            if self._index_signature is not None and signature[1] != self._index_signature[1]:
+                self.registry.sync_json()
+                signature = self.registry.signature()
+            self._index = AccountIndex(self.registry.all())
+            self._index_signature = signature
+        return self._index
+    
+    def _load_state(self) -> Dict:
+        """加载页面检查状态"""
+        if self.state_path.exists():
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get("url") == self.target_url:
+                    return state
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"⚠️ 页面检查状态文件损坏，已忽略: {e}")
+        return {"url": self.target_url}
+    
+    def _save_state(self, state: Dict):
+        """原子写入页面检查状态"""
+        tmp_path = self.state_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+    
+    def fetch_and_update(self, force: bool = False) -> Tuple[int, List[Dict]]:
         """
         从目标网页爬取博主信息并更新本地账号池
         
+        Args:
+            force: 忽略最小刷新间隔，立即检查页面
+        
         Returns:
             (new_count, new_accounts): 新增数量和新增账号列表
         """
-        # 1. 加载现有库
-        accounts = self._load_accounts()
-        existing_urls = {a['url'] for a in accounts}
+        state = self._load_state()
+        now = time.time()
+        
+        # 1. 最小刷新间隔内不发请求
+        elapsed = now - state.get("last_checked", 0)
+        if not force and elapsed < self.min_refresh_interval:
+            print(f"⏭️  账号池 {elapsed / 60:.0f} 分钟前已检查，跳过（间隔 {self.min_refresh_interval / 60:.0f} 分钟）")
+            return 0, []
+        
+        # 2. 条件请求：页面未变化时服务端返回 304，不传输正文
+        headers = dict(self.headers)
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
         
-        # 2. 爬取目标网页
+        # 失败同样记录检查时间，站点不可用时不会让每次查询都等满超时
+        state["last_checked"] = now
         try:
-            resp = requests.get(self.target_url, headers=self.headers, timeout=30)
+            resp = requests.get(self.target_url, headers=headers, timeout=30)
+            if resp.status_code == 304:
+                self._save_state(state)
+                print("✅ 推荐页面未变化 (304)")
+                return 0, []
             resp.raise_for_status()
         except requests.RequestException as e:
+            state["last_error"] = str(e)
+            self._save_state(state)
             print(f"❌ 爬取失败: {e}")
             return 0, []
         
+        state.pop("last_error", None)
+        state["etag"] = resp.headers.get("ETag")
+        state["last_modified"] = resp.headers.get("Last-Modified")
+        
+        # 3. 服务端不支持条件请求时，用内容哈希判断是否变化
+        content_hash = hashlib.sha256(resp.content).hexdigest()
+        if content_hash == state.get("content_hash"):
+            self._save_state(state)
+            print("✅ 推荐页面内容未变化")
+            return 0, []
+        
+        # 4. 已有账号的 screen_name 集合（小写）
+        existing_handles = self.registry.handles()
+        
         soup = BeautifulSoup(resp.text, 'html.parser')
         
-        # 3. 解析博主卡片 (匹配 div 结构)
+        # 5. 解析博主卡片 (匹配 div 结构)
         new_accounts = []
         cards = soup.find_all('div', class_='bg-white rounded-2xl')
         
@@ -85,8 +175,11 @@ class AccountDiscoverer:
                 
             url = link_tag['href']
             
+            # 从 URL 提取用户名 (如 x.com/username 或 twitter.com/username)
+            screen_name = self._extract_screen_name(url)
+            
             # 跳过已存在的
-            if url in existing_urls:
+            if screen_name.lower() in existing_handles:
                 continue
             
             # 解析博主信息
@@ -94,9 +187,6 @@ class AccountDiscoverer:
             paragraphs = card.find_all('p')
             desc = paragraphs[-1].text.strip() if paragraphs else ""
             
-            # 从 URL 提取用户名 (如 x.com/username 或 twitter.com/username)
-            screen_name = self._extract_screen_name(url)
-            
             new_account = {
                 "name": name,
                 "screen_name": screen_name,
@@ -107,14 +197,16 @@ class AccountDiscoverer:
                 "updated_at": datetime.now().isoformat()
             }
             
-            accounts.append(new_account)
             new_accounts.append(new_account)
-            existing_urls.add(url)
+            existing_handles.add(screen_name.lower())
         
-        # 4. 保存 (只增不减)
+        # 6. 保存 (只增不减，整批一个事务)；入库后才记录哈希，失败时下次重新解析
         if new_accounts:
-            self._save_accounts(accounts)
+            self.registry.upsert_many(new_accounts, level=LEVEL_PRIMARY)
             self._print_new_accounts_alert(new_accounts)
+        state["content_hash"] = content_hash
+        state["last_changed"] = now
+        self._save_state(state)
         
         return len(new_accounts), new_accounts
     
@@ -145,19 +237,17 @@ class AccountDiscoverer:
     
     def get_account_by_handle(self, screen_name: str) -> Optional[Dict]:
         """根据 screen_name 获取账号信息"""
-        accounts = self._load_accounts()
-        for acc in accounts:
-            if acc.get('screen_name', '').lower() == screen_name.lower():
-                return acc
-        return None
+        if not screen_name:
+            return None
+        return self.index.by_handle.get(screen_name.strip().lstrip('@').lower())
     
     def get_account_by_name(self, name: str) -> Optional[Dict]:
-        """根据名称获取账号信息"""
-        accounts = self._load_accounts()
-        for acc in accounts:
-            if name.lower() in acc.get('name', '').lower():
-                return acc
-        return None
+        """根据名称获取账号信息（精确匹配优先，其次名称包含该词）"""
+        return self.index.find_name(name)
+    
+    def get_account_by_exact_name(self, name: str) -> Optional[Dict]:
+        """根据名称精确匹配（不区分大小写）"""
+        return self.index.by_name.get((name or '').strip().lower())
     
     def add_manual_account(
         self, 
@@ -167,13 +257,11 @@ class AccountDiscoverer:
         description: str = ""
     ) -> Dict:
         """手动添加账号"""
-        accounts = self._load_accounts()
-        
         # 检查是否已存在
-        for acc in accounts:
-            if acc.get('screen_name', '').lower() == screen_name.lower():
-                print(f"⚠️ 账号 @{screen_name} 已存在")
-                return acc
+        existing = self.registry.get(screen_name)
+        if existing:
+            print(f"⚠️ 账号 @{screen_name} 已存在")
+            return existing
         
         new_account = {
             "name": name or screen_name,
@@ -185,33 +273,22 @@ class AccountDiscoverer:
             "updated_at": datetime.now().isoformat()
         }
         
-        accounts.append(new_account)
-        self._save_accounts(accounts)
+        self.registry.upsert(new_account, level=LEVEL_PRIMARY)
         print(f"✅ 已添加账号: @{screen_name}")
         
         return new_account
     
     def search_accounts(self, query: str) -> List[Dict]:
-        """搜索账号（模糊匹配名称和描述）"""
-        accounts = self._load_accounts()
-        query_lower = query.lower()
-        
-        results = []
-        for acc in accounts:
-            if (query_lower in acc.get('name', '').lower() or
-                query_lower in acc.get('screen_name', '').lower() or
-                query_lower in acc.get('description', '').lower()):
-                results.append(acc)
-        
-        return results
+        """搜索账号（在名称、screen_name 和描述中做子串匹配，走倒排索引）"""
+        return self.index.search(query)
 
 
 # ==================== 测试代码 ====================
 if __name__ == "__main__":
     discoverer = AccountDiscoverer()
     
-    # 更新账号池
-    new_count, new_accounts = discoverer.fetch_and_update()
+    # 更新账号池（忽略刷新间隔）
+    new_count, new_accounts = discoverer.fetch_and_update(force=True)
     print(f"本次更新：新增 {new_count} 个博主")
     
     # 显示所有账号
@@ -8,13 +8,15 @@ exporter.py - 多维数据提取并导出为带超链接的 Excel 报告
 """
 
 import os
-import sqlite3
+from collections import Counter
 from datetime import datetime
-from typing import List, Optional, Union
+from itertools import chain, islice
+from typing import Iterable, List, Optional, Union
 from pathlib import Path
 
 import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 
 from .storage_manager import StorageManager
@@ -38,11 +40,16 @@ class Exporter:
         end_date: str = None,
         keyword: str = None,
         filename: str = None,
-        external_data: List[dict] = None
+        external_data: List[dict] = None,
+        match: str = None,
+        chunk_size: int = 2000
     ) -> str:
         """
         导出数据到 Excel 文件
         
+        从数据库导出时使用 iter_tweets 分块读取，并以 openpyxl 只写模式逐块写入，
+        内存占用与导出总量无关。
+        
         Args:
             author: 按作者筛选
             start_date: 起始日期 (YYYY-MM-DD)
@@ -50,26 +57,56 @@ class Exporter:
             keyword: 全文搜索关键词
             filename: 自定义文件名，默认自动生成
             external_data: 可选，直接传入要导出的数据列表（如果提供则跳过数据库查询）
+            match: 可选，FTS5 全文查询语法（短语 / 前缀 / 布尔）
+            chunk_size: 从数据库读取时每块的行数
             
         Returns:
             生成的 Excel 文件路径
         """
-        # 1. 获取数据
+        # 1. 获取数据（按块）
         if external_data is not None:
-            tweets = external_data
+            chunks = iter([external_data])
         else:
-            tweets = self.sm.get_tweets(
+            rows = self.sm.iter_tweets(
                 author=author,
                 start_date=start_date,
                 end_date=end_date,
-                keyword=keyword
+                keyword=keyword,
+                match=match,
+                chunk_size=chunk_size
             )
+            chunks = iter(lambda: list(islice(rows, chunk_size)), [])
         
-        if not tweets:
+        first_chunk = next(chunks, None)
+        if not first_chunk:
             print("⚠️ 没有找到符合条件的数据")
             return None
         
-        # 2. 转换为 DataFrame
+        # 2. 生成文件名：YYYYMMDD_HHMMSS_作者_数据导出.xlsx
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            if isinstance(author, list):
+                if len(author) > 3:
+                    author_part = "多博主_"
+                else:
+                    author_part = f"{'_'.join(author)}_"
+            else:
+                author_part = f"{author}_" if author else "全部_"
+            filename = f"{timestamp}_{author_part}数据导出.xlsx"
+        
+        filepath = self.output_dir / filename
+        
+        # 3. 逐块转换为 DataFrame 并写入（超链接与列宽在写入时处理）
+        frames = (self._prepare_export_frame(chunk) for chunk in chain([first_chunk], chunks))
+        total = self._write_excel_stream(filepath, frames)
+        
+        print(f"✅ 数据已导出: {filepath}")
+        print(f"   共 {total} 条记录")
+        
+        return str(filepath)
+    
+    def _prepare_export_frame(self, tweets: List[dict]) -> pd.DataFrame:
+        """将推文列表转换为导出用的 DataFrame（列重命名、排序、格式化）"""
         # 直接使用数据库返回的列
         df = pd.DataFrame(tweets)
         
@@ -124,30 +161,61 @@ class Exporter:
         if '是否转发' in df.columns:
             df['是否转发'] = df['是否转发'].apply(lambda x: '是' if x else '否')
         
-        # 3. 生成文件名：YYYYMMDD_HHMMSS_作者_数据导出.xlsx
-        if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            if isinstance(author, list):
-                if len(author) > 3:
-                    author_part = "多博主_"
-                else:
-                    author_part = f"{'_'.join(author)}_"
-            else:
-                author_part = f"{author}_" if author else "全部_"
-            filename = f"{timestamp}_{author_part}数据导出.xlsx"
-        
-        filepath = self.output_dir / filename
+        return df
+    
+    def _write_excel_stream(self, filepath: Path, frames: Iterable[pd.DataFrame]) -> int:
+        """
+        以 openpyxl 只写模式逐块写入 Excel
         
-        # 4. 导出到 Excel（临时，不带超链接）
-        df.to_excel(filepath, index=False, engine='openpyxl')
+        表头与列宽由第一块决定（只写模式下列宽必须在写入数据前设置），
+        "原文链接" 列直接写成超链接单元格。
         
-        # 5. 使用 openpyxl 添加超链接
-        self._add_hyperlinks(filepath, df)
+        Returns:
+            写入的数据行数
+        """
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
         
-        print(f"✅ 数据已导出: {filepath}")
-        print(f"   共 {len(df)} 条记录")
+        header = None
+        url_col_idx = None
+        total = 0
+        
+        for df in frames:
+            if header is None:
+                header = list(df.columns)
+                url_col_idx = header.index('原文链接') if '原文链接' in header else None
+                
+                # 调整列宽（限制最大宽度）
+                for idx, col in enumerate(header, start=1):
+                    max_length = len(str(col))
+                    if idx - 1 == url_col_idx:
+                        max_length = max(max_length, len("🔗 查看原文"))
+                    else:
+                        lengths = df[col].dropna().astype(str).str.len()
+                        if not lengths.empty:
+                            max_length = max(max_length, int(lengths.max()))
+                    ws.column_dimensions[get_column_letter(idx)].width = min(max_length + 2, 50)
+                
+                ws.append(header)
+            else:
+                # 后续块与表头对齐
+                df = df.reindex(columns=header)
+            
+            df = df.astype(object).where(pd.notna(df), None)
+            for values in df.itertuples(index=False, name=None):
+                row = list(values)
+                if url_col_idx is not None:
+                    url = row[url_col_idx]
+                    if url and isinstance(url, str) and url.startswith('http'):
+                        cell = WriteOnlyCell(ws, value="🔗 查看原文")
+                        cell.hyperlink = url
+                        cell.style = 'Hyperlink'
+                        row[url_col_idx] = cell
+                ws.append(row)
+            total += len(df)
         
-        return str(filepath)
+        wb.save(filepath)
+        return total
     
     def _add_hyperlinks(self, filepath: str, df: pd.DataFrame):
         """
@@ -214,39 +282,56 @@ class Exporter:
         Returns:
             包含统计信息的字典
         """
-        tweets = self.sm.get_tweets(
+        # 只取统计需要的列，逐行累计，不在内存中保留全部数据
+        rows = self.sm.iter_tweets(
             author=author,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            columns=['author', 'publish_time', 'is_retweet']
         )
         
-        if not tweets:
+        total = 0
+        retweets = 0
+        first_time = None
+        last_time = None
+        author_counts = Counter()
+        
+        for row in rows:
+            total += 1
+            author_counts[row['author']] += 1
+            if row['is_retweet']:
+                retweets += 1
+            publish_time = row['publish_time']
+            if publish_time:
+                if first_time is None or publish_time < first_time:
+                    first_time = publish_time
+                if last_time is None or publish_time > last_time:
+                    last_time = publish_time
+        
+        if not total:
             return {"total": 0}
         
-        df = pd.DataFrame(tweets)
-        
         summary = {
-            "total": len(df),
-            "authors": df['author'].nunique() if 'author' in df.columns else 0,
+            "total": total,
+            "authors": len(author_counts),
             "date_range": {
-                "start": df['publish_time'].min() if 'publish_time' in df.columns else None,
-                "end": df['publish_time'].max() if 'publish_time' in df.columns else None
+                "start": first_time,
+                "end": last_time
             },
-            "retweets": int(df['is_retweet'].sum()) if 'is_retweet' in df.columns else 0,
-            "original": len(df) - int(df['is_retweet'].sum()) if 'is_retweet' in df.columns else len(df)
+            "retweets": retweets,
+            "original": total - retweets
         }
         
         # 按作者统计
-        if 'author' in df.columns:
-            author_counts = df['author'].value_counts().to_dict()
-            summary["by_author"] = dict(list(author_counts.items())[:10])  # 只取前10
+        summary["by_author"] = dict(author_counts.most_common(10))  # 只取前10
         
         return summary
     
     def export_annotated_tweets(
         self,
-        author: str = None,
-        filename: str = None
+        author: Union[str, List[str], None] = None,
+        filename: str = None,
+        schema_name: str = None
     ) -> str:
         """
         导出已标注的推文数据
@@ -254,40 +339,30 @@ class Exporter:
         Args:
             author: 可选，只导出特定作者
             filename: 自定义文件名
+            schema_name: 标注 Schema 名称，默认使用最近创建的 Schema
             
         Returns:
             导出文件路径
         """
-        # 获取已标注数据
-        conn = sqlite3.connect(self.sm.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        query = "SELECT * FROM content WHERE annotated_at IS NOT NULL"
-        params = []
-        
-        if author:
-            if isinstance(author, list):
-                if author:
-                    placeholders = ', '.join(['?'] * len(author))
-                    query += f" AND author IN ({placeholders})"
-                    params.extend(author)
-            else:
-                query += " AND author = ?"
-                params.append(author)
-        
-        query += " ORDER BY annotated_at DESC"
+        if schema_name is None:
+            schemas = self.sm.list_schemas()
+            if not schemas:
+                print("⚠️ 尚未创建任何标注 Schema")
+                return None
+            schema_name = schemas[0]['schema_name']
+        
+        schema = self.sm.load_schema(schema_name)
+        if not schema:
+            print(f"⚠️ Schema '{schema_name}' 不存在")
+            return None
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
+        # 获取已标注数据（content JOIN 标注表）
+        tweets = self.sm.get_annotated_tweets(schema_name, author=author)
         
-        if not rows:
+        if not tweets:
             print("⚠️ 没有已标注的数据")
             return None
         
-        tweets = [dict(row) for row in rows]
-        
         # 转换为 DataFrame
         df = pd.DataFrame(tweets)
         
@@ -298,10 +373,7 @@ class Exporter:
             'publish_time': '发布时间',
             
             # 标注字段
-            'sentiment': '情感倾向',
-            'topic_category': '主题分类',
-            'importance_score': '重要性',
-            'keywords': '关键词',
+            **{field['name']: field.get('display_name', field['name']) for field in schema['fields']},
             
             # 互动数据
             'like_count': '点赞数',
@@ -323,12 +395,11 @@ class Exporter:
         df.rename(columns=columns_mapping, inplace=True)
         
         # 排序
-        preferred_order = [
-            '作者', '内容', '发布时间',
-            '情感倾向', '主题分类', '重要性', '关键词',
-            '点赞数', '转发数', '评论数', '阅读量',
-            '原文链接', '标注时间', '语言'
-        ]
+        preferred_order = (
+            ['作者', '内容', '发布时间']
+            + [field.get('display_name', field['name']) for field in schema['fields']]
+            + ['点赞数', '转发数', '评论数', '阅读量', '原文链接', '标注时间', '语言']
+        )
         
         final_cols = [col for col in preferred_order if col in df.columns]
         df = df[final_cols].copy()
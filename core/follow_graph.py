@@ -0,0 +1,242 @@
+"""
+follow_graph.py - 关注图分析
+
+核心职责:
+1. 从 follow_graph.db 的关注边加载内存图 (CSR 邻接数组, NumPy)
+2. 向量化计算共同关注数、加权入度
+3. 以一级账号为种子的个性化 PageRank，为二级候选账号排序
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class FollowGraph:
+    """
+    只读关注图
+
+    节点为小写 screen_name，边为 follower → followee。
+    出边按 CSR 存储 (out_indptr / out_indices)，入边另存一份转置，
+    所有指标都是对边数组的 bincount，数万节点、数十万条边的排序在一秒内完成。
+    """
+
+    def __init__(self, edges: Iterable[Tuple[str, str]]):
+        """
+        Args:
+            edges: [(follower, followee), ...]
+        """
+        self.index: Dict[str, int] = {}
+        self.display_names: Dict[str, str] = {}
+
+        def intern(name: str) -> int:
+            key = name.lower()
+            node = self.index.get(key)
+            if node is None:
+                node = self.index[key] = len(self.index)
+                self.display_names[key] = name
+            return node
+
+        ids = np.fromiter(
+            (intern(name) for pair in edges if pair[0] and pair[1] for name in pair),
+            dtype=np.int64
+        )
+        src, dst = ids[0::2], ids[1::2]
+        self.nodes: List[str] = list(self.index)
+        n = len(self.nodes)
+
+        # 出边 CSR：按 follower 排序
+        order = np.argsort(src, kind='stable')
+        self.out_indices = dst[order].astype(np.int32)
+        self.out_degree = np.bincount(src, minlength=n)
+        self.out_indptr = np.concatenate(([0], np.cumsum(self.out_degree)))
+
+        # 入边 CSR：按 followee 排序
+        order = np.argsort(dst, kind='stable')
+        self.in_indices = src[order].astype(np.int32)
+        self.in_degree = np.bincount(dst, minlength=n)
+        self.in_indptr = np.concatenate(([0], np.cumsum(self.in_degree)))
+
+    @classmethod
+    def from_store(cls, store, active_since: str = None) -> "FollowGraph":
+        """
+        从 FollowStore 加载
+
+        Args:
+            store: core.follow_store.FollowStore
+            active_since: 只保留 last_seen 不早于该时间 (ISO) 的边
+        """
+        return cls(store.get_edges(active_since=active_since))
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.out_indices)
+
+    # ==================== 内部工具 ====================
+
+    def _node_mask(self, screen_names: Iterable[str]) -> np.ndarray:
+        """screen_name 列表 → 节点布尔掩码（不在图中的忽略）"""
+        mask = np.zeros(self.num_nodes, dtype=bool)
+        ids = [self.index[name.lower()] for name in screen_names if name and name.lower() in self.index]
+        mask[ids] = True
+        return mask
+
+    def _spread(self, weights: np.ndarray) -> np.ndarray:
+        """每个 follower 把自身权重沿出边送给 followee，返回各节点收到的总量"""
+        per_edge = np.repeat(weights, self.out_degree)
+        return np.bincount(self.out_indices, weights=per_edge, minlength=self.num_nodes)
+
+    # ==================== 指标 ====================
+
+    def co_follow_counts(self, followers: Iterable[str]) -> np.ndarray:
+        """
+        共同关注数：给定账号集合中有多少个关注了每个节点
+
+        以一级账号为集合时，即"被多少个一级账号关注"。
+        """
+        return self._spread(self._node_mask(followers).astype(np.float64)).astype(np.int64)
+
+    def weighted_in_degree(self) -> np.ndarray:
+        """
+        加权入度：每条关注边的权重为 1 / 关注者的出度
+
+        关注了上千人的账号，其每次关注的信息量远低于只关注几十人的账号。
+        """
+        with np.errstate(divide='ignore'):
+            weights = np.where(self.out_degree > 0, 1.0 / self.out_degree, 0.0)
+        return self._spread(weights)
+
+    def personalized_pagerank(
+        self,
+        seeds: Iterable[str],
+        alpha: float = 0.85,
+        tol: float = 1e-8,
+        max_iter: int = 100
+    ) -> np.ndarray:
+        """
+        个性化 PageRank（幂迭代）
+
+        随机游走以 1 - alpha 的概率跳回种子账号，悬挂节点的质量同样回到种子。
+
+        Args:
+            seeds: 种子账号（一级账号），不在图中的忽略；全部缺失时退化为普通 PageRank
+            alpha: 阻尼系数
+            tol: L1 收敛阈值
+            max_iter: 最大迭代次数
+
+        Returns:
+            每个节点的得分，总和为 1
+        """
+        n = self.num_nodes
+        if n == 0:
+            return np.zeros(0)
+
+        teleport = self._node_mask(seeds).astype(np.float64)
+        if not teleport.any():
+            teleport[:] = 1.0
+        teleport /= teleport.sum()
+
+        dangling = self.out_degree == 0
+        with np.errstate(divide='ignore'):
+            inv_out = np.where(dangling, 0.0, 1.0 / np.maximum(self.out_degree, 1))
+
+        rank = teleport.copy()
+        for _ in range(max_iter):
+            new_rank = alpha * self._spread(rank * inv_out)
+            new_rank += (alpha * rank[dangling].sum() + (1 - alpha)) * teleport
+            converged = np.abs(new_rank - rank).sum() < tol
+            rank = new_rank
+            if converged:
+                break
+        return rank
+
+    # ==================== 排序 ====================
+
+    def rank_candidates(
+        self,
+        seeds: Iterable[str],
+        top_k: int = 50,
+        exclude: Optional[Iterable[str]] = None,
+        min_co_follow: int = 1
+    ) -> List[Dict]:
+        """
+        以种子账号为中心为候选账号排序
+
+        Args:
+            seeds: 种子账号（一级账号）
+            top_k: 返回数量
+            exclude: 额外排除的账号（种子账号本身总是排除）
+            min_co_follow: 至少被多少个种子账号关注
+
+        Returns:
+            [{screen_name, score, co_follow, weighted_in_degree, in_degree}, ...]，按 score 降序
+        """
+        seeds = list(seeds)
+        if self.num_nodes == 0:
+            return []
+
+        score = self.personalized_pagerank(seeds)
+        co_follow = self.co_follow_counts(seeds)
+        weighted = self.weighted_in_degree()
+
+        eligible = ~self._node_mask(seeds) & (co_follow >= min_co_follow)
+        if exclude:
+            eligible &= ~self._node_mask(exclude)
+        candidates = np.flatnonzero(eligible)
+        if len(candidates) == 0:
+            return []
+
+        # 先 argpartition 取前 k，再只对这 k 个排序
+        k = min(top_k, len(candidates))
+        top = candidates[np.argpartition(-score[candidates], k - 1)[:k]]
+        top = top[np.argsort(-score[top], kind='stable')]
+
+        return [
+            {
+                "screen_name": self.display_names.get(self.nodes[i], self.nodes[i]),
+                "score": float(score[i]),
+                "co_follow": int(co_follow[i]),
+                "weighted_in_degree": float(weighted[i]),
+                "in_degree": int(self.in_degree[i])
+            }
+            for i in top
+        ]
+
+    def followers_of(self, screen_name: str) -> List[str]:
+        """图中关注该账号的节点"""
+        i = self.index.get(screen_name.lower())
+        if i is None:
+            return []
+        return [self.nodes[j] for j in self.in_indices[self.in_indptr[i]:self.in_indptr[i + 1]]]
+
+
+# 测试代码
+if __name__ == "__main__":
+    import time
+
+    graph = FollowGraph([
+        ("karpathy", "alice"), ("karpathy", "bob"),
+        ("ylecun", "alice"), ("ylecun", "carol"),
+        ("random", "bob"), ("random", "dave"), ("random", "erin"),
+    ])
+    for row in graph.rank_candidates(["karpathy", "ylecun"], top_k=3):
+        print(row)
+    print(f"alice 的关注者: {graph.followers_of('Alice')}")
+
+    # 规模测试：500 个种子 + 5 万个候选，约 50 万条边
+    rng = np.random.default_rng(0)
+    seeds = [f"seed{i}" for i in range(500)]
+    edges = [
+        (seeds[s], f"user{t}")
+        for s, t in zip(rng.integers(0, 500, 500_000), rng.zipf(1.3, 500_000) % 50_000)
+    ]
+    start = time.time()
+    big = FollowGraph(edges)
+    loaded = time.time()
+    top = big.rank_candidates(seeds, top_k=100)
+    print(f"\n{big.num_nodes} 节点 / {big.num_edges} 条边: "
+          f"加载 {loaded - start:.2f}s，排序 {time.time() - loaded:.3f}s，第一名 {top[0]['screen_name']}")
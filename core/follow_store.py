@@ -0,0 +1,290 @@
+"""
+follow_store.py - 关注关系抓取的持久化存储
+
+核心职责:
+1. 维护 SQLite 数据库 (data/follow_graph.db)
+2. 记录每个源账号的 following 抓取检查点（游标、已抓页数、状态）
+3. 每抓完一页，页内数据与新游标在同一事务内写入，崩溃后从最后一页继续
+4. 持久化关注边 (follower → followee, first_seen, last_seen)，供 follow_graph 排序候选账号
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .connection_manager import ConnectionManager
+
+
+# 抓取状态
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+FOLLOWING_FIELDS = [
+    "screen_name", "user_id", "name", "description",
+    "followers_count", "following_count", "verified", "url"
+]
+
+
+class FollowStore:
+    """关注关系存储：抓取检查点 + 已抓取的 following 列表"""
+
+    def __init__(self, data_dir: str = None):
+        """
+        Args:
+            data_dir: 数据目录，默认为项目 data/
+        """
+        if data_dir is None:
+            data_dir = Path(__file__).parent.parent / "data"
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+
+        self.db_path = self.data_dir / "follow_graph.db"
+        self.db = ConnectionManager(self.db_path)
+
+        with self.db.transaction() as conn:
+            self._create_tables(conn)
+
+    def _create_tables(self, conn):
+        """建表"""
+        # 每个源账号一行检查点；cursor 为下一页的游标，NULL 表示从头开始
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS follow_crawl (
+                source TEXT PRIMARY KEY,
+                user_id TEXT,
+                cursor TEXT,
+                pages INTEGER DEFAULT 0,
+                fetched INTEGER DEFAULT 0,
+                status TEXT NOT NULL,
+                error TEXT,
+                started_at TEXT,
+                updated_at TEXT
+            )
+        ''')
+
+        # 已抓取的 following（部分或全部），按 (source, screen_name) 去重
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS follow_crawl_items (
+                source TEXT NOT NULL,
+                screen_name TEXT NOT NULL,
+                user_id TEXT,
+                name TEXT,
+                description TEXT,
+                followers_count INTEGER DEFAULT 0,
+                following_count INTEGER DEFAULT 0,
+                verified INTEGER DEFAULT 0,
+                url TEXT,
+                PRIMARY KEY (source, screen_name)
+            ) WITHOUT ROWID
+        ''')
+
+        # 关注边：主键按 follower 聚簇，followee 上另建索引用于入度查询
+        edges_exist = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'follow_edges'"
+        ).fetchone()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS follow_edges (
+                follower TEXT NOT NULL COLLATE NOCASE,
+                followee TEXT NOT NULL COLLATE NOCASE,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                PRIMARY KEY (follower, followee)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_edges_followee ON follow_edges(followee)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_edges_last_seen ON follow_edges(last_seen)')
+
+        if not edges_exist:
+            # 建表前已抓取的 following 补录为边
+            conn.execute('''
+                INSERT OR IGNORE INTO follow_edges (follower, followee, first_seen, last_seen)
+                SELECT i.source, i.screen_name, c.updated_at, c.updated_at
+                FROM follow_crawl_items i JOIN follow_crawl c ON c.source = i.source
+                WHERE c.updated_at IS NOT NULL
+            ''')
+
+    def close(self):
+        self.db.close()
+
+    # ==================== 检查点 ====================
+
+    def get_crawl(self, source: str) -> Optional[Dict]:
+        """读取源账号的抓取检查点"""
+        with self.db.reader() as conn:
+            row = conn.execute(
+                "SELECT * FROM follow_crawl WHERE source = ?", (source,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_crawls(self, status: str = None) -> List[Dict]:
+        """列出检查点，可按状态过滤"""
+        sql = "SELECT * FROM follow_crawl"
+        params = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        with self.db.reader() as conn:
+            return [dict(row) for row in conn.execute(sql + " ORDER BY source", params)]
+
+    def done_sources(self) -> set:
+        """已完整抓取的源账号"""
+        return {crawl["source"] for crawl in self.get_crawls(STATUS_DONE)}
+
+    def start_crawl(self, source: str, user_id: str = None) -> Dict:
+        """
+        开始或继续抓取：已有检查点时保留游标，只更新状态
+
+        Returns:
+            当前检查点
+        """
+        now = datetime.now().isoformat()
+        with self.db.transaction() as conn:
+            conn.execute('''
+                INSERT INTO follow_crawl (source, user_id, status, started_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(source) DO UPDATE SET
+                    user_id = COALESCE(excluded.user_id, user_id),
+                    status = excluded.status,
+                    error = NULL,
+                    updated_at = excluded.updated_at
+            ''', (source, user_id, STATUS_RUNNING, now, now))
+        return self.get_crawl(source)
+
+    def save_page(self, source: str, users: List[Dict], next_cursor: Optional[str]):
+        """
+        保存一页 following 并推进游标（同一事务）
+
+        Args:
+            source: 源账号
+            users: 本页用户（XScraper._following_to_info 格式）
+            next_cursor: 下一页游标
+        """
+        rows = [
+            (
+                source,
+                user["screen_name"],
+                str(user["id"]) if user.get("id") else None,
+                user.get("name"),
+                user.get("description", ""),
+                user.get("followers_count", 0) or 0,
+                user.get("following_count", 0) or 0,
+                1 if user.get("verified") else 0,
+                user.get("url")
+            )
+            for user in users
+        ]
+        now = datetime.now().isoformat()
+        with self.db.transaction() as conn:
+            if rows:
+                conn.executemany('''
+                    INSERT INTO follow_crawl_items (
+                        source, screen_name, user_id, name, description,
+                        followers_count, following_count, verified, url
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(source, screen_name) DO UPDATE SET
+                        user_id = excluded.user_id,
+                        name = excluded.name,
+                        description = excluded.description,
+                        followers_count = excluded.followers_count,
+                        following_count = excluded.following_count,
+                        verified = excluded.verified,
+                        url = excluded.url
+                ''', rows)
+                conn.executemany('''
+                    INSERT INTO follow_edges (follower, followee, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(follower, followee) DO UPDATE SET last_seen = excluded.last_seen
+                ''', [(source, row[1], now, now) for row in rows])
+            conn.execute('''
+                UPDATE follow_crawl SET
+                    cursor = ?,
+                    pages = pages + 1,
+                    fetched = (SELECT COUNT(*) FROM follow_crawl_items WHERE source = ?),
+                    updated_at = ?
+                WHERE source = ?
+            ''', (next_cursor, source, now, source))
+
+    def finish_crawl(self, source: str):
+        """标记抓取完成"""
+        self._set_status(source, STATUS_DONE)
+
+    def fail_crawl(self, source: str, error: str):
+        """标记抓取失败，游标保留，下次从断点继续"""
+        self._set_status(source, STATUS_FAILED, error)
+
+    def reset_crawl(self, source: str):
+        """清除检查点与已抓数据，下次从头抓取"""
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM follow_crawl_items WHERE source = ?", (source,))
+            conn.execute("DELETE FROM follow_crawl WHERE source = ?", (source,))
+
+    def _set_status(self, source: str, status: str, error: str = None):
+        with self.db.transaction() as conn:
+            conn.execute(
+                "UPDATE follow_crawl SET status = ?, error = ?, updated_at = ? WHERE source = ?",
+                (status, error, datetime.now().isoformat(), source)
+            )
+
+    # ==================== 读取 ====================
+
+    def get_following(self, source: str) -> List[Dict]:
+        """读取某源账号已抓取的 following"""
+        with self.db.reader() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(FOLLOWING_FIELDS)} FROM follow_crawl_items
+                WHERE source = ? ORDER BY screen_name
+            ''', (source,)).fetchall()
+        return [dict(row, verified=bool(row["verified"])) for row in rows]
+
+    def get_edges(self, active_since: str = None) -> List[tuple]:
+        """
+        读取关注边
+
+        Args:
+            active_since: 只返回 last_seen 不早于该时间 (ISO) 的边，用于排除已取关
+
+        Returns:
+            [(follower, followee), ...]
+        """
+        sql = "SELECT follower, followee FROM follow_edges"
+        params = []
+        if active_since:
+            sql += " WHERE last_seen >= ?"
+            params.append(active_since)
+        with self.db.reader() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def get_followers(self, followee: str) -> List[str]:
+        """某账号在已抓取图中的关注者"""
+        with self.db.reader() as conn:
+            rows = conn.execute(
+                "SELECT follower FROM follow_edges WHERE followee = ? ORDER BY follower", (followee,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def edge_count(self) -> int:
+        with self.db.reader() as conn:
+            return conn.execute("SELECT COUNT(*) FROM follow_edges").fetchone()[0]
+
+
+# 测试代码
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FollowStore(data_dir=tmp)
+        store.start_crawl("karpathy", user_id="33836629")
+        store.save_page("karpathy", [
+            {"id": "1", "screen_name": "alice", "name": "Alice", "url": "https://x.com/alice"},
+            {"id": "2", "screen_name": "bob", "name": "Bob", "url": "https://x.com/bob"},
+        ], next_cursor="cursor-page-2")
+
+        # 模拟崩溃后重启：从检查点游标继续
+        crawl = store.get_crawl("karpathy")
+        print(f"检查点: cursor={crawl['cursor']}, pages={crawl['pages']}, fetched={crawl['fetched']}")
+
+        store.save_page("karpathy", [{"id": "2", "screen_name": "bob", "name": "Bob"}], next_cursor=None)
+        store.finish_crawl("karpathy")
+        print(f"完成: {store.get_crawl('karpathy')['status']}, following={[u['screen_name'] for u in store.get_following('karpathy')]}")
+        print(f"关注边: {store.edge_count()} 条，bob 的关注者: {store.get_followers('BOB')}")
+        store.close()
@@ -0,0 +1,116 @@
+"""
+identity_cache.py - LLM 身份识别结果缓存
+
+核心职责:
+1. 在 SQLite (data/identity_cache.db) 中持久化 LLM 的识别结果
+2. 键为 (识别类型, 归一化查询, 账号池指纹)：账号池成员变化后旧结果自动失效
+3. 结果按 TTL 过期，过期或指纹不符的记录在启动时清理
+"""
+
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from .connection_manager import ConnectionManager
+
+
+# 默认有效期 7 天
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def normalize_query(query: str) -> str:
+    """归一化查询：小写、去首尾空白、连续空白合并为一个空格"""
+    return re.sub(r"\s+", " ", (query or "").strip().lower())
+
+
+class IdentityCache:
+    """LLM 识别结果缓存"""
+
+    def __init__(self, db_path: str = None, ttl: int = None):
+        """
+        Args:
+            db_path: 缓存数据库路径，默认为 data/identity_cache.db
+            ttl: 结果有效期（秒），默认读取 XSKILL_LLM_CACHE_TTL (7 天)
+        """
+        if db_path is None:
+            db_path = Path(__file__).parent.parent / "data" / "identity_cache.db"
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.ttl = ttl if ttl is not None else int(os.getenv("XSKILL_LLM_CACHE_TTL", str(DEFAULT_TTL)))
+        self.db = ConnectionManager(db_path, pool_size=2)
+        with self.db.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_identity (
+                    kind TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at INTEGER NOT NULL,
+                    PRIMARY KEY (kind, query, fingerprint)
+                ) WITHOUT ROWID
+            ''')
+
+    def close(self):
+        self.db.close()
+
+    def get(self, kind: str, query: str, fingerprint: str) -> Optional[Any]:
+        """
+        读取未过期的结果
+
+        Args:
+            kind: 识别类型 (identify / identify_multiple)
+            query: 用户查询（内部归一化）
+            fingerprint: 账号池指纹
+
+        Returns:
+            缓存的 LLM 结果，未命中为 None
+        """
+        with self.db.reader() as conn:
+            row = conn.execute('''
+                SELECT result FROM llm_identity
+                WHERE kind = ? AND query = ? AND fingerprint = ? AND created_at >= ?
+            ''', (kind, normalize_query(query), fingerprint, int(time.time()) - self.ttl)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, kind: str, query: str, fingerprint: str, result: Any):
+        """写入结果（同键覆盖）"""
+        with self.db.transaction() as conn:
+            conn.execute('''
+                INSERT INTO llm_identity (kind, query, fingerprint, result, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(kind, query, fingerprint) DO UPDATE SET
+                    result = excluded.result,
+                    created_at = excluded.created_at
+            ''', (kind, normalize_query(query), fingerprint,
+                  json.dumps(result, ensure_ascii=False), int(time.time())))
+
+    def purge(self, fingerprint: str = None) -> int:
+        """
+        删除过期记录；给定指纹时同时删除其他指纹（旧账号池）的记录
+
+        Returns:
+            删除条数
+        """
+        sql = "DELETE FROM llm_identity WHERE created_at < ?"
+        params = [int(time.time()) - self.ttl]
+        if fingerprint:
+            sql += " OR fingerprint != ?"
+            params.append(fingerprint)
+        with self.db.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+
+# 测试代码
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = IdentityCache(db_path=Path(tmp) / "identity_cache.db")
+        cache.put("identify", "  奥特曼 ", "fp1", {"found": True, "screen_name": "sama", "confidence": 0.95})
+        print(f"命中: {cache.get('identify', '奥特曼', 'fp1')}")
+        print(f"账号池变化后: {cache.get('identify', '奥特曼', 'fp2')}")
+        print(f"清理旧指纹: {cache.purge('fp2')} 条")
+        cache.close()
@@ -0,0 +1,209 @@
+"""
+identity_index.py - 身份识别索引
+
+核心职责:
+1. 别名表 (data/aliases.json)：用户自定义称呼 → screen_name，如 "马斯克" → "elonmusk"
+2. 精确匹配：小写 screen_name / 显示名 / 别名 → 账号，O(1)
+3. 模糊匹配：字符 n-gram 倒排预筛 (NumPy bincount)，只对得分最高的少量候选
+   调用 thefuzz 批量打分，数万账号下仍在毫秒级
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from thefuzz import fuzz, process
+
+
+NGRAM_SIZE = 3
+# 预筛后交给 thefuzz 精确打分的候选数
+FUZZY_SHORTLIST = 64
+
+
+def char_ngrams(text: str, n: int = NGRAM_SIZE) -> set:
+    """字符 n-gram（两端补空格，短字符串也能产生 n-gram）"""
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class AliasTable:
+    """别名表：{别名: screen_name}，文件修改后自动重新加载"""
+
+    def __init__(self, path: str = None):
+        """
+        Args:
+            path: 别名文件路径，默认为 data/aliases.json
+        """
+        if path is None:
+            path = Path(__file__).parent.parent / "data" / "aliases.json"
+        self.path = Path(path)
+        self._aliases: Dict[str, str] = {}
+        self._mtime = None
+
+    @property
+    def mtime(self) -> Optional[float]:
+        return self.path.stat().st_mtime if self.path.exists() else None
+
+    def load(self) -> Dict[str, str]:
+        """返回别名表（键为小写别名），文件未变化时复用缓存"""
+        mtime = self.mtime
+        if mtime != self._mtime:
+            aliases = {}
+            if mtime is not None:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        raw = json.load(f)
+                    aliases = {
+                        alias.strip().lower(): handle.strip().lstrip('@')
+                        for alias, handle in raw.items()
+                        if isinstance(alias, str) and isinstance(handle, str) and alias.strip()
+                    }
+                except (json.JSONDecodeError, OSError, AttributeError) as e:
+                    print(f"⚠️ 别名文件读取失败，已忽略: {e}")
+            self._aliases, self._mtime = aliases, mtime
+        return self._aliases
+
+    def add(self, alias: str, screen_name: str):
+        """添加别名并原子写回文件（保留文件中已有的写法）"""
+        raw = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    raw = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                raw = {}
+        raw[alias.strip()] = screen_name.lstrip('@')
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(raw, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class IdentityIndex:
+    """一次构建、只读使用的身份索引"""
+
+    def __init__(self, accounts: List[Dict], aliases: Dict[str, str] = None):
+        """
+        Args:
+            accounts: 账号列表（旧 JSON 格式）
+            aliases: {小写别名: screen_name}
+        """
+        self.accounts = accounts
+        self.by_handle: Dict[str, Dict] = {}
+        self.by_name: Dict[str, Dict] = {}
+        self.by_alias: Dict[str, Dict] = {}
+
+        for acc in accounts:
+            self.by_handle.setdefault((acc.get('screen_name') or '').lower(), acc)
+            self.by_name.setdefault((acc.get('name') or '').lower(), acc)
+        for alias, handle in (aliases or {}).items():
+            account = self.by_handle.get(handle.lower())
+            if account:
+                self.by_alias[alias] = account
+
+        # 模糊匹配候选：显示名、screen_name、别名，与旧实现的候选顺序一致
+        self._choices: List[str] = []
+        self._owners: List[Dict] = []
+        for acc in accounts:
+            for text in (acc.get('name', ''), acc.get('screen_name', '')):
+                self._choices.append(text or '')
+                self._owners.append(acc)
+        for alias, account in self.by_alias.items():
+            self._choices.append(alias)
+            self._owners.append(account)
+
+        # n-gram 倒排：gram → 候选序号数组
+        postings: Dict[str, List[int]] = {}
+        self._gram_counts = np.zeros(len(self._choices), dtype=np.float64)
+        for i, text in enumerate(self._choices):
+            grams = char_ngrams(text.lower())
+            self._gram_counts[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def exact(self, query: str) -> Optional[Dict]:
+        """screen_name（可带 @）、显示名、别名的精确匹配（不区分大小写）"""
+        query_lower = query.lower().strip()
+        return (
+            self.by_handle.get(query_lower.lstrip('@'))
+            or self.by_name.get(query_lower)
+            or self.by_alias.get(query_lower)
+        )
+
+    def _shortlist(self, query: str) -> np.ndarray:
+        """按 n-gram Dice 系数预筛候选，返回候选序号（得分从高到低）"""
+        grams = char_ngrams(query)
+        hits = [self._postings[g] for g in grams if g in self._postings]
+        if not hits:
+            return np.array([], dtype=np.int64)
+
+        overlap = np.bincount(np.concatenate(hits), minlength=len(self._choices))
+        candidates = np.flatnonzero(overlap)
+        dice = 2 * overlap[candidates] / (len(grams) + self._gram_counts[candidates])
+        if len(candidates) > FUZZY_SHORTLIST:
+            top = np.argpartition(-dice, FUZZY_SHORTLIST - 1)[:FUZZY_SHORTLIST]
+            candidates, dice = candidates[top], dice[top]
+        return candidates[np.lexsort((candidates, -dice))]
+
+    def fuzzy(self, query: str) -> Tuple[Optional[Dict], int]:
+        """
+        模糊匹配
+
+        Returns:
+            (账号, 相似度 0-100)；没有候选时为 (None, 0)
+        """
+        query_lower = query.lower().strip()
+        if not query_lower or not self._choices:
+            return None, 0
+
+        shortlist = self._shortlist(query_lower)
+        if len(shortlist) == 0:
+            return None, 0
+
+        # 以序号为键批量打分，同分时保留序号最小者（与旧实现一致）
+        choices = {int(i): self._choices[i] for i in sorted(shortlist)}
+        best = process.extractOne(query_lower, choices, scorer=fuzz.ratio)
+        if not best:
+            return None, 0
+        _, score, idx = best
+        return self._owners[idx], score
+
+
+# 测试代码
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as tmp:
+        table = AliasTable(Path(tmp) / "aliases.json")
+        table.add("马斯克", "@elonmusk")
+        print(f"别名表: {table.load()}")
+
+        accounts = [
+            {"name": f"User Number {i}", "screen_name": f"user_{i}"} for i in range(50_000)
+        ] + [
+            {"name": "Elon Musk", "screen_name": "elonmusk"},
+            {"name": "Andrej Karpathy", "screen_name": "karpathy"},
+        ]
+        start = time.time()
+        index = IdentityIndex(accounts, table.load())
+        print(f"构建索引: {time.time() - start:.2f}s，{len(index)} 个账号")
+
+        for query in ["马斯克", "@ElonMusk", "Andrej Karpathy", "karpaty", "elon mask"]:
+            t = time.perf_counter()
+            account = index.exact(query)
+            score = 100
+            if not account:
+                account, score = index.fuzzy(query)
+            print(f"{query!r} → @{account['screen_name'] if account else None} "
+                  f"({score}) {(time.perf_counter() - t) * 1000:.2f} ms")
@@ -0,0 +1,434 @@
+"""
+llm_client.py - 共享的 OpenRouter LLM 客户端
+
+核心职责:
+1. 全进程共用一个 httpx 连接池 (keep-alive)，不再每次调用都新建 TLS 连接；
+   异步连接池按事件循环各建一份，asyncio.run() 结束时自动关闭
+2. 异步接口 chat() 不阻塞事件循环，LLM 调用可与抓取、与其他 LLM 调用并行
+3. 并发上限 (XSKILL_LLM_CONCURRENCY)，429 / 5xx / 网络错误按带抖动的指数退避重试，
+   优先遵守服务端的 Retry-After
+4. 失败统一抛出 LLMError（含 HTTP 状态码与是否可重试）
+5. 同步接口 chat_sync() 供 QueryEngine 等同步调用方使用，同样复用连接池
+6. AdaptiveLimiter：按 429 与延迟做 AIMD 自适应并发，供批量调用方（如批量标注）使用
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple, Union
+
+import httpx
+
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# 可重试的 HTTP 状态码
+RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# 退避基数与上限（秒）
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+class LLMError(Exception):
+    """LLM 调用失败"""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: int = None,
+        retryable: bool = False,
+        retry_after: float = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        # 服务端 Retry-After 头（秒），没有时为 None
+        self.retry_after = retry_after
+
+
+async def _close_on_loop_shutdown(client: httpx.AsyncClient):
+    """
+    守护用异步生成器：启动后挂起，事件循环结束时关闭连接池
+
+    asyncio.run() 在关闭循环之前会对所有未结束的异步生成器调用 aclose()
+    (loop.shutdown_asyncgens)，此时循环仍可用，finally 中可以正常 await。
+    """
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """第 attempt 次重试（从 0 起）前的等待秒数：Retry-After 优先，否则为带抖动的指数退避"""
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX * 2)
+    return random.uniform(0.5, 1.0) * min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+
+
+class LLMClient:
+    """OpenRouter chat completions 客户端（一个 API Key 一个实例，见 get_llm_client）"""
+
+    def __init__(
+        self,
+        api_key: str = None,
+        api_base: str = OPENROUTER_URL,
+        concurrency: int = None,
+        max_retries: int = None,
+        timeout: float = 120
+    ):
+        """
+        Args:
+            api_key: OpenRouter API Key，默认读取 OPENROUTER_API_KEY
+            api_base: chat completions 接口地址
+            concurrency: 同时进行的请求数上限，默认读取 XSKILL_LLM_CONCURRENCY (4)
+            max_retries: 可重试错误的最大重试次数，默认读取 XSKILL_LLM_MAX_RETRIES (3)
+            timeout: 默认单次请求超时（秒）
+        """
+        self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
+        self.api_base = api_base
+        self.concurrency = max(1, concurrency or int(os.getenv("XSKILL_LLM_CONCURRENCY", "4")))
+        self.max_retries = (
+            max_retries if max_retries is not None
+            else int(os.getenv("XSKILL_LLM_MAX_RETRIES", "3"))
+        )
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=self.concurrency * 2,
+            max_keepalive_connections=self.concurrency
+        )
+
+        # 异步连接池与信号量绑定在创建它们的事件循环上，每个循环一份：
+        # 循环 → (连接池, 信号量, 关闭守护)，循环结束时由守护关闭连接池
+        self._async_pools = weakref.WeakKeyDictionary()
+
+        self._sync_client: Optional[httpx.Client] = None
+        self._sync_semaphore = threading.BoundedSemaphore(self.concurrency)
+        self._sync_lock = threading.Lock()
+
+    def _headers(self, title: str) -> Dict[str, str]:
+        if not self.api_key:
+            raise LLMError("未配置 OPENROUTER_API_KEY")
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://github.com/xskill",
+            "X-Title": title
+        }
+
+    @staticmethod
+    def _payload(
+        prompt: Union[str, List[Dict]], model: str, temperature: float, max_tokens: int
+    ) -> Dict:
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        return {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+
+    @staticmethod
+    def _parse(response: httpx.Response) -> str:
+        """解析响应，失败时抛出 LLMError"""
+        status = response.status_code
+        if status >= 400:
+            detail = response.text[:200]
+            try:
+                retry_after = float(response.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                retry_after = None
+            raise LLMError(
+                f"HTTP {status}: {detail}", status_code=status,
+                retryable=status in RETRY_STATUS, retry_after=retry_after
+            )
+        try:
+            result = response.json()
+        except ValueError:
+            raise LLMError(f"响应不是合法 JSON: {response.text[:200]}", status_code=status)
+
+        # OpenRouter 在上游模型出错时也可能返回 200 + error 字段
+        if result.get('error'):
+            error = result['error']
+            code = error.get('code') if isinstance(error, dict) else None
+            code = code if isinstance(code, int) else None
+            message = error.get('message', error) if isinstance(error, dict) else error
+            raise LLMError(
+                f"上游错误: {message}", status_code=code, retryable=code in RETRY_STATUS
+            )
+        try:
+            return result['choices'][0]['message']['content'] or ""
+        except (KeyError, IndexError, TypeError):
+            raise LLMError(f"响应缺少 choices: {str(result)[:200]}", status_code=status)
+
+    async def _async_state(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """当前事件循环上的 (连接池, 信号量)，首次使用时创建"""
+        loop = asyncio.get_running_loop()
+        state = self._async_pools.get(loop)
+        if state is None or state[0].is_closed:
+            # 清理已结束循环的记录（信号量引用着循环，弱引用键不会自动释放）
+            for old in [old for old in self._async_pools if old.is_closed()]:
+                del self._async_pools[old]
+            client = httpx.AsyncClient(limits=self.limits)
+            guard = _close_on_loop_shutdown(client)
+            await guard.__anext__()
+            state = (client, asyncio.Semaphore(self.concurrency), guard)
+            self._async_pools[loop] = state
+        return state[0], state[1]
+
+    def _get_sync_client(self) -> httpx.Client:
+        with self._sync_lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(limits=self.limits)
+            return self._sync_client
+
+    async def chat(
+        self,
+        prompt: Union[str, List[Dict]],
+        model: str,
+        temperature: float = 0.3,
+        max_tokens: int = 2000,
+        timeout: float = None,
+        title: str = "XSkill",
+        max_retries: int = None
+    ) -> str:
+        """
+        异步调用 chat completions
+
+        Args:
+            prompt: 用户消息文本，或完整的 messages 列表
+            model: 模型名
+            temperature / max_tokens: 采样参数
+            timeout: 单次请求超时（秒），默认使用实例配置
+            title: X-Title 请求头（OpenRouter 后台按此区分来源）
+            max_retries: 覆盖实例的最大重试次数；自行重试的调用方传 0，
+                每次调用只发一个请求，429 等错误直接以 LLMError 交给调用方
+
+        Returns:
+            模型回复文本
+
+        Raises:
+            LLMError: 不可重试的错误，或重试次数用尽
+        """
+        headers = self._headers(title)
+        payload = self._payload(prompt, model, temperature, max_tokens)
+        retries = self.max_retries if max_retries is None else max_retries
+        client, semaphore = await self._async_state()
+
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    response = await client.post(
+                        self.api_base, headers=headers, json=payload,
+                        timeout=timeout or self.timeout
+                    )
+                return self._parse(response)
+            except httpx.HTTPError as e:
+                error = LLMError(f"网络错误: {type(e).__name__} {e}", retryable=True)
+            except LLMError as e:
+                error = e
+
+            if not error.retryable or attempt >= retries:
+                raise error
+            wait = backoff_delay(attempt, error.retry_after)
+            print(f"⏳ LLM 请求失败 ({error})，{wait:.1f}s 后重试 ({attempt + 1}/{retries})")
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    def chat_sync(
+        self,
+        prompt: Union[str, List[Dict]],
+        model: str,
+        temperature: float = 0.3,
+        max_tokens: int = 2000,
+        timeout: float = None,
+        title: str = "XSkill",
+        max_retries: int = None
+    ) -> str:
+        """同步版 chat()，参数与异常同上"""
+        headers = self._headers(title)
+        payload = self._payload(prompt, model, temperature, max_tokens)
+        retries = self.max_retries if max_retries is None else max_retries
+        client = self._get_sync_client()
+
+        attempt = 0
+        while True:
+            try:
+                with self._sync_semaphore:
+                    response = client.post(
+                        self.api_base, headers=headers, json=payload,
+                        timeout=timeout or self.timeout
+                    )
+                return self._parse(response)
+            except httpx.HTTPError as e:
+                error = LLMError(f"网络错误: {type(e).__name__} {e}", retryable=True)
+            except LLMError as e:
+                error = e
+
+            if not error.retryable or attempt >= retries:
+                raise error
+            wait = backoff_delay(attempt, error.retry_after)
+            print(f"⏳ LLM 请求失败 ({error})，{wait:.1f}s 后重试 ({attempt + 1}/{retries})")
+            time.sleep(wait)
+            attempt += 1
+
+    async def aclose(self):
+        """
+        立即关闭当前事件循环上的连接池与同步连接池
+
+        asyncio.run() 结束时会自动关闭该循环的连接池，只有长期运行的循环
+        需要提前释放连接时才需调用。
+        """
+        state = self._async_pools.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state[2].aclose()
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发控制
+
+    每个请求成功且未被限流时并发上限加 1/limit（约每一轮往返加 1）；
+    遇到 429 时减半，延迟超过平滑基线的 latency_factor 倍时乘 0.75。
+    同一轮（上限调整之前发出）的请求只触发一次下调，避免一次限流被重复惩罚。
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial: int = None,
+        min_limit: int = 1,
+        latency_factor: float = 2.0
+    ):
+        """
+        Args:
+            max_limit: 并发上限的最大值
+            initial: 初始并发上限，默认 min(2, max_limit)
+            min_limit: 并发上限的最小值
+            latency_factor: 延迟超过基线多少倍视为拥塞
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial or 2)))
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.peak = 0
+        self.base_latency: Optional[float] = None
+        self._epoch = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> Tuple[int, float]:
+        """等待空闲名额，返回凭据 (轮次, 开始时间)，交给 release()"""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return self._epoch, time.monotonic()
+
+    async def release(self, ticket: Tuple[int, float], throttled: bool = False, ok: bool = True):
+        """
+        归还名额并调整并发上限
+
+        Args:
+            ticket: acquire() 返回的凭据
+            throttled: 本次请求期间是否遇到 429
+            ok: 请求是否成功（失败但非限流时不调整上限）
+        """
+        epoch, start = ticket
+        latency = time.monotonic() - start
+        async with self._cond:
+            self.in_flight -= 1
+            slow = (
+                ok and not throttled and self.base_latency is not None
+                and latency > self.latency_factor * self.base_latency
+            )
+            if (throttled or slow) and epoch == self._epoch:
+                self.limit = max(self.min_limit, self.limit * (0.5 if throttled else 0.75))
+                self._epoch += 1
+            elif ok and not throttled and not slow:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            # 延迟基线：成功请求延迟的指数平滑
+            if ok and not throttled:
+                self.base_latency = (
+                    latency if self.base_latency is None
+                    else 0.8 * self.base_latency + 0.2 * latency
+                )
+            self._cond.notify_all()
+
+
+_clients: Dict[Optional[str], LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(api_key: str = None) -> LLMClient:
+    """
+    获取共享客户端（同一 API Key 全进程只有一个实例、一个连接池）
+
+    Args:
+        api_key: OpenRouter API Key，默认读取 OPENROUTER_API_KEY
+    """
+    api_key = api_key or os.getenv("OPENROUTER_API_KEY")
+    with _clients_lock:
+        if api_key not in _clients:
+            _clients[api_key] = LLMClient(api_key=api_key)
+        return _clients[api_key]
+
+
+# 测试代码
+if __name__ == "__main__":
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    calls = {"n": 0}
+    calls_lock = threading.Lock()
+
+    class FakeOpenRouter(BaseHTTPRequestHandler):
+        """本地模拟接口：每 3 个请求返回一次 429，其余延迟 0.2s 后成功"""
+
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_POST(self):
+            with calls_lock:
+                calls["n"] += 1
+                n = calls["n"]
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if n % 3 == 0:
+                self.send_response(429)
+                self.send_header("Retry-After", "0.1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            time.sleep(0.2)
+            reply = json.dumps({"choices": [{"message": {"content": body["messages"][0]["content"].upper()}}]})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply.encode())))
+            self.end_headers()
+            self.wfile.write(reply.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenRouter)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = LLMClient(api_key="test", api_base=f"http://127.0.0.1:{server.server_port}", concurrency=4)
+
+    async def demo():
+        start = time.time()
+        replies = await asyncio.gather(*(client.chat(f"hello {i}", model="test") for i in range(8)))
+        print(f"异步 8 个请求 (并发 4): {time.time() - start:.2f}s → {replies[:2]}...")
+        await client.aclose()
+
+    asyncio.run(demo())
+    print(f"同步调用: {client.chat_sync('sync call', model='test')}")
+    print(f"服务端共收到 {calls['n']} 个请求（含 429 重试）")
+    server.shutdown()
@@ -2,23 +2,35 @@
 query_engine.py - 三级身份识别路由
 
 核心职责:
-1. 精确匹配 - accounts.json 直接查询
-2. 模糊匹配 - 使用 thefuzz 库进行字符串相似度计算
-3. LLM 语义判定 - 调用 OpenRouter API 解析用户意图
+1. 精确匹配 - screen_name / 显示名 / 别名 (data/aliases.json) 的预建索引
+2. 模糊匹配 - n-gram 预筛 + thefuzz 批量计算字符串相似度
+3. 本地检索 - 名称与简介的 TF-IDF 索引，描述性查询直接命中，否则挑出 top-k 候选
+4. LLM 语义判定 - 只把 top-k 候选交给 OpenRouter API，结果持久缓存，
+   高置信度的答案写入别名表，之后直接精确命中
 
 支持从自然语言中识别博主身份和时间区间
 """
 
+import json
 import os
 import re
 from datetime import datetime, timedelta
 from typing import Dict, Optional, Tuple, List
 from pathlib import Path
 
-import requests
-from thefuzz import fuzz, process
-
 from .discoverer import AccountDiscoverer
+from .identity_index import AliasTable, IdentityIndex
+from .identity_cache import IdentityCache, normalize_query
+from .llm_client import get_llm_client
+from .semantic_index import SemanticIndex
+
+
+# 本地检索直接作答的条件：最高分不低于阈值，且明显高于第二名
+SEMANTIC_THRESHOLD = 0.3
+SEMANTIC_MARGIN = 1.5
+# 交给 LLM 的候选数
+LLM_CANDIDATES = 50
+LLM_CANDIDATES_MULTIPLE = 100
 
 
 class QueryEngine:
@@ -28,16 +40,52 @@ class QueryEngine:
         self, 
         discoverer: AccountDiscoverer = None,
         openrouter_api_key: str = None,
-        fuzzy_threshold: int = 70
+        fuzzy_threshold: int = 70,
+        alias_path: str = None,
+        identity_cache: IdentityCache = None,
+        alias_promote_confidence: float = 0.9
     ):
         self.discoverer = discoverer or AccountDiscoverer()
         self.fuzzy_threshold = fuzzy_threshold
         
+        # 身份索引：账号池或别名表变化时重建
+        self.aliases = AliasTable(alias_path)
+        self._identity_index: Optional[IdentityIndex] = None
+        self._identity_source = None
+        self._semantic_index: Optional[SemanticIndex] = None
+        
+        # LLM 识别缓存；置信度不低于阈值的单人识别结果写入别名表
+        # 启动时清理过期记录与旧账号池指纹下的记录（账号池索引首次查询本就要构建）
+        self.identity_cache = identity_cache or IdentityCache()
+        self.identity_cache.purge(self.discoverer.index.fingerprint)
+        self.alias_promote_confidence = alias_promote_confidence
+        
         # OpenRouter API 配置
         self.api_key = openrouter_api_key or os.getenv("OPENROUTER_API_KEY")
-        self.api_base = "https://openrouter.ai/api/v1/chat/completions"
+        self.llm = get_llm_client(self.api_key)
         self.model = "anthropic/claude-3-haiku"  # 默认使用 Haiku，性价比高
     
+    @property
+    def identity_index(self) -> IdentityIndex:
+        """身份索引（账号池内存索引或别名文件变化时重建）"""
+        account_index = self.discoverer.index
+        aliases = self.aliases.load()
+        source = (account_index, self.aliases.mtime)
+        if (self._identity_index is None
+                or source[0] is not self._identity_source[0]
+                or source[1] != self._identity_source[1]):
+            self._identity_index = IdentityIndex(account_index.accounts, aliases)
+            self._identity_source = source
+        return self._identity_index
+    
+    @property
+    def semantic_index(self) -> SemanticIndex:
+        """本地检索索引（账号池内存索引重建时随之重建，首次使用时构建）"""
+        account_index = self.discoverer.index
+        if self._semantic_index is None or self._semantic_index.accounts is not account_index.accounts:
+            self._semantic_index = SemanticIndex(account_index)
+        return self._semantic_index
+    
     def identify(self, query: str) -> Dict:
         """
         三级递进式身份识别
@@ -47,16 +95,16 @@ class QueryEngine:
             
         Returns:
             {
-                "status": "found" | "fuzzy_match" | "llm_identified" | "new_account" | "not_found",
+                "status": "found" | "fuzzy_match" | "semantic_match" | "llm_identified" | "new_account" | "not_found",
                 "handle": str or None,
                 "account": dict or None,
                 "confidence": float,
                 "message": str
             }
         """
-        accounts = self.discoverer.get_all_accounts()
+        index = self.identity_index
         
-        if not accounts:
+        if not len(index):
             return {
                 "status": "not_found",
                 "handle": None,
@@ -66,7 +114,7 @@ class QueryEngine:
             }
         
         # Level 1: 精确匹配
-        result = self._exact_match(query, accounts)
+        result = self._exact_match(query)
         if result:
             return {
                 "status": "found",
@@ -77,7 +125,7 @@ class QueryEngine:
             }
         
         # Level 2: 模糊匹配
-        result, score = self._fuzzy_match(query, accounts)
+        result, score = self._fuzzy_match(query)
         if result and score >= self.fuzzy_threshold:
             return {
                 "status": "fuzzy_match",
@@ -87,12 +135,24 @@ class QueryEngine:
                 "message": f"模糊匹配到: @{result['screen_name']} (相似度: {score}%)"
             }
         
-        # Level 3: LLM 语义判定
+        # Level 3: 本地检索（名称 + 简介）
+        hits = self.semantic_index.search(query, top_k=LLM_CANDIDATES)
+        if hits and hits[0][1] >= SEMANTIC_THRESHOLD and (
+            len(hits) == 1 or hits[0][1] >= SEMANTIC_MARGIN * hits[1][1]
+        ):
+            return self._semantic_result(*hits[0])
+        
+        # Level 4: LLM 语义判定（候选为检索 top-k，无命中时退回账号池前 50 个）
         if self.api_key:
-            llm_result = self._llm_identify(query, accounts)
+            candidates = [acc for acc, _ in hits] or index.accounts
+            llm_result = self._llm_identify(query, candidates)
             if llm_result:
                 return llm_result
         
+        # LLM 不可用时，检索结果达到阈值也直接采用
+        if hits and hits[0][1] >= SEMANTIC_THRESHOLD:
+            return self._semantic_result(*hits[0])
+        
         # 未找到 - 可能是新账号
         return {
             "status": "new_account",
@@ -102,51 +162,67 @@ class QueryEngine:
             "message": f"未在名单中找到，这可能是一个新账号"
         }
     
-    def _exact_match(self, query: str, accounts: List[Dict]) -> Optional[Dict]:
-        """精确匹配"""
-        query_lower = query.lower().strip()
-        query_clean = query_lower.lstrip('@')
-        
-        for acc in accounts:
-            # 匹配 screen_name
-            if acc.get('screen_name', '').lower() == query_clean:
-                return acc
-            # 匹配 name
-            if acc.get('name', '').lower() == query_lower:
-                return acc
-        
-        return None
+    def _semantic_result(self, account: Dict, score: float) -> Dict:
+        return {
+            "status": "semantic_match",
+            "handle": account["screen_name"],
+            "account": account,
+            "confidence": round(score, 3),
+            "message": f"根据名称与简介检索到: @{account['screen_name']} (相似度: {score:.0%})"
+        }
+    
+    def _exact_match(self, query: str) -> Optional[Dict]:
+        """精确匹配（screen_name / 显示名 / 别名）"""
+        return self.identity_index.exact(query)
     
-    def _fuzzy_match(self, query: str, accounts: List[Dict]) -> Tuple[Optional[Dict], int]:
+    def _fuzzy_match(self, query: str) -> Tuple[Optional[Dict], int]:
         """模糊匹配"""
-        query_lower = query.lower().strip()
-        
-        # 构建候选列表
-        candidates = []
-        for acc in accounts:
-            candidates.append((acc.get('name', ''), acc))
-            candidates.append((acc.get('screen_name', ''), acc))
-        
-        if not candidates:
-            return None, 0
+        return self.identity_index.fuzzy(query)
+    
+    def _llm_identify(self, query: str, accounts: List[Dict]) -> Optional[Dict]:
+        """使用 OpenRouter LLM 进行语义识别（结果按账号池指纹缓存）"""
+        fingerprint = self.discoverer.index.fingerprint
+        llm_result = self.identity_cache.get("identify", query, fingerprint)
+        if llm_result is not None:
+            print(f"💾 命中 LLM 识别缓存: {query}")
+        else:
+            llm_result = self._request_llm_identify(query, accounts)
+            if not isinstance(llm_result, dict):
+                return None
+            self.identity_cache.put("identify", query, fingerprint, llm_result)
         
-        # 使用 thefuzz 进行匹配
-        names = [c[0] for c in candidates]
-        best_match = process.extractOne(query_lower, names, scorer=fuzz.ratio)
+        if llm_result.get('found'):
+            screen_name = llm_result.get('screen_name')
+            account = self.discoverer.get_account_by_handle(screen_name) if screen_name else None
+            if account:
+                confidence = llm_result.get('confidence', 0.8)
+                self._promote_alias(query, account, confidence)
+                return {
+                    "status": "llm_identified",
+                    "handle": screen_name,
+                    "account": account,
+                    "confidence": confidence,
+                    "message": f"LLM 识别为: @{screen_name}"
+                }
         
-        if best_match:
-            matched_name, score, idx = best_match[0], best_match[1], names.index(best_match[0])
-            return candidates[idx][1], score
+        if llm_result.get('is_new_account'):
+            return {
+                "status": "new_account",
+                "handle": llm_result.get('guessed_handle'),
+                "account": None,
+                "confidence": 0.5,
+                "message": "LLM 判断这是一个名单外的新账号"
+            }
         
-        return None, 0
+        return None
     
-    def _llm_identify(self, query: str, accounts: List[Dict]) -> Optional[Dict]:
-        """使用 OpenRouter LLM 进行语义识别"""
+    def _request_llm_identify(self, query: str, accounts: List[Dict]) -> Optional[Dict]:
+        """请求 LLM 识别单个身份，返回解析后的 JSON，失败返回 None"""
         
         # 构建账号列表描述
         account_list = "\n".join([
             f"- {acc.get('name', 'Unknown')} (@{acc.get('screen_name', '')}): {acc.get('description', '')[:100]}"
-            for acc in accounts[:50]  # 限制数量避免 token 过多
+            for acc in accounts[:LLM_CANDIDATES]  # 限制数量避免 token 过多
         ])
         
         prompt = f"""你是一个身份识别助手。用户输入了一个查询词，请判断它指的是下面名单中的哪个人。
@@ -164,55 +240,35 @@ class QueryEngine:
 只回复 JSON，不要其他内容。"""
 
         try:
-            response = requests.post(
-                self.api_base,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.1,
-                    "max_tokens": 200
-                },
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            content = result['choices'][0]['message']['content'].strip()
+            # 交互式查询，最多重试一次，避免用户久等
+            content = self.llm.chat_sync(
+                prompt,
+                model=self.model,
+                temperature=0.1,
+                max_tokens=200,
+                timeout=30,
+                title="XSkill Query Engine",
+                max_retries=1
+            ).strip()
             
             # 解析 LLM 返回的 JSON
-            import json
-            llm_result = json.loads(content)
-            
-            if llm_result.get('found'):
-                screen_name = llm_result.get('screen_name')
-                account = self.discoverer.get_account_by_handle(screen_name)
-                if account:
-                    return {
-                        "status": "llm_identified",
-                        "handle": screen_name,
-                        "account": account,
-                        "confidence": llm_result.get('confidence', 0.8),
-                        "message": f"LLM 识别为: @{screen_name}"
-                    }
-            
-            if llm_result.get('is_new_account'):
-                return {
-                    "status": "new_account",
-                    "handle": llm_result.get('guessed_handle'),
-                    "account": None,
-                    "confidence": 0.5,
-                    "message": "LLM 判断这是一个名单外的新账号"
-                }
-                
+            return json.loads(content)
         except Exception as e:
             print(f"⚠️ LLM 识别失败: {e}")
         
         return None
     
+    def _promote_alias(self, query: str, account: Dict, confidence: float):
+        """高置信度的 LLM 识别结果写入别名表，下次直接精确匹配"""
+        alias = normalize_query(query).lstrip('@')
+        if (confidence < self.alias_promote_confidence
+                or not alias
+                or alias == account['screen_name'].lower()
+                or alias in self.aliases.load()):
+            return
+        self.aliases.add(query.strip(), account['screen_name'])
+        print(f"📌 已将 \"{query.strip()}\" 记为 @{account['screen_name']} 的别名")
+    
     def _guess_handle(self, query: str) -> Optional[str]:
         """尝试从查询中猜测 handle"""
         # 移除 @ 符号
@@ -330,7 +386,7 @@ class QueryEngine:
             
             for name in potential_names:
                 result = self.identify(name)
-                if result['status'] in ['found', 'fuzzy_match', 'llm_identified']:
+                if result['status'] in ['found', 'fuzzy_match', 'semantic_match', 'llm_identified']:
                     handles.append(result['handle'])
                 else:
                     failed.append(name)
@@ -359,7 +415,7 @@ class QueryEngine:
         
         # 单个用户
         result = self.identify(query)
-        if result['status'] in ['found', 'fuzzy_match', 'llm_identified']:
+        if result['status'] in ['found', 'fuzzy_match', 'semantic_match', 'llm_identified']:
             return {
                 "mode": "single",
                 "handles": [result['handle']],
@@ -373,11 +429,28 @@ class QueryEngine:
             }
 
     def _llm_identify_multiple(self, query: str) -> List[str]:
-        """使用 LLM 从查询中提取所有匹配的 handle"""
-        accounts = self.discoverer.get_all_accounts()
+        """使用 LLM 从查询中提取所有匹配的 handle（结果按账号池指纹缓存）"""
+        fingerprint = self.discoverer.index.fingerprint
+        handles = self.identity_cache.get("identify_multiple", query, fingerprint)
+        if handles is not None:
+            print(f"💾 命中 LLM 多用户识别缓存: {query}")
+        else:
+            handles = self._request_llm_identify_multiple(query)
+            if not isinstance(handles, list):
+                return []
+            self.identity_cache.put("identify_multiple", query, fingerprint, handles)
+        
+        # 验证 handle 是否真的存在于名单中
+        return [h for h in handles if isinstance(h, str) and self.discoverer.get_account_by_handle(h)]
+    
+    def _request_llm_identify_multiple(self, query: str) -> Optional[list]:
+        """请求 LLM 提取查询中的所有 handle，失败返回 None"""
+        # 候选为本地检索 top-k，无命中时退回账号池前 100 个
+        hits = self.semantic_index.search(query, top_k=LLM_CANDIDATES_MULTIPLE)
+        accounts = [acc for acc, _ in hits] or self.discoverer.get_all_accounts()
         account_list = "\n".join([
             f"- {acc.get('name', 'Unknown')} (@{acc.get('screen_name', '')}): {acc.get('description', '')[:60]}"
-            for acc in accounts[:100]
+            for acc in accounts[:LLM_CANDIDATES_MULTIPLE]
         ])
         
         prompt = f"""你是一个推特账号识别专家。请从用户查询中提取出所有正在被提及的博主。
@@ -393,28 +466,19 @@ class QueryEngine:
 不要输出任何解释说明。"""
 
         try:
-            response = requests.post(
-                self.api_base,
-                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.1,
-                    "max_tokens": 300
-                },
-                timeout=30
-            )
-            response.raise_for_status()
-            content = response.json()['choices'][0]['message']['content'].strip()
-            import json
-            handles = json.loads(content)
-            if isinstance(handles, list):
-                # 验证 handle 是否真的存在于名单中
-                valid_handles = [h for h in handles if self.discoverer.get_account_by_handle(h)]
-                return valid_handles
+            content = self.llm.chat_sync(
+                prompt,
+                model=self.model,
+                temperature=0.1,
+                max_tokens=300,
+                timeout=30,
+                title="XSkill Query Engine",
+                max_retries=1
+            ).strip()
+            return json.loads(content)
         except Exception as e:
             print(f"⚠️ LLM 多用户识别失败: {e}")
-        return []
+        return None
 
 
 # ==================== 测试代码 ====================
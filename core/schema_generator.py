@@ -12,7 +12,7 @@ import json
 import re
 from typing import Dict, Optional
 
-import requests
+from core.llm_client import LLMError, get_llm_client
 
 
 class SchemaGenerator:
@@ -24,7 +24,7 @@ class SchemaGenerator:
         model: str = "google/gemini-2.5-flash-preview-09-2025"
     ):
         self.api_key = openrouter_api_key or os.getenv("OPENROUTER_API_KEY")
-        self.api_base = "https://openrouter.ai/api/v1/chat/completions"
+        self.llm = get_llm_client(self.api_key)
         self.model = model
     
     async def generate_from_user_intent(self, user_query: str) -> Dict:
@@ -124,29 +124,16 @@ class SchemaGenerator:
             raise ValueError("未配置 OPENROUTER_API_KEY")
         
         try:
-            response = requests.post(
-                self.api_base,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                    "HTTP-Referer": "https://github.com/xskill",
-                    "X-Title": "XSkill Schema Generator"
-                },
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.3,
-                    "max_tokens": max_tokens
-                },
-                timeout=120
+            return await self.llm.chat(
+                prompt,
+                model=self.model,
+                temperature=0.3,
+                max_tokens=max_tokens,
+                timeout=120,
+                title="XSkill Schema Generator"
             )
-            response.raise_for_status()
-            
-            result = response.json()
-            return result['choices'][0]['message']['content']
-            
-        except Exception as e:
-            raise Exception(f"LLM 调用失败: {e}")
+        except LLMError as e:
+            raise LLMError(f"LLM 调用失败: {e}", e.status_code, e.retryable, e.retry_after) from e
     
     def _parse_schema_from_response(self, response: str) -> Dict:
         """从 LLM 响应中提取 JSON Schema"""
@@ -0,0 +1,397 @@
+"""
+scrape_executor.py - 多博主并发抓取调度
+
+核心职责:
+1. 以有界并发同时抓取多个博主（asyncio.Semaphore 控制上限）
+2. 同一博主的多个缺口按时间顺序串行抓取
+3. 低频博主按相同缺口合并为 (from:a OR from:b ...) 查询，按作者拆分结果
+4. 每个缺口抓取完成后立即入库；只有游标翻到底的窗口才整段标记为已覆盖
+5. 今天（UTC）尚未结束，不计入覆盖区间；高频博主的当天部分按高水位增量抓取
+6. 汇报进度与吞吐
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from .storage_manager import StorageManager
+
+
+# 每页推文数，与 XScraper 的默认 page_size 一致
+PAGE_SIZE = 20
+
+
+class ScrapeExecutor:
+    """并发抓取执行器：按博主分任务，任务内按缺口顺序执行"""
+
+    def __init__(
+        self,
+        scraper,
+        storage: StorageManager,
+        concurrency: int = None,
+        max_pages: int = None,
+        batch_max_rate: float = None
+    ):
+        """
+        Args:
+            scraper: XScraper 实例（需提供 scrape_window / scrape_since / scrape_batch /
+                pack_handles / flush）
+            storage: StorageManager 实例
+            concurrency: 同时抓取的博主数量，默认读取 XSKILL_SCRAPE_CONCURRENCY (4)
+            max_pages: 每个缺口的翻页上限，默认读取 XSKILL_MAX_PAGES (10)
+            batch_max_rate: 日均发帖量不超过该值的博主合并抓取，默认读取 XSKILL_BATCH_MAX_RATE (1.0)，0 表示不合并
+        """
+        self.scraper = scraper
+        self.storage = storage
+        self.concurrency = max(1, concurrency or int(os.getenv("XSKILL_SCRAPE_CONCURRENCY", "4")))
+        self.max_pages = max_pages
+        self.batch_max_rate = (
+            batch_max_rate if batch_max_rate is not None
+            else float(os.getenv("XSKILL_BATCH_MAX_RATE", "1.0"))
+        )
+
+    async def run(self, gaps_by_handle: Dict[str, List[Tuple[str, str]]]) -> dict:
+        """
+        执行抓取计划
+
+        Args:
+            gaps_by_handle: {handle: [(gap_start, gap_end), ...]}，无缺口的博主会被跳过
+
+        Returns:
+            {
+                "total_fetched": int,   # 新增推文数
+                "total_updated": int,   # 已存在、刷新了互动数据的推文数
+                "gaps_done": int,
+                "gaps_total": int,
+                "gaps_incomplete": int, # 翻页上限内未抓完、下次继续的缺口数
+                "gaps_incremental": int,    # 按高水位增量抓取的缺口数
+                "failed": [(handle, (gap_start, gap_end), error), ...],
+                "elapsed": float        # 秒
+            }
+        """
+        jobs = {handle: gaps for handle, gaps in gaps_by_handle.items() if gaps}
+        self._stats = {
+            "total_fetched": 0,
+            "total_updated": 0,
+            "gaps_done": 0,
+            "gaps_total": sum(len(gaps) for gaps in jobs.values()),
+            "gaps_incomplete": 0,
+            "gaps_incremental": 0,
+            "failed": [],
+            "elapsed": 0.0
+        }
+        if not jobs:
+            return self._stats
+
+        self._marks = self.storage.get_high_water_marks(list(jobs))
+        solo, batches = self._plan(jobs)
+        print(f"   🚀 并发抓取 {len(jobs)} 个博主 / {self._stats['gaps_total']} 个缺口 (并发上限 {self.concurrency})")
+        if batches:
+            batched = sum(len(members) for _, members in batches)
+            print(f"   📦 {batched} 个低频博主·缺口合并为 {len(batches)} 个 OR 查询")
+
+        self._started_at = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(task):
+            async with semaphore:
+                await task
+
+        try:
+            await asyncio.gather(
+                *(bounded(self._scrape_handle(handle, gaps)) for handle, gaps in solo.items()),
+                *(bounded(self._scrape_batch(members, gap)) for gap, members in batches)
+            )
+        finally:
+            # 限速状态节流写盘，抓取结束时补写最后一次
+            self.scraper.flush()
+
+        self._stats["elapsed"] = time.monotonic() - self._started_at
+        elapsed_min = max(self._stats["elapsed"], 1e-6) / 60
+        print(f"   ✅ 抓取完成: {self._stats['gaps_done']}/{self._stats['gaps_total']} 个缺口，"
+              f"新增 {self._stats['total_fetched']} 条，更新 {self._stats['total_updated']} 条，"
+              f"用时 {self._stats['elapsed']:.0f} 秒 ({self._stats['gaps_done'] / elapsed_min:.1f} 缺口/分钟)")
+        if self._stats["gaps_incremental"]:
+            print(f"   ⚡ {self._stats['gaps_incremental']} 个缺口按高水位增量抓取")
+        if self._stats["gaps_incomplete"]:
+            print(f"   ⚠️ {self._stats['gaps_incomplete']} 个缺口未抓完，已抓取部分已入库，剩余部分下次继续")
+        if self._stats["failed"]:
+            print(f"   ⚠️ {len(self._stats['failed'])} 个缺口抓取失败，下次运行会重试")
+
+        return self._stats
+
+    def _plan(
+        self,
+        jobs: Dict[str, List[Tuple[str, str]]]
+    ) -> Tuple[Dict[str, List[Tuple[str, str]]], List[Tuple[Tuple[str, str], List[str]]]]:
+        """
+        按发帖频率拆分任务
+
+        高频博主单独抓取；低频（或从未抓取过）的博主按相同缺口分组，
+        每组受查询长度上限约束，并把预计推文数控制在翻页上限的一半以内，
+        使合并查询大概率能一次翻到底。
+
+        Returns:
+            (solo, batches)
+            solo: {handle: [(gap_start, gap_end), ...]}
+            batches: [((gap_start, gap_end), [handle, ...]), ...]
+        """
+        if self.batch_max_rate <= 0:
+            return jobs, []
+
+        rates = self.storage.get_posting_rates(list(jobs))
+        max_pages = self.max_pages or int(os.getenv("XSKILL_MAX_PAGES", "10"))
+        batch_budget = max_pages * PAGE_SIZE / 2
+
+        solo = {}
+        by_gap = {}
+        for handle, gaps in jobs.items():
+            rate = rates.get(handle)
+            if rate is not None and rate > self.batch_max_rate:
+                solo[handle] = gaps
+                continue
+            for gap in gaps:
+                by_gap.setdefault(gap, []).append(handle)
+
+        batches = []
+        for gap, handles in by_gap.items():
+            days = (datetime.strptime(gap[1], "%Y-%m-%d") - datetime.strptime(gap[0], "%Y-%m-%d")).days + 1
+            for group in self.scraper.pack_handles(handles):
+                members, expected = [], 0.0
+                for handle in group:
+                    # 从未抓取过的博主按阈值的一半估算
+                    rate = rates.get(handle)
+                    estimate = (rate if rate is not None else self.batch_max_rate / 2) * days
+                    if members and expected + estimate > batch_budget:
+                        batches.append((gap, members))
+                        members, expected = [], 0.0
+                    members.append(handle)
+                    expected += estimate
+                batches.append((gap, members))
+
+        return solo, batches
+
+    async def _scrape_handle(self, handle: str, gaps: List[Tuple[str, str]]):
+        """按顺序抓取单个博主的全部缺口"""
+        for gap_start, gap_end in gaps:
+            try:
+                checked_at = int(time.time())
+                since_id = self._incremental_since(handle, gap_start, gap_end)
+                if since_id:
+                    tweets, complete = await self.scraper.scrape_since(
+                        handle,
+                        since_id,
+                        max_pages=self.max_pages
+                    )
+                    self._stats["gaps_incremental"] += 1
+                else:
+                    tweets, complete = await self.scraper.scrape_window(
+                        handle,
+                        start_date=gap_start,
+                        end_date=gap_end,
+                        max_pages=self.max_pages
+                    )
+
+                inserted, updated = 0, 0
+                if tweets:
+                    inserted, updated = self.storage.upsert_tweets(tweets)
+
+                # 入库之后才标记覆盖区间
+                covered = self._covered_range(gap_start, gap_end, tweets, complete)
+                if covered:
+                    self.storage.update_manifest(handle, covered)
+                if complete and gap_end >= _utc_today():
+                    self.storage.update_high_water_mark(handle, tweets, checked_at)
+                if not complete:
+                    self._stats["gaps_incomplete"] += 1
+
+                self._stats["total_fetched"] += inserted
+                self._stats["total_updated"] += updated
+                self._report(f"@{handle}", gap_start, gap_end, inserted, updated)
+
+            except Exception as e:
+                self._stats["failed"].append((handle, (gap_start, gap_end), str(e)))
+                print(f"      ❌ @{handle} {gap_start} 至 {gap_end} 抓取失败: {e}")
+            finally:
+                self._stats["gaps_done"] += 1
+
+    async def _scrape_batch(self, handles: List[str], gap: Tuple[str, str]):
+        """用一个 OR 查询抓取多个低频博主的同一缺口"""
+        gap_start, gap_end = gap
+        label = f"@{handles[0]}" if len(handles) == 1 else f"@{handles[0]} 等 {len(handles)} 个博主"
+        try:
+            checked_at = int(time.time())
+            results, complete = await self.scraper.scrape_batch(
+                handles,
+                start_date=gap_start,
+                end_date=gap_end,
+                max_pages=self.max_pages
+            )
+
+            tweets = [tweet for handle in handles for tweet in results.get(handle, [])]
+            inserted, updated = 0, 0
+            if tweets:
+                inserted, updated = self.storage.upsert_tweets(tweets)
+
+            # 合并结果整体按时间倒序，因此可确认的覆盖区间对批内所有博主相同
+            covered = self._covered_range(gap_start, gap_end, tweets, complete)
+            if covered:
+                with self.storage.db.transaction():
+                    for handle in handles:
+                        self.storage.update_manifest(handle, covered)
+            if complete and gap_end >= _utc_today():
+                with self.storage.db.transaction():
+                    for handle in handles:
+                        self.storage.update_high_water_mark(handle, results.get(handle, []), checked_at)
+            if not complete:
+                self._stats["gaps_incomplete"] += len(handles)
+
+            self._stats["total_fetched"] += inserted
+            self._stats["total_updated"] += updated
+            self._report(label, gap_start, gap_end, inserted, updated, gaps=len(handles))
+
+        except Exception as e:
+            for handle in handles:
+                self._stats["failed"].append((handle, gap, str(e)))
+            print(f"      ❌ {label} {gap_start} 至 {gap_end} 抓取失败: {e}")
+        finally:
+            self._stats["gaps_done"] += len(handles)
+
+    def _incremental_since(self, handle: str, gap_start: str, gap_end: str) -> Optional[str]:
+        """
+        判断缺口能否按高水位增量抓取，可以则返回 since_id
+
+        只适用于延伸到今天的尾部缺口，且缺口起点不早于高水位检查时间所在的 UTC 日期。
+        建立高水位的完整抓取窗口必然延伸到 checked_at 当天，因此当天 0 点到 checked_at
+        之间的推文已完整入库，只需抓比高水位更新的推文；缺口起点更早时，
+        更早的日子未必抓过（例如高水位只由当天窗口建立），必须按窗口抓取。
+        """
+        mark = self._marks.get(handle)
+        if not mark or not mark["tweet_id"] or gap_end < _utc_today():
+            return None
+        checked_day = datetime.fromtimestamp(mark["checked_at"], tz=timezone.utc).strftime("%Y-%m-%d")
+        if gap_start < checked_day:
+            return None
+        return mark["tweet_id"]
+
+    @staticmethod
+    def _covered_range(
+        gap_start: str,
+        gap_end: str,
+        tweets: List[dict],
+        complete: bool
+    ) -> Optional[Tuple[str, str]]:
+        """
+        计算本次抓取可以确认覆盖的区间
+
+        窗口翻到底时整段覆盖（包括确实没有发帖的窗口）。
+        未翻到底时结果按时间倒序，只有最早一条推文之后的整天是完整的，
+        最早那天可能只抓到一部分，留给下次继续。
+        今天（UTC）还会有新推文，覆盖区间最多到昨天。
+        """
+        gap_end = min(gap_end, _utc_yesterday())
+        if gap_start > gap_end:
+            return None
+        if complete:
+            return (gap_start, gap_end)
+        if not tweets:
+            return None
+
+        oldest_day = min(t["publish_time"][:10] for t in tweets)
+        covered_start = (datetime.strptime(oldest_day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        covered_start = max(covered_start, gap_start)
+        if covered_start > gap_end:
+            return None
+        return (covered_start, gap_end)
+
+    def _report(
+        self,
+        label: str,
+        gap_start: str,
+        gap_end: str,
+        inserted: int,
+        updated: int,
+        gaps: int = 1
+    ):
+        """打印一个任务的完成进度与累计吞吐"""
+        done = self._stats["gaps_done"] + gaps
+        elapsed_min = max(time.monotonic() - self._started_at, 1e-6) / 60
+        throughput = (self._stats["total_fetched"] + self._stats["total_updated"]) / elapsed_min
+        print(f"      [{done}/{self._stats['gaps_total']}] {label} {gap_start} 至 {gap_end}: "
+              f"新增 {inserted}，更新 {updated} ({throughput:.0f} 条/分钟)")
+
+
+def _utc_today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _utc_yesterday() -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+# 测试代码
+if __name__ == "__main__":
+    import tempfile
+
+    def _demo_tweets(handle, day, n, hour=12):
+        return [{
+            "content_id": f"{day.replace('-', '')}{hour:02d}{handle[4:]:0>2}{i}",
+            "author": handle,
+            "text": f"demo tweet {i}",
+            "publish_time": f"{day}T{hour:02d}:00:00+00:00",
+            "url": "",
+            "is_retweet": False
+        } for i in range(n)]
+
+    class _DemoScraper:
+        """模拟网络延迟的演示爬虫"""
+
+        async def scrape_window(self, handle, start_date=None, end_date=None, max_pages=None):
+            await asyncio.sleep(0.2)
+            # user0 的第一个窗口模拟翻页上限内未抓完
+            complete = not (handle == "user0" and start_date == "2026-01-01")
+            return _demo_tweets(handle, end_date, 3, hour=0), complete
+
+        async def scrape_since(self, handle, since_id, max_pages=None):
+            await asyncio.sleep(0.2)
+            print(f"      ⚡ @{handle} since_id:{since_id}")
+            return _demo_tweets(handle, _utc_today(), 1, hour=1), True
+
+        async def scrape_batch(self, handles, start_date=None, end_date=None, max_pages=None):
+            await asyncio.sleep(0.2)
+            return {handle: _demo_tweets(handle, start_date, 1) for handle in handles}, True
+
+        def pack_handles(self, handles):
+            return [handles[i:i + 3] for i in range(0, len(handles), 3)]
+
+        def flush(self):
+            pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sm = StorageManager(data_dir=tmp)
+        executor = ScrapeExecutor(_DemoScraper(), sm, concurrency=4)
+
+        # user0 近 10 天每天 5 条，属于高频博主，单独抓取；其余博主无历史数据，合并抓取
+        recent = [(datetime.now(timezone.utc) - timedelta(days=d)).strftime("%Y-%m-%d") for d in range(1, 11)]
+        sm.upsert_tweets([t for day in recent for t in _demo_tweets("user0", day, 5)])
+        sm.update_manifest("user0", (recent[-1], recent[0]))
+
+        plan = {
+            f"user{i}": [("2026-01-01", "2026-01-03"), ("2026-01-05", "2026-01-06")]
+            for i in range(8)
+        }
+        plan["user0"].append((_utc_today(), _utc_today()))
+        stats = asyncio.run(executor.run(plan))
+        print(f"\n统计: {stats}")
+        print(f"user0 覆盖区间: {sm.get_coverage('user0')}")
+        print(f"user5 覆盖区间: {sm.get_coverage('user5')}")
+        print(f"user0 高水位: {sm.get_high_water_marks(['user0'])}")
+
+        # 今天不计入覆盖，第二次运行时 user0 的当天部分走增量抓取
+        print("\n再次刷新 user0:")
+        gaps = sm.get_missing_ranges_bulk(["user0"], _utc_today(), _utc_today())["gaps"]
+        stats = asyncio.run(executor.run(gaps))
+        assert stats["gaps_incremental"] == 1
+        sm.close()
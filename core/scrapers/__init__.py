@@ -1,3 +1,5 @@
 # Scrapers module
 from .base_scraper import BaseScraper
 from .x_scraper import XScraper, TwitterScraper
+from .credential_pool import CredentialPool
+from .rate_limiter import RateLimiter
@@ -0,0 +1,261 @@
+"""
+credential_pool.py - Twitter 凭据池
+
+核心职责:
+1. 从凭据文件 (data/credentials.json) 与环境变量加载多个账号
+2. 每个账号一个 twikit Client 与独立的令牌桶限速器
+3. 每次请求分配给该接口剩余额度最多的账号
+4. 429 / 认证失败后让账号冷却，并记录每个账号的健康统计
+"""
+
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from twikit import Client
+
+from .rate_limiter import RateLimiter
+
+
+# 429 后整个账号短暂冷却（该接口的额度另由令牌桶等到窗口重置）
+RATE_LIMIT_COOLDOWN = 60
+# 认证失败后的冷却时间，连续失败达到上限后本进程内停用该账号
+AUTH_ERROR_COOLDOWN = 30 * 60
+MAX_AUTH_FAILURES = 3
+
+
+class Credential:
+    """单个 Twitter 账号：Client + 限速器 + 健康统计"""
+
+    def __init__(
+        self,
+        name: str,
+        auth_token: str,
+        ct0: str = None,
+        language: str = 'en-US',
+        rate_limit_path: Path = None
+    ):
+        self.name = name
+        self.auth_token = auth_token
+        self.ct0 = ct0
+
+        self.client = Client(language)
+        self.client.set_cookies({
+            'auth_token': auth_token,
+            'ct0': ct0 if ct0 else 'dummy_ct0'
+        })
+
+        # 额度按账号计算，每个账号一个限速器，共用状态文件的不同分区
+        self.limiter = RateLimiter(state_path=rate_limit_path, namespace=name)
+        self.limiter.install(self.client.http)
+
+        # 健康统计
+        self.requests = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.auth_errors = 0
+        self.errors = 0
+        self.consecutive_auth_failures = 0
+        self.cooldown_until = 0.0
+        self.disabled = False
+        self.last_error = None
+        self.last_used = None
+
+    def is_available(self, now: float = None) -> bool:
+        return not self.disabled and (now or time.time()) >= self.cooldown_until
+
+    def health(self) -> dict:
+        """健康统计快照"""
+        now = time.time()
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "successes": self.successes,
+            "success_rate": self.successes / self.requests if self.requests else None,
+            "rate_limited": self.rate_limited,
+            "auth_errors": self.auth_errors,
+            "errors": self.errors,
+            "cooldown_seconds": max(0, int(self.cooldown_until - now)),
+            "disabled": self.disabled,
+            "last_error": self.last_error,
+            "quota": self.limiter.status()
+        }
+
+
+class CredentialPool:
+    """凭据池：按剩余额度分配账号，失败的账号自动冷却"""
+
+    def __init__(
+        self,
+        credentials: List[dict] = None,
+        credentials_path: str = None,
+        language: str = 'en-US',
+        rate_limit_path: str = None
+    ):
+        """
+        Args:
+            credentials: 凭据列表 [{"name", "auth_token", "ct0"}]，为空时从文件与环境变量加载
+            credentials_path: 凭据文件路径，默认读取 TWITTER_CREDENTIALS_FILE，再默认 data/credentials.json
+            language: twikit Client 语言
+            rate_limit_path: 限速状态文件路径，默认为 data/rate_limits.json
+        """
+        if credentials is None:
+            credentials = self._load_credentials(credentials_path)
+
+        self.credentials: List[Credential] = []
+        seen_tokens = set()
+        for i, cred in enumerate(credentials):
+            token = cred.get("auth_token")
+            if not token or token in seen_tokens:
+                continue
+            seen_tokens.add(token)
+            self.credentials.append(Credential(
+                name=cred.get("name") or ("default" if i == 0 else f"account_{i}"),
+                auth_token=token,
+                ct0=cred.get("ct0"),
+                language=language,
+                rate_limit_path=rate_limit_path
+            ))
+
+        if not self.credentials:
+            raise ValueError(
+                "需要提供 auth_token、设置 TWITTER_AUTH_TOKEN 环境变量，或配置凭据文件 data/credentials.json"
+            )
+
+    @staticmethod
+    def _load_credentials(credentials_path: str = None) -> List[dict]:
+        """
+        加载凭据：环境变量中的账号排在最前（命名为 default），其后是凭据文件中的账号
+
+        凭据文件格式:
+            [{"name": "alice", "auth_token": "...", "ct0": "..."}, ...]
+        """
+        credentials = []
+        if os.getenv("TWITTER_AUTH_TOKEN"):
+            credentials.append({
+                "name": "default",
+                "auth_token": os.getenv("TWITTER_AUTH_TOKEN"),
+                "ct0": os.getenv("TWITTER_CT0")
+            })
+
+        path = credentials_path or os.getenv("TWITTER_CREDENTIALS_FILE")
+        path = Path(path) if path else Path(__file__).parent.parent.parent / "data" / "credentials.json"
+        if path.exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+                credentials.extend(entry for entry in entries if isinstance(entry, dict))
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"⚠️ 凭据文件读取失败，已忽略: {e}")
+
+        return credentials
+
+    @property
+    def primary(self) -> Credential:
+        return self.credentials[0]
+
+    def __len__(self) -> int:
+        return len(self.credentials)
+
+    # ==================== 分配 ====================
+
+    async def acquire(self, endpoint: str) -> Credential:
+        """
+        为一次请求选择账号并取得其令牌
+
+        优先选择该接口当前可用令牌最多的账号，令牌相同时选窗口最早重置的；
+        所有账号都在冷却时等待最早结束冷却的那个。
+        """
+        while True:
+            now = time.time()
+            available = [c for c in self.credentials if c.is_available(now)]
+            if available:
+                best = max(
+                    available,
+                    key=lambda c: (c.limiter.bucket(endpoint).available(now), -c.limiter.bucket(endpoint).reset_at)
+                )
+                await best.limiter.acquire(endpoint)
+                best.requests += 1
+                best.last_used = time.time()
+                return best
+
+            active = [c for c in self.credentials if not c.disabled]
+            if not active:
+                raise RuntimeError("凭据池中没有可用账号（全部认证失败）")
+            wait = min(c.cooldown_until for c in active) - now
+            print(f"⏳ 所有账号都在冷却中，等待 {wait:.0f} 秒...")
+            await asyncio.sleep(max(wait, 0.1))
+
+    # ==================== 结果反馈 ====================
+
+    def report_success(self, credential: Credential):
+        credential.successes += 1
+        credential.consecutive_auth_failures = 0
+
+    def report_rate_limited(self, credential: Credential, endpoint: str, error: Exception) -> float:
+        """
+        429：清空该账号此接口的令牌，并让账号短暂冷却
+
+        Returns:
+            该账号此接口窗口重置前的秒数
+        """
+        credential.rate_limited += 1
+        credential.last_error = f"429 {endpoint}"
+
+        bucket = credential.limiter.bucket(endpoint)
+        if bucket.remaining > 0:
+            # 响应钩子未生效时，用异常携带的响应头兜底
+            credential.limiter.update_from_headers(endpoint, getattr(error, 'headers', None), 429)
+        credential.cooldown_until = max(credential.cooldown_until, time.time() + RATE_LIMIT_COOLDOWN)
+        return bucket.reset_at - time.time()
+
+    def report_auth_error(self, credential: Credential, error: Exception):
+        """认证失败（401/403/封号/锁号）：冷却，连续多次则停用"""
+        credential.auth_errors += 1
+        credential.consecutive_auth_failures += 1
+        credential.last_error = f"{type(error).__name__}: {error}"
+
+        if credential.consecutive_auth_failures >= MAX_AUTH_FAILURES:
+            credential.disabled = True
+            print(f"🚫 账号 {credential.name} 连续 {MAX_AUTH_FAILURES} 次认证失败，已停用")
+        else:
+            credential.cooldown_until = time.time() + AUTH_ERROR_COOLDOWN
+            print(f"⚠️ 账号 {credential.name} 认证失败，冷却 {AUTH_ERROR_COOLDOWN // 60} 分钟: {error}")
+
+    def report_error(self, credential: Credential, error: Exception):
+        credential.errors += 1
+        credential.last_error = f"{type(error).__name__}: {error}"
+
+    # ==================== 统计 ====================
+
+    def flush(self):
+        """写入所有账号尚未保存的限速状态"""
+        for credential in self.credentials:
+            credential.limiter.flush()
+
+    def health(self) -> List[Dict]:
+        """所有账号的健康统计"""
+        return [c.health() for c in self.credentials]
+
+    def print_health(self):
+        """打印账号健康概况"""
+        print(f"🔑 凭据池: {len(self.credentials)} 个账号")
+        for h in self.health():
+            if h["disabled"]:
+                status = "🚫 已停用"
+            elif h["cooldown_seconds"]:
+                status = f"⏳ 冷却 {h['cooldown_seconds']}s"
+            else:
+                status = "✅ 可用"
+            rate = f"{h['success_rate']:.0%}" if h["success_rate"] is not None else "-"
+            print(f"   {h['name']}: {status}，请求 {h['requests']}，成功率 {rate}，"
+                  f"429 {h['rate_limited']} 次，认证失败 {h['auth_errors']} 次")
+
+
+# 测试代码
+if __name__ == "__main__":
+    pool = CredentialPool()
+    pool.print_health()
@@ -0,0 +1,221 @@
+"""
+profile_cache.py - Twitter 用户资料缓存
+
+核心职责:
+1. 在 SQLite (data/user_profiles.db) 中持久化用户资料，按 user_id 与 screen_name 双向查询
+2. 资料按 TTL 过期，过期后才重新请求 UserByScreenName
+3. 支持批量查询，following 分页返回的用户资料顺带入缓存
+4. 记录凭据验证结果，短时间内重复验证不再消耗额度
+"""
+
+import hashlib
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ..connection_manager import ConnectionManager
+
+
+# 默认资料有效期
+DEFAULT_TTL = 7 * 24 * 3600
+
+PROFILE_FIELDS = [
+    "id", "screen_name", "name", "description",
+    "followers_count", "following_count", "verified"
+]
+
+
+class UserProfileCache:
+    """用户资料缓存：screen_name ↔ user_id + 常用资料字段"""
+
+    def __init__(self, db_path: str = None, ttl: int = DEFAULT_TTL):
+        """
+        Args:
+            db_path: 缓存数据库路径，默认为 data/user_profiles.db
+            ttl: 资料有效期（秒）
+        """
+        if db_path is None:
+            db_path = Path(__file__).parent.parent.parent / "data" / "user_profiles.db"
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.ttl = ttl
+        self.db = ConnectionManager(db_path, pool_size=2)
+        with self.db.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_profiles (
+                    user_id TEXT PRIMARY KEY,
+                    screen_name TEXT NOT NULL COLLATE NOCASE,
+                    name TEXT,
+                    description TEXT,
+                    followers_count INTEGER DEFAULT 0,
+                    following_count INTEGER DEFAULT 0,
+                    verified INTEGER DEFAULT 0,
+                    fetched_at INTEGER NOT NULL
+                )
+            ''')
+            # screen_name 可能被改名后由他人占用，同一时刻只对应一个 user_id
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_profiles_screen_name ON user_profiles(screen_name)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS credential_checks (
+                    token_hash TEXT PRIMARY KEY,
+                    valid INTEGER NOT NULL,
+                    checked_at INTEGER NOT NULL
+                )
+            ''')
+
+    def close(self):
+        self.db.close()
+
+    # ==================== 查询 ====================
+
+    def get(self, screen_name: str) -> Optional[Dict]:
+        """按 screen_name 查询未过期的资料"""
+        return self.get_many([screen_name]).get(screen_name.lower())
+
+    def get_by_id(self, user_id: str) -> Optional[Dict]:
+        """按 user_id 查询未过期的资料"""
+        return self.get_many_by_id([user_id]).get(str(user_id))
+
+    def get_many(self, screen_names: List[str]) -> Dict[str, Dict]:
+        """
+        批量按 screen_name 查询
+
+        Returns:
+            {小写 screen_name: 资料}，缺失或过期的不出现
+        """
+        names = list(dict.fromkeys(name.lower() for name in screen_names if name))
+        return {
+            profile["screen_name"].lower(): profile
+            for profile in self._select("screen_name", names)
+        }
+
+    def get_many_by_id(self, user_ids: List[str]) -> Dict[str, Dict]:
+        """
+        批量按 user_id 查询
+
+        Returns:
+            {user_id: 资料}，缺失或过期的不出现
+        """
+        ids = list(dict.fromkeys(str(user_id) for user_id in user_ids if user_id))
+        return {profile["id"]: profile for profile in self._select("user_id", ids)}
+
+    def _select(self, column: str, values: List[str]) -> List[Dict]:
+        fresh_after = int(time.time()) - self.ttl
+        profiles = []
+        with self.db.reader() as conn:
+            # 分块避免超过 SQLite 参数上限
+            for i in range(0, len(values), 500):
+                part = values[i:i + 500]
+                rows = conn.execute(f'''
+                    SELECT user_id, screen_name, name, description,
+                           followers_count, following_count, verified
+                    FROM user_profiles
+                    WHERE {column} IN ({', '.join(['?'] * len(part))}) AND fetched_at >= ?
+                ''', part + [fresh_after]).fetchall()
+                profiles.extend(
+                    dict(zip(PROFILE_FIELDS, row[:6]), verified=bool(row[6]))
+                    for row in rows
+                )
+        return profiles
+
+    # ==================== 写入 ====================
+
+    def put(self, profile: Dict):
+        self.put_many([profile])
+
+    def put_many(self, profiles: List[Dict]):
+        """
+        批量写入资料（需包含 id 与 screen_name），同名旧记录会被替换
+        """
+        now = int(time.time())
+        rows = [
+            (
+                str(p["id"]),
+                p["screen_name"],
+                p.get("name"),
+                p.get("description", ""),
+                p.get("followers_count", 0) or 0,
+                p.get("following_count", 0) or 0,
+                1 if p.get("verified") else 0,
+                now
+            )
+            for p in profiles
+            if p.get("id") and p.get("screen_name")
+        ]
+        if not rows:
+            return
+
+        with self.db.transaction() as conn:
+            # 改名后 screen_name 被别人占用：先删掉旧的占用者
+            conn.executemany(
+                "DELETE FROM user_profiles WHERE screen_name = ? AND user_id != ?",
+                [(row[1], row[0]) for row in rows]
+            )
+            conn.executemany('''
+                INSERT INTO user_profiles (
+                    user_id, screen_name, name, description,
+                    followers_count, following_count, verified, fetched_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    screen_name = excluded.screen_name,
+                    name = excluded.name,
+                    description = excluded.description,
+                    followers_count = excluded.followers_count,
+                    following_count = excluded.following_count,
+                    verified = excluded.verified,
+                    fetched_at = excluded.fetched_at
+            ''', rows)
+
+    def purge_expired(self) -> int:
+        """删除过期资料，返回删除条数"""
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM user_profiles WHERE fetched_at < ?",
+                (int(time.time()) - self.ttl,)
+            )
+            return cursor.rowcount
+
+    # ==================== 凭据验证记录 ====================
+
+    @staticmethod
+    def _token_hash(auth_token: str) -> str:
+        # 只保存哈希，不落盘原始凭据
+        return hashlib.sha256(auth_token.encode()).hexdigest()[:32]
+
+    def credential_recently_valid(self, auth_token: str, max_age: int) -> bool:
+        """该凭据是否在 max_age 秒内验证通过过"""
+        with self.db.reader() as conn:
+            row = conn.execute(
+                "SELECT valid, checked_at FROM credential_checks WHERE token_hash = ?",
+                (self._token_hash(auth_token),)
+            ).fetchone()
+        return bool(row and row[0] and row[1] >= time.time() - max_age)
+
+    def record_credential_check(self, auth_token: str, valid: bool):
+        with self.db.transaction() as conn:
+            conn.execute('''
+                INSERT INTO credential_checks (token_hash, valid, checked_at) VALUES (?, ?, ?)
+                ON CONFLICT(token_hash) DO UPDATE SET valid = excluded.valid, checked_at = excluded.checked_at
+            ''', (self._token_hash(auth_token), 1 if valid else 0, int(time.time())))
+
+
+# 测试代码
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = UserProfileCache(db_path=Path(tmp) / "user_profiles.db")
+        cache.put_many([
+            {"id": "44196397", "screen_name": "elonmusk", "name": "Elon Musk", "followers_count": 1},
+            {"id": "33836629", "screen_name": "karpathy", "name": "Andrej Karpathy", "verified": True},
+        ])
+        print(f"按名查询: {cache.get('ElonMusk')}")
+        print(f"批量按 ID: {list(cache.get_many_by_id(['33836629', '404']))}")
+
+        # 改名：同一 screen_name 被新 user_id 占用
+        cache.put({"id": "1", "screen_name": "karpathy"})
+        print(f"改名后: {cache.get('karpathy')['id']}, 旧 ID: {cache.get_by_id('33836629')}")
+
+        cache.ttl = -1
+        print(f"过期后: {cache.get('elonmusk')}，清理 {cache.purge_expired()} 条")
+        cache.close()
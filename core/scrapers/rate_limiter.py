@@ -0,0 +1,306 @@
+"""
+rate_limiter.py - 按接口划分的令牌桶限速器
+
+核心职责:
+1. 每个 GraphQL 接口 (SearchTimeline / Following / UserByScreenName ...) 一个令牌桶
+2. 由响应头 x-rate-limit-limit / remaining / reset 校准桶内令牌与重置时间
+3. 令牌耗尽时等待到窗口重置，而不是盲目 sleep 或撞 429
+4. 状态持久化到 data/rate_limits.json（按凭据分区），进程重启后继续沿用；
+   写盘做了节流（最多每 save_interval 秒一次，令牌耗尽 / 429 时立即写），
+   flush() 与进程退出时写入最终状态
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import time
+import weakref
+from pathlib import Path
+from typing import Dict, Optional
+
+
+# X 的限速窗口为 15 分钟
+WINDOW_SECONDS = 15 * 60
+
+# 尚未收到响应头时使用的保守默认额度（每窗口请求数）
+DEFAULT_LIMITS = {
+    "SearchTimeline": 50,
+    "Following": 50,
+    "UserByScreenName": 95,
+}
+FALLBACK_LIMIT = 50
+
+# 两次写状态文件的最小间隔（秒）
+DEFAULT_SAVE_INTERVAL = 5.0
+
+# 进程内所有限速器，退出时统一写入未保存的状态
+_live_limiters = weakref.WeakSet()
+
+
+class TokenBucket:
+    """
+    单个接口的令牌桶
+
+    X 的额度是固定窗口：窗口内最多 limit 次请求，到 reset 时刻一次性补满。
+    本地先扣令牌再发请求，响应头到达后再用服务端的 remaining 校准。
+    """
+
+    def __init__(self, limit: int, remaining: int = None, reset_at: float = None):
+        self.limit = limit
+        self.remaining = limit if remaining is None else remaining
+        self.reset_at = reset_at or 0.0
+        self.last_request = 0.0
+        self._lock = asyncio.Lock()
+
+    def available(self, now: float = None) -> int:
+        """当前可用令牌数（窗口已到期则视为满额）"""
+        now = now or time.time()
+        return self.limit if now >= self.reset_at else self.remaining
+
+    def _refill(self, now: float):
+        """窗口到期后补满令牌"""
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + WINDOW_SECONDS
+
+    async def acquire(self, min_interval: float = 0.0) -> float:
+        """
+        取一个令牌，必要时等待到窗口重置
+
+        Returns:
+            实际等待的秒数
+        """
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.time()
+                self._refill(now)
+                if self.remaining > 0:
+                    break
+                wait = self.reset_at - now + 1
+                waited += wait
+                await asyncio.sleep(wait)
+
+            # 两次请求之间保留最小间隔，避免瞬间突发
+            gap = min_interval - (time.time() - self.last_request)
+            if gap > 0:
+                waited += gap
+                await asyncio.sleep(gap)
+
+            self.remaining -= 1
+            self.last_request = time.time()
+        return waited
+
+    def update(self, limit: Optional[int], remaining: Optional[int], reset_at: Optional[float]):
+        """用响应头校准桶状态"""
+        if limit:
+            self.limit = limit
+        if reset_at and reset_at != self.reset_at:
+            # 新窗口：以服务端为准
+            self.reset_at = reset_at
+            if remaining is not None:
+                self.remaining = remaining
+        elif remaining is not None:
+            # 同一窗口内可能有其他请求在途，取较小值
+            self.remaining = min(self.remaining, remaining)
+
+    def exhaust(self, reset_at: Optional[float] = None):
+        """收到 429：清空令牌直到窗口重置"""
+        self.remaining = 0
+        self.reset_at = reset_at or (time.time() + WINDOW_SECONDS)
+
+    def to_dict(self) -> dict:
+        return {"limit": self.limit, "remaining": self.remaining, "reset_at": self.reset_at}
+
+
+class RateLimiter:
+    """多接口限速器，每个凭据一个实例（额度按账号计算）"""
+
+    def __init__(
+        self,
+        state_path: str = None,
+        min_interval: float = None,
+        namespace: str = "default",
+        save_interval: float = DEFAULT_SAVE_INTERVAL
+    ):
+        """
+        Args:
+            state_path: 状态文件路径，默认为 data/rate_limits.json
+            min_interval: 同一接口两次请求的最小间隔（秒），默认读取 XSKILL_MIN_REQUEST_INTERVAL (1.0)
+            namespace: 状态文件中的分区名，多个凭据共用一个状态文件
+            save_interval: 两次写状态文件的最小间隔（秒），0 表示每次更新都写
+        """
+        if state_path is None:
+            state_path = Path(__file__).parent.parent.parent / "data" / "rate_limits.json"
+        self.state_path = Path(state_path)
+        self.namespace = namespace
+        self.min_interval = (
+            min_interval if min_interval is not None
+            else float(os.getenv("XSKILL_MIN_REQUEST_INTERVAL", "1.0"))
+        )
+
+        self.save_interval = save_interval
+
+        self.buckets: Dict[str, TokenBucket] = {}
+        self._dirty = False
+        self._last_save = 0.0
+        # 已立即落盘过的耗尽窗口 (接口, reset_at)，同一窗口后续响应不再立即写
+        self._exhausted_saved = set()
+        self._load_state()
+        _live_limiters.add(self)
+
+    # ==================== 状态持久化 ====================
+
+    def _read_file(self) -> dict:
+        if not self.state_path.exists():
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ 限速状态文件损坏，已忽略: {e}")
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def _load_state(self):
+        """加载上次进程留下的额度，已过期的窗口直接丢弃"""
+        state = self._read_file().get(self.namespace)
+        if not isinstance(state, dict):
+            return
+
+        now = time.time()
+        for endpoint, info in state.items():
+            if isinstance(info, dict) and info.get("reset_at", 0) > now:
+                self.buckets[endpoint] = TokenBucket(
+                    limit=info.get("limit") or DEFAULT_LIMITS.get(endpoint, FALLBACK_LIMIT),
+                    remaining=info.get("remaining"),
+                    reset_at=info["reset_at"]
+                )
+
+    def _save_state(self):
+        """只改写本分区，经临时文件 + os.replace 原子写入状态文件"""
+        state = self._read_file()
+        state[self.namespace] = self.status()
+
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        # 临时文件按进程区分，多个进程同时写时不会互相截断
+        tmp_path = self.state_path.with_suffix(f".json.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def _schedule_save(self, urgent: bool = False):
+        """
+        标记状态已变化，距上次写盘超过 save_interval 或 urgent 时才写
+
+        响应钩子在事件循环上同步执行，节流后并发抓取时不会每个响应都读写一次文件。
+        """
+        self._dirty = True
+        if urgent or time.monotonic() - self._last_save >= self.save_interval:
+            self._save_state()
+
+    def flush(self):
+        """立即写入尚未保存的状态（抓取结束或进程退出时调用）"""
+        if self._dirty:
+            try:
+                self._save_state()
+            except OSError as e:
+                print(f"⚠️ 限速状态保存失败: {e}")
+
+    # ==================== 限速 ====================
+
+    def bucket(self, endpoint: str) -> TokenBucket:
+        if endpoint not in self.buckets:
+            self.buckets[endpoint] = TokenBucket(DEFAULT_LIMITS.get(endpoint, FALLBACK_LIMIT))
+        return self.buckets[endpoint]
+
+    async def acquire(self, endpoint: str):
+        """请求前调用：取得该接口的一个令牌"""
+        waited = await self.bucket(endpoint).acquire(self.min_interval)
+        if waited >= 10:
+            print(f"⏳ {endpoint} 额度已用尽，等待了 {waited:.0f} 秒")
+
+    def update_from_headers(self, endpoint: str, headers, status_code: int = 200):
+        """用响应头更新额度（429 时清空令牌）"""
+        limit = _int_header(headers, "x-rate-limit-limit")
+        remaining = _int_header(headers, "x-rate-limit-remaining")
+        reset_at = _int_header(headers, "x-rate-limit-reset")
+
+        if status_code != 429 and remaining is None and reset_at is None:
+            return
+
+        bucket = self.bucket(endpoint)
+        if status_code == 429:
+            bucket.exhaust(reset_at)
+        else:
+            bucket.update(limit, remaining, reset_at)
+        # 额度耗尽的窗口首次出现时立即落盘，其余更新节流写入
+        exhausted = (endpoint, bucket.reset_at) if bucket.remaining <= 0 else None
+        urgent = exhausted is not None and exhausted not in self._exhausted_saved
+        if urgent:
+            self._exhausted_saved.add(exhausted)
+        self._schedule_save(urgent=urgent)
+
+    def install(self, http_client):
+        """
+        在 httpx.AsyncClient 上挂载响应钩子，自动从响应头更新额度
+
+        twikit 的 Client.http 即为 httpx.AsyncClient，GraphQL 请求路径的
+        最后一段就是接口名，例如 /i/api/graphql/<id>/SearchTimeline
+        """
+        async def on_response(response):
+            endpoint = response.url.path.rstrip('/').rsplit('/', 1)[-1]
+            self.update_from_headers(endpoint, response.headers, response.status_code)
+
+        hooks = http_client.event_hooks
+        hooks.setdefault("response", []).append(on_response)
+        http_client.event_hooks = hooks
+
+    def status(self) -> Dict[str, dict]:
+        """各接口的当前额度"""
+        return {endpoint: bucket.to_dict() for endpoint, bucket in self.buckets.items()}
+
+
+@atexit.register
+def _flush_all():
+    for limiter in list(_live_limiters):
+        limiter.flush()
+
+
+def _int_header(headers, name: str) -> Optional[int]:
+    value = headers.get(name) if headers else None
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+# 测试代码
+if __name__ == "__main__":
+    import tempfile
+
+    async def demo():
+        with tempfile.TemporaryDirectory() as tmp:
+            limiter = RateLimiter(state_path=Path(tmp) / "rate_limits.json", min_interval=0)
+
+            # 模拟服务端告知只剩 2 次额度，3 秒后重置
+            reset = int(time.time()) + 3
+            limiter.update_from_headers("SearchTimeline", {
+                "x-rate-limit-limit": "50",
+                "x-rate-limit-remaining": "2",
+                "x-rate-limit-reset": str(reset)
+            })
+            limiter.flush()
+            print(f"重启后加载: {RateLimiter(state_path=limiter.state_path).status()}")
+
+            start = time.time()
+            for i in range(3):
+                await limiter.acquire("SearchTimeline")
+                print(f"请求 {i + 1} 发出于 {time.time() - start:.1f}s")
+
+            print(f"\n当前额度: {limiter.status()}")
+
+    asyncio.run(demo())
@@ -7,12 +7,16 @@ x_scraper.py - Twitter/X 平台爬虫实现
 
 import os
 import asyncio
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 
-from twikit import Client
-
 from .base_scraper import BaseScraper
+from .credential_pool import CredentialPool, Credential
+from .profile_cache import UserProfileCache
+
+
+# 搜索查询的最大长度（含 from/since/until 条件）
+MAX_QUERY_LENGTH = 512
 
 
 class XScraper(BaseScraper):
@@ -22,180 +26,414 @@ class XScraper(BaseScraper):
         self, 
         auth_token: str = None, 
         ct0: str = None,
-        language: str = 'en-US'
+        language: str = 'en-US',
+        pool: CredentialPool = None,
+        profile_cache: UserProfileCache = None
     ):
+        """
+        Args:
+            auth_token / ct0: 单个账号的凭据；不传时从环境变量与 data/credentials.json 加载凭据池
+            language: twikit Client 语言
+            pool: 已构建的凭据池（多个爬虫实例共享额度时传入）
+            profile_cache: 用户资料缓存，默认使用 data/user_profiles.db
+        """
         super().__init__(platform="twitter")
         
-        self.auth_token = auth_token or os.getenv("TWITTER_AUTH_TOKEN")
-        self.ct0 = ct0 or os.getenv("TWITTER_CT0")
+        if pool is None:
+            credentials = [{"name": "default", "auth_token": auth_token, "ct0": ct0}] if auth_token else None
+            pool = CredentialPool(credentials=credentials, language=language)
+        self.pool = pool
+        self.profile_cache = profile_cache or UserProfileCache()
+    
+    @property
+    def client(self):
+        """主账号的 twikit Client（兼容直接使用 client 的旧代码）"""
+        return self.pool.primary.client
+    
+    def flush(self):
+        """写入凭据池中尚未保存的限速状态（一轮抓取结束时调用）"""
+        self.pool.flush()
+    
+    async def _request(self, endpoint: str, call, max_retries: int = 2):
+        """
+        从凭据池取一个该接口额度最多的账号发请求
+        
+        429 或认证失败时记录到账号健康统计，并换一个账号重试；
+        所有账号额度都用尽时，acquire 会等到最早的窗口重置。
         
-        if not self.auth_token:
-            raise ValueError("需要提供 auth_token 或设置 TWITTER_AUTH_TOKEN 环境变量")
+        Args:
+            endpoint: GraphQL 接口名，如 SearchTimeline
+            call: 接收 twikit Client、返回协程的函数
+            max_retries: 最大重试次数
+        """
+        from twikit.errors import TooManyRequests, Unauthorized, Forbidden, AccountSuspended, AccountLocked
         
-        self.client = Client(language)
-        self.cookies = {
-            'auth_token': self.auth_token,
-            'ct0': self.ct0 if self.ct0 else 'dummy_ct0'
-        }
-        self._cookies_set = False
-    
-    async def _ensure_cookies(self):
-        """确保 cookies 已设置"""
-        if not self._cookies_set:
-            #print(f"DEBUG: Setting Cookies: auth_token={self.cookies.get('auth_token')}, ct0={self.cookies.get('ct0')}")
-            self.client.set_cookies(self.cookies)
-            self._cookies_set = True
+        for attempt in range(max_retries + 1):
+            credential: Credential = await self.pool.acquire(endpoint)
+            try:
+                result = await call(credential.client)
+            except TooManyRequests as e:
+                wait_time = self.pool.report_rate_limited(credential, endpoint, e)
+                if attempt >= max_retries:
+                    raise
+                if len(self.pool) > 1:
+                    print(f"⏳ 账号 {credential.name} 触发速率限制，换号重试 (第 {attempt + 1}/{max_retries} 次)...")
+                else:
+                    print(f"⏳ 触发速率限制，{wait_time:.0f} 秒后窗口重置再重试 (第 {attempt + 1}/{max_retries} 次)...")
+            except (Unauthorized, Forbidden, AccountSuspended, AccountLocked) as e:
+                self.pool.report_auth_error(credential, e)
+                if attempt >= max_retries:
+                    raise
+            except Exception as e:
+                self.pool.report_error(credential, e)
+                raise
+            else:
+                self.pool.report_success(credential)
+                return result
     
     async def scrape(
         self, 
         handle: str, 
         start_date: str = None, 
         end_date: str = None,
-        count: int = 20,
-        max_retries: int = 2,
-        base_delay: float = 30.0
+        count: int = None,
+        max_retries: int = 2
     ) -> List[Dict]:
         """
         抓取指定用户的推文 (使用 search_tweet 替代 get_user_tweets 以支持更灵活的时间过滤)
         
+        Args:
+            count: 最多返回的推文数（None = 抓完整个时间窗口，受翻页上限约束）
+        
+        需要知道窗口是否抓完时使用 scrape_window
+        """
+        results, _ = await self.scrape_window(
+            handle,
+            start_date=start_date,
+            end_date=end_date,
+            max_tweets=count,
+            max_retries=max_retries
+        )
+        return results
+    
+    async def scrape_window(
+        self,
+        handle: str,
+        start_date: str = None,
+        end_date: str = None,
+        max_pages: int = None,
+        max_tweets: int = None,
+        page_size: int = 20,
+        max_retries: int = 2
+    ) -> Tuple[List[Dict], bool]:
+        """
+        沿搜索游标 (.next()) 翻页，抓取 [start_date, end_date] 窗口内的全部推文
+        
+        Args:
+            handle: 用户名
+            start_date: 起始日期 (含)，默认最近30天
+            end_date: 结束日期 (含)，默认今天
+            max_pages: 翻页上限，默认读取 XSKILL_MAX_PAGES (10)
+            max_tweets: 推文数上限
+            page_size: 每页请求数量
+            max_retries: 单页遇到 429 时的最大重试次数
+        
+        Returns:
+            (results, complete)
+            complete 为 True 表示游标已翻到底，窗口内没有遗漏；
+            翻页上限、数量上限或请求失败导致提前停止时为 False
+        
         Rate Limiting:
-            - 遇到 429 错误时重试 2 次 (30s → 60s)
-            - 每次请求前添加随机延迟 (3-5秒)
+            - 每页请求前从 SearchTimeline 令牌桶取令牌，额度用尽时等待窗口重置
+            - 遇到 429 错误时最多重试 max_retries 次
+        """
+        start_date, end_date, date_filter = self._date_window(start_date, end_date)
+        query = f"from:{handle} {date_filter}"
+        
+        tweets, complete = await self._search_pages(
+            query, f"@{handle}", max_pages, max_tweets, page_size, max_retries
+        )
+        results = [self._tweet_to_content(tweet, handle) for tweet in tweets]
+        
+        # 二次日期过滤（双重保险，且 search_tweet 有时不精准）
+        # 注意：filter_by_date 需要与 publish_time 格式匹配
+        # 这里 publish_time 是 twikit 的字符串，filter_by_date 内部会解析
+        results = self.filter_by_date(results, start_date, end_date)
+        
+        return results, complete
+    
+    async def scrape_since(
+        self,
+        handle: str,
+        since_id: str,
+        max_pages: int = None,
+        page_size: int = 20,
+        max_retries: int = 2
+    ) -> Tuple[List[Dict], bool]:
+        """
+        增量抓取：只取比 since_id 更新的推文，遇到已知推文立即停止翻页
+        
+        热门博主的定时刷新通常一次请求即可完成，而不必重抓整天。
+        
+        Args:
+            handle: 用户名
+            since_id: 已入库的最新推文 ID（高水位）
+        
+        Returns:
+            (results, complete)，complete 为 True 表示已经衔接上 since_id
+        """
+        query = f"from:{handle} since_id:{since_id}"
+        
+        tweets, complete = await self._search_pages(
+            query, f"@{handle}", max_pages, None, page_size, max_retries, stop_at_id=since_id
+        )
+        return [self._tweet_to_content(tweet, handle) for tweet in tweets], complete
+    
+    async def scrape_batch(
+        self,
+        handles: List[str],
+        start_date: str = None,
+        end_date: str = None,
+        max_pages: int = None,
+        page_size: int = 20,
+        max_retries: int = 2
+    ) -> Tuple[Dict[str, List[Dict]], bool]:
+        """
+        用一个 (from:a OR from:b ...) 查询抓取多个低频博主的同一时间窗口
+        
+        handles 的查询长度需由调用方用 pack_handles 控制在上限以内。
+        结果按时间倒序混合返回，complete 的含义与 scrape_window 相同，
+        对批内所有博主一致。
+        
+        Returns:
+            ({handle: [推文, ...]}, complete)，每个博主都有键
         """
-        await self._ensure_cookies()
+        start_date, end_date, date_filter = self._date_window(start_date, end_date)
+        query = f"{self._or_clause(handles)} {date_filter}"
+        
+        tweets, complete = await self._search_pages(
+            query, f"{len(handles)} 个博主", max_pages, None, page_size, max_retries
+        )
         
-        # 构造查询语句 from:user since:YYYY-MM-DD until:YYYY-MM-DD
-        query = f"from:{handle}"
+        # 按作者拆分，作者名大小写与请求的 handle 对齐
+        by_lower = {handle.lower(): handle for handle in handles}
+        results = {handle: [] for handle in handles}
+        for tweet in tweets:
+            screen_name = getattr(getattr(tweet, 'user', None), 'screen_name', '') or ''
+            handle = by_lower.get(screen_name.lower())
+            if handle:
+                results[handle].append(self._tweet_to_content(tweet, handle))
         
+        for handle in handles:
+            results[handle] = self.filter_by_date(results[handle], start_date, end_date)
+        
+        return results, complete
+    
+    @staticmethod
+    def _or_clause(handles: List[str]) -> str:
+        if len(handles) == 1:
+            return f"from:{handles[0]}"
+        return "(" + " OR ".join(f"from:{handle}" for handle in handles) + ")"
+    
+    @classmethod
+    def pack_handles(
+        cls,
+        handles: List[str],
+        max_query_length: int = MAX_QUERY_LENGTH
+    ) -> List[List[str]]:
+        """
+        将博主按顺序装入若干组，每组拼出的 OR 查询（含日期条件）不超过长度上限
+        """
+        budget = max_query_length - len(" since:YYYY-MM-DD until:YYYY-MM-DD")
+        groups, current = [], []
+        for handle in handles:
+            if current and len(cls._or_clause(current + [handle])) > budget:
+                groups.append(current)
+                current = []
+            current.append(handle)
+        if current:
+            groups.append(current)
+        return groups
+    
+    def _date_window(self, start_date: str = None, end_date: str = None) -> Tuple[str, str, str]:
+        """
+        补全默认日期并生成 since/until 查询条件
+        
+        Returns:
+            (start_date, end_date, "since:... until:...")
+        """
         # 使用传入的 start_date，如果没有则默认最近30天，确保 query 完整
         if not start_date:
             start_date = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
-        query += f" since:{start_date}"
         
-        # until 参数处理：如果不传，默认包含今天（直到明天）
+        # until 参数处理：如果不传，默认包含今天
         if not end_date:
-            end_date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+            end_date = datetime.now().strftime("%Y-%m-%d")
         
-        # 注意：search_tweet 的 until 是不包含的
-        query += f" until:{end_date}"
+        # 注意：search_tweet 的 until 是不包含的，而 end_date 是包含的
+        until = (datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        return start_date, end_date, f"since:{start_date} until:{until}"
+    
+    async def _search_pages(
+        self,
+        query: str,
+        label: str,
+        max_pages: int = None,
+        max_tweets: int = None,
+        page_size: int = 20,
+        max_retries: int = 2,
+        stop_at_id: str = None
+    ) -> Tuple[list, bool]:
+        """
+        执行搜索并沿游标翻页，返回去重后的 twikit Tweet 列表与是否翻到底
+        
+        stop_at_id: 遇到 ID 不大于它的推文即视为翻到底（增量抓取）
+        """
+        if max_pages is None:
+            max_pages = int(os.getenv("XSKILL_MAX_PAGES", "10"))
         
         print(f"🔍 执行搜索: {query}")
         
-        # 重试逻辑
-        import random
         from twikit.errors import TooManyRequests
         
-        for attempt in range(max_retries + 1):
-            try:
-                # 每次请求前添加随机延迟，避免过于频繁
-                if attempt > 0 or hasattr(self, '_last_request_time'):
-                    delay = random.uniform(3.0, 5.0)
-                    await asyncio.sleep(delay)
-                
-                self._last_request_time = datetime.now()
-                
-                # 使用 search_tweet (product='Latest' 按时间排序)
-                tweets = await self.client.search_tweet(query, product='Latest', count=count)
+        tweets = []
+        seen_ids = set()
+        complete = False
+        page_count = 0
+        
+        try:
+            cursor = None
+            while True:
+                # 使用 search_tweet (product='Latest' 按时间倒序)；游标与账号无关，每页都可换号
+                page = await self._request(
+                    "SearchTimeline",
+                    lambda client: client.search_tweet(query, product='Latest', count=page_size, cursor=cursor),
+                    max_retries
+                )
+                page_count += 1
                 
-                # 转换为标准格式
-                results = []
-                if tweets:
-                    for tweet in tweets:
-                        # 尝试解析 URL
-                        try:
-                            url = f"https://x.com/{handle}/status/{tweet.id}"
-                        except:
-                            url = ""
-                        
-                        # 尝试安全获取属性
-                        favorite_count = getattr(tweet, 'favorite_count', 0)
-                        retweet_count = getattr(tweet, 'retweet_count', 0)
-                        reply_count = getattr(tweet, 'reply_count', 0)
-                        quote_count = getattr(tweet, 'quote_count', 0) # 新增引用数
-                        view_count = getattr(tweet, 'view_count', 0)
-                        if view_count is None: view_count = 0
-                        lang = getattr(tweet, 'lang', '')
-                        
-                        # 获取作者信息 (tweet.user 属性)
-                        user_name = handle
-                        followers_count = 0
-                        if hasattr(tweet, 'user'):
-                             user_name = getattr(tweet.user, 'name', handle)
-                             followers_count = getattr(tweet.user, 'followers_count', 0)
-
-                        content = {
-                            "content_id": tweet.id,
-                            "author": handle,
-                            "author_name": user_name,
-                            "text": tweet.text,
-                            "publish_time": self._parse_twitter_time(tweet.created_at), # twikit 返回的是格式化好的时间字符串
-                            "url": url,
-                            "platform": "twitter",
-                            "metrics": {
-                                "likes": favorite_count,
-                                "retweets": retweet_count,
-                                "replies": reply_count,
-                                "quotes": quote_count,
-                                "views": view_count,
-                            },
-                            "lang": lang,
-                            "is_retweet": str(tweet.text).startswith("RT @"), # 简单判断
-                            "metadata": {
-                                "raw_created_at": str(tweet.created_at),
-                                "author_followers": followers_count
-                            }
-                        }
-                        results.append(content)
+                # 游标重复返回的推文跳过
+                new_items = 0
+                reached_known = False
+                for tweet in page or []:
+                    if stop_at_id and int(tweet.id) <= int(stop_at_id):
+                        reached_known = True
+                        continue
+                    if tweet.id in seen_ids:
+                        continue
+                    seen_ids.add(tweet.id)
+                    tweets.append(tweet)
+                    new_items += 1
                 
-                # 二次日期过滤（双重保险，且 search_tweet 有时不精准）
-                # 注意：filter_by_date 需要与 publish_time 格式匹配
-                # 这里 publish_time 是 twikit 的字符串，filter_by_date 内部会解析
-                if start_date or end_date:
-                    # 传入简单的日期字符串用于比较
-                    results = self.filter_by_date(results, start_date, end_date)
+                # 一整页都没有新推文、已衔接上已知推文或没有下一页，说明游标已到底
+                cursor = getattr(page, 'next_cursor', None)
+                if new_items == 0 or reached_known or not cursor:
+                    complete = True
+                    break
                 
-                return results
+                if max_tweets and len(tweets) >= max_tweets:
+                    tweets = tweets[:max_tweets]
+                    break
                 
-            except TooManyRequests as e:
-                if attempt < max_retries:
-                    # 指数退避: 30s → 60s
-                    wait_time = base_delay * (2 ** attempt)
-                    
-                    # 尝试从响应头获取重置时间
-                    if hasattr(e, 'headers') and e.headers:
-                        reset_time = e.headers.get('x-rate-limit-reset')
-                        if reset_time:
-                            try:
-                                reset_dt = datetime.fromtimestamp(int(reset_time))
-                                wait_time = max(wait_time, (reset_dt - datetime.now()).total_seconds() + 5)
-                            except:
-                                pass
-                    
-                    print(f"⏳ 触发速率限制，等待 {wait_time:.0f} 秒后重试 (第 {attempt + 1}/{max_retries} 次)...")
-                    await asyncio.sleep(wait_time)
-                else:
-                    print(f"❌ 抓取 @{handle} 失败: 达到最大重试次数 ({max_retries})")
-                    return []
-                    
-            except Exception as e:
-                print(f"❌ 抓取 @{handle} 失败: {e}")
-                import traceback
-                traceback.print_exc()
-                return []
+                if page_count >= max_pages:
+                    print(f"   ⚠️ {label} 达到翻页上限 ({max_pages} 页)，窗口未抓完")
+                    break
         
-        return []
-    
-    async def validate_credentials(self) -> bool:
-        """验证 Twitter 凭据是否有效"""
-        await self._ensure_cookies()
+        except TooManyRequests:
+            print(f"❌ 抓取 {label} 失败: 达到最大重试次数 ({max_retries})，保留已获取的 {len(tweets)} 条")
         
-        try:
-            # 尝试获取自己的信息作为验证
-            me = await self.client.get_user_by_screen_name("twitter")
-            return me is not None
         except Exception as e:
-            print(f"❌ 凭据验证失败: {e}")
-            return False
+            print(f"❌ 抓取 {label} 失败: {e}")
+            import traceback
+            traceback.print_exc()
+        
+        return tweets, complete
+    
+    def _tweet_to_content(self, tweet, handle: str) -> Dict:
+        """将 twikit Tweet 转换为标准内容格式"""
+        # 尝试解析 URL
+        try:
+            url = f"https://x.com/{handle}/status/{tweet.id}"
+        except:
+            url = ""
+        
+        # 尝试安全获取属性
+        favorite_count = getattr(tweet, 'favorite_count', 0)
+        retweet_count = getattr(tweet, 'retweet_count', 0)
+        reply_count = getattr(tweet, 'reply_count', 0)
+        quote_count = getattr(tweet, 'quote_count', 0) # 新增引用数
+        view_count = getattr(tweet, 'view_count', 0)
+        if view_count is None: view_count = 0
+        lang = getattr(tweet, 'lang', '')
+        
+        # 获取作者信息 (tweet.user 属性)
+        user_name = handle
+        followers_count = 0
+        if hasattr(tweet, 'user'):
+             user_name = getattr(tweet.user, 'name', handle)
+             followers_count = getattr(tweet.user, 'followers_count', 0)
+
+        return {
+            "content_id": tweet.id,
+            "author": handle,
+            "author_name": user_name,
+            "text": tweet.text,
+            "publish_time": self._parse_twitter_time(tweet.created_at), # twikit 返回的是格式化好的时间字符串
+            "url": url,
+            "platform": "twitter",
+            "metrics": {
+                "likes": favorite_count,
+                "retweets": retweet_count,
+                "replies": reply_count,
+                "quotes": quote_count,
+                "views": view_count,
+            },
+            "lang": lang,
+            "is_retweet": str(tweet.text).startswith("RT @"), # 简单判断
+            "metadata": {
+                "raw_created_at": str(tweet.created_at),
+                "author_followers": followers_count
+            }
+        }
+    
+    async def validate_credentials(self, max_age: int = 3600) -> bool:
+        """
+        逐个验证凭据池中的账号，至少一个有效即返回 True
+        
+        Args:
+            max_age: 该时间（秒）内验证通过或成功请求过的账号不再重复验证
+        """
+        from twikit.errors import TooManyRequests
+        
+        valid = 0
+        for credential in self.pool.credentials:
+            # 本进程内已有成功请求，或近期验证通过过，无需再消耗额度
+            if credential.successes or self.profile_cache.credential_recently_valid(credential.auth_token, max_age):
+                valid += 1
+                continue
+            
+            try:
+                # 尝试获取一个公开账号的信息作为验证
+                await credential.limiter.acquire("UserByScreenName")
+                credential.requests += 1
+                me = await credential.client.get_user_by_screen_name("twitter")
+                if me is not None:
+                    self.pool.report_success(credential)
+                    self.profile_cache.put(self._user_to_profile(me))
+                    self.profile_cache.record_credential_check(credential.auth_token, True)
+                    valid += 1
+            except TooManyRequests as e:
+                # 被限速说明凭据本身有效
+                self.pool.report_rate_limited(credential, "UserByScreenName", e)
+                valid += 1
+            except Exception as e:
+                self.pool.report_auth_error(credential, e)
+                self.profile_cache.record_credential_check(credential.auth_token, False)
+                print(f"❌ 账号 {credential.name} 凭据验证失败: {e}")
+        
+        if len(self.pool) > 1:
+            print(f"🔑 {valid}/{len(self.pool)} 个账号凭据有效")
+        return valid > 0
     
     def _parse_twitter_time(self, twitter_time) -> str:
         """
@@ -227,40 +465,59 @@ class XScraper(BaseScraper):
         # 无法解析，返回当前时间
         return datetime.now().isoformat()
     
-    async def get_user_info(self, handle: str) -> Optional[Dict]:
-        """获取用户详细信息"""
-        await self._ensure_cookies()
+    async def get_user_info(self, handle: str, refresh: bool = False) -> Optional[Dict]:
+        """
+        获取用户详细信息（优先读缓存）
+        
+        Args:
+            handle: 用户名
+            refresh: 忽略缓存强制请求
+        """
+        if not refresh:
+            cached = self.profile_cache.get(handle)
+            if cached:
+                return cached
         
         try:
-            user = await self.client.get_user_by_screen_name(handle)
-            return {
-                "id": user.id,
-                "name": user.name,
-                "screen_name": user.screen_name,
-                "description": getattr(user, 'description', ''),
-                "followers_count": getattr(user, 'followers_count', 0),
-                "following_count": getattr(user, 'following_count', 0),
-                "verified": getattr(user, 'verified', False)
-            }
+            user = await self._request(
+                "UserByScreenName",
+                lambda client: client.get_user_by_screen_name(handle)
+            )
+            profile = self._user_to_profile(user)
+            self.profile_cache.put(profile)
+            return profile
         except Exception as e:
             print(f"❌ 获取用户信息失败: {e}")
             return None
     
+    @staticmethod
+    def _user_to_profile(user) -> Dict:
+        """将 twikit User 转换为用户资料"""
+        return {
+            "id": user.id,
+            "name": user.name,
+            "screen_name": user.screen_name,
+            "description": getattr(user, 'description', ''),
+            "followers_count": getattr(user, 'followers_count', 0),
+            "following_count": getattr(user, 'following_count', 0),
+            "verified": getattr(user, 'verified', False)
+        }
+    
     async def get_user_following(
         self,
         screen_name: str,
         count: int = None,
-        max_retries: int = 2,
-        base_delay: float = 30.0
+        max_retries: int = 2
     ) -> List[Dict]:
         """
         获取用户的 following 列表（支持分页获取全部）
         
+        全部结果保存在内存中；大列表需要断点续抓时使用 iter_following_pages。
+        
         Args:
             screen_name: 用户名
             count: 获取数量（None = 全部，否则限制最大数量）
             max_retries: 最大重试次数
-            base_delay: 基础延迟时间（秒）
         
         Returns:
             [
@@ -273,143 +530,105 @@ class XScraper(BaseScraper):
                 }
             ]
         """
-        await self._ensure_cookies()
-        
-        import random
         from twikit.errors import TooManyRequests
         
         all_results = []
-        
-        for attempt in range(max_retries + 1):
-            try:
-                # 添加随机延迟
-                if attempt > 0 or hasattr(self, '_last_request_time'):
-                    delay = random.uniform(3.0, 5.0)
-                    await asyncio.sleep(delay)
-                
-                self._last_request_time = datetime.now()
-                
-                # 获取用户对象
-                user = await self.client.get_user_by_screen_name(screen_name)
-                
-                # 获取第一页 following
-                following_result = await user.get_following(count=20)
-                
-                # 处理第一页
-                page_size = 0
-                for following_user in following_result:
-                    user_info = {
-                        "screen_name": following_user.screen_name,
-                        "name": following_user.name,
-                        "description": getattr(following_user, 'description', ''),
-                        "followers_count": getattr(following_user, 'followers_count', 0),
-                        "following_count": getattr(following_user, 'following_count', 0),
-                        "verified": getattr(following_user, 'verified', False),
-                        "url": f"https://x.com/{following_user.screen_name}"
-                    }
-                    all_results.append(user_info)
-                    page_size += 1
-                    
-                    # 如果设置了 count 限制，检查是否达到
-                    if count and len(all_results) >= count:
-                        return all_results[:count]
-                
-                print(f"      第 1 页: {page_size} 个，累计 {len(all_results)} 个")
-                
-                # 分页获取剩余数据
-                page_count = 1
-                consecutive_empty_pages = 0 if page_size > 0 else 1
-                
-                while True:
-                    # 检查是否还有下一页
-                    if not hasattr(following_result, 'next') or following_result.next is None:
-                        print(f"      ✅ 已获取全部数据")
-                        break
-                    
-                    # 检查连续空页数
-                    if consecutive_empty_pages >= 5:
-                        print(f"      ✅ 连续 5 页无数据，停止获取")
-                        break
-                    
-                    # 添加分页延迟
-                    await asyncio.sleep(random.uniform(2.0, 4.0))
-                    
-                    try:
-                        # 获取下一页
-                        following_result = await following_result.next()
-                        page_count += 1
-                        
-                        # 处理这一页的数据
-                        page_size = 0
-                        for following_user in following_result:
-                            user_info = {
-                                "screen_name": following_user.screen_name,
-                                "name": following_user.name,
-                                "description": getattr(following_user, 'description', ''),
-                                "followers_count": getattr(following_user, 'followers_count', 0),
-                                "following_count": getattr(following_user, 'following_count', 0),
-                                "verified": getattr(following_user, 'verified', False),
-                                "url": f"https://x.com/{following_user.screen_name}"
-                            }
-                            all_results.append(user_info)
-                            page_size += 1
-                            
-                            # 如果设置了 count 限制，检查是否达到
-                            if count and len(all_results) >= count:
-                                return all_results[:count]
-                        
-                        # 更新连续空页计数
-                        if page_size == 0:
-                            consecutive_empty_pages += 1
-                        else:
-                            consecutive_empty_pages = 0
-                        
-                        # 每 10 页显示一次进度
-                        if page_count % 10 == 0:
-                            print(f"      第 {page_count} 页: {page_size} 个，累计 {len(all_results)} 个")
-                    
-                    except TooManyRequests as e:
-                        # 分页过程中遇到速率限制，等待后继续
-                        wait_time = 60.0
-                        print(f"      ⏳ 分页时触发速率限制，等待 {wait_time:.0f} 秒...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    except Exception as e:
-                        # 分页失败，返回已获取的数据
-                        print(f"      ⚠️ 分页获取失败: {e}，返回已获取的 {len(all_results)} 个")
-                        break
-                
-                return all_results
+        try:
+            async for users, _ in self.iter_following_pages(screen_name, max_retries=max_retries):
+                all_results.extend(users)
                 
-            except TooManyRequests as e:
-                if attempt < max_retries:
-                    wait_time = base_delay * (2 ** attempt)
-                    
-                    # 尝试从响应头获取重置时间
-                    if hasattr(e, 'headers') and e.headers:
-                        reset_time = e.headers.get('x-rate-limit-reset')
-                        if reset_time:
-                            try:
-                                reset_dt = datetime.fromtimestamp(int(reset_time))
-                                wait_time = max(wait_time, (reset_dt - datetime.now()).total_seconds() + 5)
-                            except:
-                                pass
-                    
-                    print(f"⏳ 触发速率限制，等待 {wait_time:.0f} 秒后重试 (第 {attempt + 1}/{max_retries} 次)...")
-                    await asyncio.sleep(wait_time)
-                else:
-                    print(f"❌ 获取 @{screen_name} 的 following 失败: 达到最大重试次数")
-                    return []
-                    
-            except Exception as e:
-                print(f"❌ 获取 @{screen_name} 的 following 失败: {e}")
-                import traceback
-                traceback.print_exc()
-                return []
+                # 如果设置了 count 限制，检查是否达到
+                if count and len(all_results) >= count:
+                    return all_results[:count]
+        except TooManyRequests:
+            print(f"      ⚠️ 分页时多次触发速率限制，返回已获取的 {len(all_results)} 个")
+        except Exception as e:
+            # 分页失败，返回已获取的数据
+            print(f"      ⚠️ 分页获取失败: {e}，返回已获取的 {len(all_results)} 个")
         
-        return []
-
-
+        return all_results
+    
+    async def iter_following_pages(
+        self,
+        screen_name: str,
+        cursor: str = None,
+        user_id: str = None,
+        max_retries: int = 2
+    ):
+        """
+        逐页获取 following，每页产出 (users, next_cursor)
+        
+        调用方可以在每页之后持久化 next_cursor，中断后传入 cursor 从该页继续。
+        最后一页的 next_cursor 为 None。请求失败时异常直接抛出，由调用方保存断点。
+        
+        Args:
+            screen_name: 用户名
+            cursor: 起始游标（None = 从第一页开始）
+            user_id: 已知的用户 ID，省去一次查询
+            max_retries: 单页最大重试次数
+        """
+        # screen_name → user_id，缓存命中时不消耗 UserByScreenName 额度
+        if user_id is None:
+            profile = await self.get_user_info(screen_name)
+            if not profile:
+                raise ValueError(f"无法解析 @{screen_name} 的用户 ID")
+            user_id = profile["id"]
+        
+        # 沿游标分页获取，每页都可以换账号
+        page_count = 0
+        total = 0
+        consecutive_empty_pages = 0
+        
+        while True:
+            following_result = await self._request(
+                "Following",
+                lambda client: client.get_user_following(user_id, count=20, cursor=cursor),
+                max_retries
+            )
+            page_count += 1
+            
+            # 处理这一页的数据，返回的用户资料顺带写入缓存
+            page_users = list(following_result)
+            self.profile_cache.put_many([self._user_to_profile(u) for u in page_users])
+            users = [self._following_to_info(u) for u in page_users]
+            total += len(users)
+            
+            # 第 1 页及之后每 10 页显示一次进度
+            if page_count == 1 or page_count % 10 == 0:
+                print(f"      @{screen_name} 第 {page_count} 页: {len(users)} 个，累计 {total} 个")
+            
+            # 更新连续空页计数
+            if users:
+                consecutive_empty_pages = 0
+            else:
+                consecutive_empty_pages += 1
+            
+            # 检查是否还有下一页
+            cursor = getattr(following_result, 'next_cursor', None)
+            if not cursor:
+                print(f"      ✅ @{screen_name} 已获取全部数据")
+            elif consecutive_empty_pages >= 5:
+                # 检查连续空页数
+                print(f"      ✅ @{screen_name} 连续 5 页无数据，停止获取")
+                cursor = None
+            
+            yield users, cursor
+            if not cursor:
+                return
+    
+    @staticmethod
+    def _following_to_info(following_user) -> Dict:
+        """将 twikit User 转换为 following 列表项"""
+        return {
+            "id": following_user.id,
+            "screen_name": following_user.screen_name,
+            "name": following_user.name,
+            "description": getattr(following_user, 'description', ''),
+            "followers_count": getattr(following_user, 'followers_count', 0),
+            "following_count": getattr(following_user, 'following_count', 0),
+            "verified": getattr(following_user, 'verified', False),
+            "url": f"https://x.com/{following_user.screen_name}"
+        }
 
 
 # ==================== 兼容性别名 ====================
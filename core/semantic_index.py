@@ -0,0 +1,102 @@
+"""
+semantic_index.py - 账号本地检索索引
+
+核心职责:
+1. 在账号名称、screen_name 与简介上构建 TF-IDF 稀疏矩阵 (SciPy CSC)
+   词项与 AccountIndex 一致：拉丁单词 + 中文二字组合
+2. 余弦相似度 top-k 检索，用于直接回答描述性查询（"做具身智能的那个创业者"）
+3. 需要 LLM 时，只把 top-k 候选放进提示词，而不是账号池的前 50 个
+"""
+
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .account_registry import AccountIndex, tokenize
+
+
+class SemanticIndex:
+    """
+    TF-IDF 检索索引
+
+    直接复用 AccountIndex 的倒排表：每个词项的账号序号列表就是一列，
+    拼接后即为 CSC 矩阵，构建几乎没有额外开销。词频取二值（简介很短），
+    权重为平滑 IDF，行向量 L2 归一化后点积即余弦相似度。
+    """
+
+    def __init__(self, account_index: AccountIndex):
+        self.accounts = account_index.accounts
+        postings = account_index.token_postings()
+        n_docs = len(self.accounts)
+
+        self.vocabulary: Dict[str, int] = {term: col for col, term in enumerate(postings)}
+        df = np.array([len(ids) for ids in postings.values()], dtype=np.float64)
+        self.idf = np.log((1 + n_docs) / (1 + df)) + 1
+
+        indptr = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        indices = (
+            np.concatenate([np.asarray(ids, dtype=np.int32) for ids in postings.values()])
+            if postings else np.array([], dtype=np.int32)
+        )
+        data = np.repeat(self.idf, df.astype(np.int64))
+        matrix = sparse.csc_matrix((data, indices, indptr), shape=(n_docs, len(postings)))
+
+        # 行归一化：每个账号向量长度为 1
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        self.matrix = sparse.csc_matrix(sparse.diags(1.0 / norms) @ matrix)
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[Dict, float]]:
+        """
+        余弦相似度检索
+
+        Args:
+            query: 自然语言查询
+            top_k: 返回数量
+
+        Returns:
+            [(账号, 相似度 0-1), ...]，按相似度降序，只含相似度 > 0 的账号
+        """
+        cols = [self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary]
+        if not cols or top_k <= 0:
+            return []
+
+        # 查询向量同样二值 TF × IDF 并归一化；只取查询涉及的列做稀疏乘法
+        cols = np.array(sorted(cols))
+        weights = self.idf[cols] / math.sqrt(float(np.sum(self.idf[cols] ** 2)))
+        scores = np.asarray(self.matrix[:, cols] @ weights).ravel()
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(self.accounts[i], float(scores[i])) for i in candidates]
+
+
+# 测试代码
+if __name__ == "__main__":
+    import time
+
+    accounts = [
+        {"name": f"User {i}", "screen_name": f"user{i}", "description": f"分享投资与创业心得 #{i % 50}"}
+        for i in range(50_000)
+    ] + [
+        {"name": "Brett Adcock", "screen_name": "adcock_brett", "description": "Founder of Figure, 具身智能人形机器人创业者"},
+        {"name": "Andrej Karpathy", "screen_name": "karpathy", "description": "AI researcher, 前特斯拉 AI 负责人"},
+    ]
+    start = time.time()
+    account_index = AccountIndex(accounts)
+    built = time.time()
+    index = SemanticIndex(account_index)
+    print(f"AccountIndex {built - start:.2f}s，TF-IDF 矩阵 {time.time() - built:.2f}s，形状 {index.matrix.shape}")
+
+    for query in ["做具身智能的那个创业者", "特斯拉 AI 负责人", "humanoid robot founder"]:
+        t = time.perf_counter()
+        hits = index.search(query, top_k=3)
+        elapsed = (time.perf_counter() - t) * 1000
+        print(f"{query!r}: {[(acc['screen_name'], round(score, 3)) for acc, score in hits]} {elapsed:.2f} ms")
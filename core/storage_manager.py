@@ -3,22 +3,120 @@ storage_manager.py - 存储管理与时间缝隙补全
 
 核心职责:
 1. 维护 SQLite 数据库 (raw_content.db)
-2. 管理时间覆盖日志 (manifest.json)
+2. 管理时间覆盖日志 (coverage 表，旧版 manifest.json 会被一次性导入)
 3. 计算数据缺口并合并区间
+
+所有模块通过 StorageManager.db (ConnectionManager) 访问数据库，
+写入走长连接事务，读取走只读连接池。
 """
 
 import json
 import os
+import re
 import sqlite3
-from datetime import datetime, timedelta
-from typing import List, Tuple, Optional, Union
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, List, Tuple, Optional, Union
 from pathlib import Path
 
+from .connection_manager import ConnectionManager
+
+
+def _to_epoch(publish_time) -> int:
+    """
+    将发布时间解析为 UTC epoch 秒
+    
+    兼容 ISO 格式（带或不带时区、Z 后缀）、Twitter 原始格式与纯日期；
+    不带时区的时间按 UTC 处理，无法解析时返回 0，保证列非空以便走索引。
+    """
+    if not publish_time:
+        return 0
+    if isinstance(publish_time, datetime):
+        dt = publish_time
+    else:
+        text = str(publish_time).strip()
+        try:
+            dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            try:
+                dt = datetime.strptime(text, "%a %b %d %H:%M:%S %z %Y")
+            except ValueError:
+                return 0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _day_start_epoch(date_str: str) -> int:
+    """YYYY-MM-DD 当天 00:00 UTC 的 epoch 秒"""
+    return int(datetime.strptime(date_str[:10], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+
+def _to_ordinal(date_str: str) -> int:
+    """YYYY-MM-DD -> 序数日"""
+    return date.fromisoformat(date_str[:10]).toordinal()
+
+
+def _from_ordinal(ordinal: int) -> str:
+    """序数日 -> YYYY-MM-DD"""
+    return date.fromordinal(ordinal).isoformat()
+
+
+def _sweep_gaps(
+    stored: List[Tuple[int, int]],
+    req_start: int,
+    req_end: int
+) -> List[Tuple[int, int]]:
+    """
+    在请求区间 [req_start, req_end] 内扫描出未被 stored 覆盖的片段
+    
+    Args:
+        stored: 已覆盖的闭区间 (序数日)，按起始日排序
+        req_start: 请求起始序数日
+        req_end: 请求结束序数日
+    """
+    missing = []
+    current = req_start
+    
+    for s_start, s_end in stored:
+        # 如果当前指针已经超过请求结束，停止
+        if current > req_end:
+            break
+        
+        # 存储区间在请求区间之前，跳过
+        if s_end < current:
+            continue
+        
+        # 存储区间在当前指针之后，记录缺口到存储开始
+        if s_start > current:
+            gap_end = min(s_start - 1, req_end)
+            if gap_end >= current:
+                missing.append((current, gap_end))
+        
+        # 更新当前指针到已存储区间结束的下一天
+        current = max(current, s_end + 1)
+    
+    # 检查尾部缺口
+    if current <= req_end:
+        missing.append((current, req_end))
+    
+    return missing
+
 
 class StorageManager:
     """存储管理器：维护 SQLite 数据库与时间窗口覆盖日志"""
     
-    def __init__(self, data_dir: str = None):
+    def __init__(
+        self,
+        data_dir: str = None,
+        db_profile: str = None,
+        reader_pool_size: int = 4
+    ):
+        """
+        Args:
+            data_dir: 数据目录，默认为项目 data/
+            db_profile: PRAGMA 档位 (safe / balanced / fast)，默认读取 XSKILL_DB_PROFILE
+            reader_pool_size: 只读连接池大小
+        """
         if data_dir is None:
             data_dir = Path(__file__).parent.parent / "data"
         self.data_dir = Path(data_dir)
@@ -27,12 +125,32 @@ class StorageManager:
         self.db_path = self.data_dir / "raw_content.db"
         self.manifest_path = self.data_dir / "manifest.json"
         
+        self.db = ConnectionManager(
+            self.db_path,
+            profile=db_profile or os.getenv("XSKILL_DB_PROFILE", "balanced"),
+            pool_size=reader_pool_size
+        )
+        
         self._init_database()
-        self._init_manifest()
+        self._import_manifest()
+    
+    def close(self):
+        """关闭数据库连接"""
+        self.db.close()
     
     def _init_database(self):
         """初始化 SQLite 数据库"""
-        conn = sqlite3.connect(self.db_path)
+        with self.db.transaction() as conn:
+            self._create_tables(conn)
+        
+        # 尝试迁移（针对旧表结构）
+        self._migrate_database()
+        
+        # 全文索引
+        self.fts_enabled = self._init_fulltext_index()
+    
+    def _create_tables(self, conn: sqlite3.Connection):
+        """建表与索引"""
         cursor = conn.cursor()
         
         # 创建表 (包含新字段)
@@ -55,7 +173,10 @@ class StorageManager:
                 quote_count INTEGER DEFAULT 0,
                 view_count INTEGER DEFAULT 0,
                 lang TEXT,
-                author_followers INTEGER DEFAULT 0
+                author_followers INTEGER DEFAULT 0,
+                
+                -- 发布时间 (UTC epoch 秒)，所有日期过滤与排序都基于它
+                publish_time_epoch INTEGER
             )
         ''')
         
@@ -75,17 +196,28 @@ class StorageManager:
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        # 创建时间覆盖区间表 (闭区间，日期格式 YYYY-MM-DD，同一博主的区间互不重叠)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS coverage (
+                handle TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_coverage_handle_start ON coverage(handle, start_date)')
         
-        # 尝试迁移（针对旧表结构）
-        self._migrate_database()
+        # 增量抓取高水位：checked_at 之前发布的推文已完整入库，tweet_id 为其中最新一条
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS high_water_marks (
+                handle TEXT PRIMARY KEY,
+                tweet_id TEXT,
+                publish_time_epoch INTEGER,
+                checked_at INTEGER NOT NULL
+            )
+        ''')
         
     def _migrate_database(self):
         """迁移数据库结构"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         columns_to_add = [
             ("like_count", "INTEGER DEFAULT 0"),
             ("retweet_count", "INTEGER DEFAULT 0"),
@@ -93,94 +225,254 @@ class StorageManager:
             ("quote_count", "INTEGER DEFAULT 0"),
             ("view_count", "INTEGER DEFAULT 0"),
             ("lang", "TEXT"),
-            ("author_followers", "INTEGER DEFAULT 0")
+            ("author_followers", "INTEGER DEFAULT 0"),
+            ("publish_time_epoch", "INTEGER")
         ]
         
         try:
-            # 获取现有列
-            cursor.execute("PRAGMA table_info(content)")
-            existing_columns = {row[1] for row in cursor.fetchall()}
-            
-            for col_name, col_type in columns_to_add:
-                if col_name not in existing_columns:
-                    print(f"🔧 正在迁移数据库，添加列: {col_name}")
-                    cursor.execute(f"ALTER TABLE content ADD COLUMN {col_name} {col_type}")
-            
-            conn.commit()
+            with self.db.transaction() as conn:
+                # 获取现有列
+                existing_columns = {row[1] for row in conn.execute("PRAGMA table_info(content)")}
+                
+                for col_name, col_type in columns_to_add:
+                    if col_name not in existing_columns:
+                        print(f"🔧 正在迁移数据库，添加列: {col_name}")
+                        conn.execute(f"ALTER TABLE content ADD COLUMN {col_name} {col_type}")
+                
+                # 回填 publish_time_epoch（旧数据只有 ISO 文本时间）
+                self._backfill_publish_time_epoch(conn)
+                
+                # (author, publish_time_epoch, tweet_id) 覆盖日期过滤与键集分页
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_author_time_epoch
+                    ON content(author, publish_time_epoch, tweet_id)
+                ''')
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_time_epoch
+                    ON content(publish_time_epoch, tweet_id)
+                ''')
         except Exception as e:
             print(f"数据库迁移警告: {e}")
-        finally:
-            conn.close()
     
-    def _init_manifest(self):
-        """初始化时间覆盖日志"""
-        if not self.manifest_path.exists():
-            with open(self.manifest_path, 'w', encoding='utf-8') as f:
-                json.dump({}, f)
+    def _backfill_publish_time_epoch(self, conn: sqlite3.Connection, chunk_size: int = 5000):
+        """为 publish_time_epoch 为空的行解析并写入 UTC epoch"""
+        pending = conn.execute(
+            "SELECT COUNT(*) FROM content WHERE publish_time_epoch IS NULL"
+        ).fetchone()[0]
+        if not pending:
+            return
+        
+        print(f"🔧 正在迁移数据库，回填 {pending} 条推文的 publish_time_epoch")
+        last_id = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, publish_time FROM content
+                WHERE publish_time_epoch IS NULL AND id > ?
+                ORDER BY id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            conn.executemany(
+                "UPDATE content SET publish_time_epoch = ? WHERE id = ?",
+                [(_to_epoch(row[1]), row[0]) for row in rows]
+            )
+            last_id = rows[-1][0]
     
-    def _load_manifest(self) -> dict:
-        """加载 manifest.json"""
+    def _init_fulltext_index(self) -> bool:
+        """
+        创建 content.text 的 FTS5 全文索引 (trigram 分词，兼容中文)
+        
+        使用外部内容表 (content='content')，索引本身不重复存储正文，
+        由触发器与 content 表保持同步。首次创建时对已有数据做一次 rebuild。
+        
+        Returns:
+            当前 SQLite 是否支持 FTS5 trigram
+        """
+        try:
+            with self.db.transaction() as conn:
+                exists = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'content_fts'"
+                ).fetchone()
+                
+                conn.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
+                        text,
+                        content='content',
+                        content_rowid='id',
+                        tokenize='trigram'
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS content_fts_ai AFTER INSERT ON content BEGIN
+                        INSERT INTO content_fts(rowid, text) VALUES (new.id, new.text);
+                    END
+                ''')
+                conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS content_fts_ad AFTER DELETE ON content BEGIN
+                        INSERT INTO content_fts(content_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                    END
+                ''')
+                conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS content_fts_au AFTER UPDATE OF text ON content BEGIN
+                        INSERT INTO content_fts(content_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                        INSERT INTO content_fts(rowid, text) VALUES (new.id, new.text);
+                    END
+                ''')
+                
+                if not exists and conn.execute("SELECT 1 FROM content LIMIT 1").fetchone():
+                    print("🔧 正在为已有推文建立全文索引...")
+                    conn.execute("INSERT INTO content_fts(content_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ 当前 SQLite 不支持 FTS5 trigram，关键词搜索回退为 LIKE: {e}")
+            return False
+    
+    def rebuild_fulltext_index(self):
+        """重建全文索引（数据被外部工具修改后使用）"""
+        if not self.fts_enabled:
+            return
+        with self.db.transaction() as conn:
+            conn.execute("INSERT INTO content_fts(content_fts) VALUES ('rebuild')")
+    
+    @staticmethod
+    def _fts_phrase(keyword: str) -> str:
+        """将普通关键词转为 FTS5 短语查询（trigram 下即子串匹配）"""
+        return '"' + keyword.replace('"', '""') + '"'
+    
+    def _import_manifest(self):
+        """
+        一次性导入旧版 manifest.json 到 coverage 表
+        
+        导入在单个事务内完成，成功后将文件重命名为 manifest.json.imported，
+        之后的启动不会再读取它。
+        """
         if not self.manifest_path.exists():
-            return {}
-        with open(self.manifest_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            return
+        
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ 无法读取 manifest.json，跳过导入: {e}")
+            return
+        
+        with self.db.transaction():
+            for handle, ranges in manifest.items():
+                for start, end in ranges:
+                    self.update_manifest(handle, (start, end))
+        
+        imported_path = self.manifest_path.with_name(self.manifest_path.name + ".imported")
+        self.manifest_path.replace(imported_path)
+        if manifest:
+            print(f"🔧 已将 manifest.json 中 {len(manifest)} 个博主的覆盖区间导入数据库")
     
-    def _save_manifest(self, manifest: dict):
-        """保存 manifest.json"""
-        with open(self.manifest_path, 'w', encoding='utf-8') as f:
-            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    # 重复抓取时允许刷新的列：互动数据与元数据
+    # 其余列（正文、发布时间、标注字段等）在首次写入后保持不变
+    UPSERT_COLUMNS = (
+        'tweet_id', 'author', 'text', 'publish_time', 'url', 'platform', 'is_retweet',
+        'like_count', 'retweet_count', 'reply_count', 'quote_count', 'view_count',
+        'lang', 'author_followers', 'publish_time_epoch'
+    )
+    UPSERT_UPDATE_COLUMNS = (
+        'like_count', 'retweet_count', 'reply_count', 'quote_count', 'view_count',
+        'lang', 'author_followers'
+    )
     
-    def save_tweets(self, tweets: List[dict]) -> int:
+    def _tweet_to_row(self, tweet: dict) -> tuple:
+        """将推文字典转换为与 UPSERT_COLUMNS 对应的行"""
+        # 提取 metrics
+        metrics = tweet.get('metrics') or {}
+        metadata = tweet.get('metadata') or {}
+        publish_time = tweet.get('publish_time') or tweet.get('created_at')
+        
+        return (
+            tweet.get('content_id') or tweet.get('tweet_id'), # 兼容两种 key
+            tweet.get('author'),
+            tweet.get('text'),
+            publish_time,
+            tweet.get('url'),
+            tweet.get('platform', 'twitter'),
+            1 if tweet.get('is_retweet') else 0,
+            
+            # 新字段
+            metrics.get('likes', 0),
+            metrics.get('retweets', 0),
+            metrics.get('replies', 0),
+            metrics.get('quotes', 0),
+            metrics.get('views', 0),
+            tweet.get('lang', ''),
+            metadata.get('author_followers', 0),
+            _to_epoch(publish_time)
+        )
+    
+    def upsert_tweets(self, tweets: List[dict], chunk_size: int = 5000) -> Tuple[int, int]:
         """
-        保存推文到数据库
+        批量写入推文 (INSERT ... ON CONFLICT(tweet_id) DO UPDATE)
+        
+        已存在的推文只刷新互动数据与元数据列，不会删除重建行，
+        因此 id 与标注列保持不变。每个分块在一个事务内完成。
         
         Args:
             tweets: 推文列表
+            chunk_size: 每个事务写入的行数
             
         Returns:
-            成功插入的数量
+            (inserted, updated): 新增数量与更新数量
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # 按 tweet_id 去重，同一批内后出现的数据覆盖先出现的
+        rows_by_id = {}
+        for tweet in tweets:
+            row = self._tweet_to_row(tweet)
+            if not row[0] or not row[1]:
+                print(f"Error inserting tweet {row[0]}: 缺少 tweet_id 或 author")
+                continue
+            rows_by_id[str(row[0])] = (str(row[0]),) + row[1:]
+        rows = list(rows_by_id.values())
+        
+        columns = ', '.join(self.UPSERT_COLUMNS)
+        placeholders = ', '.join(['?'] * len(self.UPSERT_COLUMNS))
+        update_clause = ', '.join(f"{col} = excluded.{col}" for col in self.UPSERT_UPDATE_COLUMNS)
+        sql = f'''
+            INSERT INTO content ({columns})
+            VALUES ({placeholders})
+            ON CONFLICT(tweet_id) DO UPDATE SET {update_clause}
+        '''
         
         inserted = 0
-        for tweet in tweets:
-            try:
-                # 提取 metrics
-                metrics = tweet.get('metrics', {})
-                metadata = tweet.get('metadata', {})
+        updated = 0
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            ids = [row[0] for row in chunk]
+            
+            with self.db.transaction() as conn:
+                # 在同一事务内统计已存在的行，保证计数准确
+                existing = 0
+                for j in range(0, len(ids), 500):
+                    part = ids[j:j + 500]
+                    existing += conn.execute(
+                        f"SELECT COUNT(*) FROM content WHERE tweet_id IN ({', '.join(['?'] * len(part))})",
+                        part
+                    ).fetchone()[0]
                 
-                cursor.execute('''
-                    INSERT OR REPLACE INTO content 
-                    (tweet_id, author, text, publish_time, url, platform, is_retweet,
-                     like_count, retweet_count, reply_count, quote_count, view_count, lang, author_followers)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    tweet.get('content_id') or tweet.get('tweet_id'), # 兼容两种 key
-                    tweet.get('author'),
-                    tweet.get('text'),
-                    tweet.get('publish_time') or tweet.get('created_at'),
-                    tweet.get('url'),
-                    tweet.get('platform', 'twitter'),
-                    1 if tweet.get('is_retweet') else 0,
-                    
-                    # 新字段
-                    metrics.get('likes', 0),
-                    metrics.get('retweets', 0),
-                    metrics.get('replies', 0),
-                    metrics.get('quotes', 0),
-                    metrics.get('views', 0),
-                    tweet.get('lang', ''),
-                    metadata.get('author_followers', 0)
-                ))
-                if cursor.rowcount > 0:
-                    inserted += 1
-            except sqlite3.Error as e:
-                print(f"Error inserting tweet {tweet.get('content_id')}: {e}")
+                conn.executemany(sql, chunk)
+            
+            inserted += len(chunk) - existing
+            updated += existing
         
-        conn.commit()
-        conn.close()
-        return inserted
+        return inserted, updated
+    
+    def save_tweets(self, tweets: List[dict]) -> int:
+        """
+        保存推文到数据库
+        
+        Args:
+            tweets: 推文列表
+            
+        Returns:
+            写入的数量（新增 + 更新），明细请使用 upsert_tweets
+        """
+        inserted, updated = self.upsert_tweets(tweets)
+        return inserted + updated
     
     # ==================== Schema 管理方法 ====================
     
@@ -191,24 +483,19 @@ class StorageManager:
         Args:
             schema: Schema 定义字典
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO annotation_schemas (schema_name, description, fields_json)
-                VALUES (?, ?, ?)
-            ''', (
-                schema['schema_name'],
-                schema.get('description', ''),
-                json.dumps(schema['fields'], ensure_ascii=False)
-            ))
-            conn.commit()
+            with self.db.transaction() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO annotation_schemas (schema_name, description, fields_json)
+                    VALUES (?, ?, ?)
+                ''', (
+                    schema['schema_name'],
+                    schema.get('description', ''),
+                    json.dumps(schema['fields'], ensure_ascii=False)
+                ))
             print(f"✅ Schema '{schema['schema_name']}' 已保存")
         except Exception as e:
             print(f"❌ 保存 Schema 失败: {e}")
-        finally:
-            conn.close()
     
     def load_schema(self, schema_name: str) -> dict:
         """
@@ -220,17 +507,12 @@ class StorageManager:
         Returns:
             Schema 定义字典，如果不存在返回 None
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT schema_name, description, fields_json
-            FROM annotation_schemas
-            WHERE schema_name = ?
-        ''', (schema_name,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self.db.reader() as conn:
+            row = conn.execute('''
+                SELECT schema_name, description, fields_json
+                FROM annotation_schemas
+                WHERE schema_name = ?
+            ''', (schema_name,)).fetchone()
         
         if not row:
             return None
@@ -248,17 +530,12 @@ class StorageManager:
         Returns:
             Schema 名称和描述的列表
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT schema_name, description, created_at
-            FROM annotation_schemas
-            ORDER BY created_at DESC
-        ''')
-        
-        rows = cursor.fetchall()
-        conn.close()
+        with self.db.reader() as conn:
+            rows = conn.execute('''
+                SELECT schema_name, description, created_at
+                FROM annotation_schemas
+                ORDER BY created_at DESC
+            ''').fetchall()
         
         return [{
             'schema_name': row[0],
@@ -266,6 +543,145 @@ class StorageManager:
             'created_at': row[2]
         } for row in rows]
     
+    # ==================== 标注结果表 ====================
+    # 每个 Schema 一张窄表 annotations_<schema_name>，以 tweet_id 为主键，
+    # 通过 JOIN 与 content 组合读取，content 表宽度不随 Schema 数量增长
+    
+    ANNOTATION_SQL_TYPES = {
+        'integer': 'INTEGER',
+        'float': 'REAL',
+        'boolean': 'INTEGER',  # SQLite 用 0/1
+        'enum': 'TEXT',
+        'text': 'TEXT'
+    }
+    
+    def _annotation_table(self, schema_name: str) -> str:
+        """Schema 名称 -> 标注表名（名称会直接拼进 SQL，必须校验）"""
+        if not re.match(r'^[a-z][a-z0-9_]*$', schema_name or ''):
+            raise ValueError(f"Schema 名称不合法: {schema_name} (只允许小写字母、数字、下划线)")
+        return f"annotations_{schema_name}"
+    
+    def ensure_schema_table(self, schema: dict) -> str:
+        """
+        确保 Schema 对应的标注表存在，Schema 新增字段时补齐列
+        
+        Args:
+            schema: Schema 定义字典
+            
+        Returns:
+            标注表名
+        """
+        table = self._annotation_table(schema['schema_name'])
+        fields = schema['fields']
+        for field in fields:
+            if not re.match(r'^[a-z][a-z0-9_]*$', field['name']):
+                raise ValueError(f"字段名格式不合法: {field['name']}")
+        
+        with self.db.transaction() as conn:
+            column_defs = ", ".join(
+                f"{field['name']} {self.ANNOTATION_SQL_TYPES.get(field['type'], 'TEXT')}"
+                for field in fields
+            )
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    tweet_id TEXT PRIMARY KEY,
+                    {column_defs + "," if column_defs else ""}
+                    annotated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                ) WITHOUT ROWID
+            ''')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_annotated_at ON {table}(annotated_at)')
+            
+            existing_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for field in fields:
+                if field['name'] not in existing_columns:
+                    sql_type = self.ANNOTATION_SQL_TYPES.get(field['type'], 'TEXT')
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {field['name']} {sql_type}")
+        
+        return table
+    
+    def save_annotation_rows(self, schema: dict, rows: List[dict]) -> int:
+        """
+        写入标注结果（同一推文重复标注时覆盖旧结果）
+        
+        Args:
+            schema: Schema 定义字典
+            rows: 每项包含 tweet_id 与 Schema 中的字段值
+            
+        Returns:
+            写入的数量
+        """
+        table = self.ensure_schema_table(schema)
+        field_names = [field['name'] for field in schema['fields']]
+        columns = ['tweet_id'] + field_names
+        
+        update_clause = ", ".join(
+            [f"{name} = excluded.{name}" for name in field_names] + ["annotated_at = CURRENT_TIMESTAMP"]
+        )
+        sql = f'''
+            INSERT INTO {table} ({', '.join(columns)})
+            VALUES ({', '.join(['?'] * len(columns))})
+            ON CONFLICT(tweet_id) DO UPDATE SET {update_clause}
+        '''
+        
+        values = [
+            tuple([str(row['tweet_id'])] + [row.get(name) for name in field_names])
+            for row in rows if row.get('tweet_id')
+        ]
+        if not values:
+            return 0
+        
+        with self.db.transaction() as conn:
+            conn.executemany(sql, values)
+        return len(values)
+    
+    def get_annotated_tweets(
+        self,
+        schema_name: str,
+        author: Union[str, List[str], None] = None,
+        start_date: str = None,
+        end_date: str = None,
+        limit: int = None
+    ) -> List[dict]:
+        """
+        读取已标注的推文（content JOIN 标注表）
+        
+        Args:
+            schema_name: Schema 名称
+            author / start_date / end_date: 同 get_tweets
+            limit: 返回数量限制
+            
+        Returns:
+            推文字典列表，包含 content 列、Schema 字段与 annotated_at，按标注时间倒序
+        """
+        table = self._annotation_table(schema_name)
+        with self.db.reader() as conn:
+            if not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone():
+                return []
+        
+        from_clause, conditions, params, _ = self._build_tweet_filters(author, start_date, end_date)
+        annotation_columns = [
+            col for col in self._table_columns(table) if col != 'tweet_id'
+        ]
+        select_list = ", ".join(["content.*"] + [f"a.{col}" for col in annotation_columns])
+        
+        query = f"SELECT {select_list} FROM {from_clause} JOIN {table} a ON a.tweet_id = content.tweet_id"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY a.annotated_at DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        
+        with self.db.reader() as conn:
+            rows = conn.execute(query, params).fetchall()
+        
+        return [dict(row) for row in rows]
+    
+    def _table_columns(self, table: str) -> List[str]:
+        with self.db.reader() as conn:
+            return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    
     def get_column_names(self) -> set:
         """
         获取 content 表的所有列名
@@ -273,14 +689,67 @@ class StorageManager:
         Returns:
             列名集合
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.db.reader() as conn:
+            return {row[1] for row in conn.execute("PRAGMA table_info(content)")}
+    
+    def _build_tweet_filters(
+        self,
+        author: Union[str, List[str], None] = None,
+        start_date: str = None,
+        end_date: str = None,
+        keyword: str = None,
+        match: str = None
+    ) -> Tuple[str, List[str], list, Optional[str]]:
+        """
+        构建推文查询的 FROM/WHERE 部分
+        
+        Returns:
+            (from_clause, conditions, params, fts_query)
+        """
+        from_clause = "content"
+        conditions = []
+        params = []
+        
+        # 全文检索：trigram 只能索引 >= 3 个字符的词，更短的关键词回退为 LIKE
+        fts_query = None
+        like_keyword = keyword
+        if self.fts_enabled and match:
+            fts_query = match
+        elif self.fts_enabled and keyword and len(keyword) >= 3:
+            fts_query = self._fts_phrase(keyword)
+            like_keyword = None
+        elif match:
+            # 不支持 FTS5 时把查询当作普通关键词
+            like_keyword = keyword or match
+        
+        if fts_query:
+            from_clause += " JOIN content_fts ON content_fts.rowid = content.id"
+            conditions.append("content_fts MATCH ?")
+            params.append(fts_query)
+        
+        if like_keyword:
+            conditions.append("content.text LIKE ?")
+            params.append(f"%{like_keyword}%")
+        
+        if author:
+            if isinstance(author, list):
+                placeholders = ', '.join(['?'] * len(author))
+                conditions.append(f"content.author IN ({placeholders})")
+                params.extend(author)
+            else:
+                conditions.append("content.author = ?")
+                params.append(author)
+        
+        # 日期按 UTC 自然日解释：[start 00:00, end+1 00:00)
+        if start_date:
+            conditions.append("content.publish_time_epoch >= ?")
+            params.append(_day_start_epoch(start_date))
         
-        cursor.execute("PRAGMA table_info(content)")
-        columns = {row[1] for row in cursor.fetchall()}
+        if end_date:
+            conditions.append("content.publish_time_epoch < ?")
+            params.append(_day_start_epoch(end_date) + 86400)
         
-        conn.close()
-        return columns
+        return from_clause, conditions, params, fts_query
     
     def get_tweets(
         self, 
@@ -288,60 +757,172 @@ class StorageManager:
         start_date: str = None, 
         end_date: str = None,
         keyword: str = None,
-        limit: int = None
+        limit: int = None,
+        match: str = None,
+        rank: bool = False
     ) -> List[dict]:
         """
         从数据库检索推文
         
+        一次性返回全部结果；结果集可能很大时请使用 iter_tweets。
+        
         Args:
             author: 作者 screen_name (支持单个字符串或列表)
             start_date: 起始日期 (YYYY-MM-DD)
             end_date: 结束日期 (YYYY-MM-DD)
-            keyword: 全文搜索关键词
+            keyword: 全文搜索关键词（子串匹配，不区分大小写）
             limit: 返回数量限制
+            match: FTS5 查询语法，支持短语 "a b"、前缀 term*、AND/OR/NOT
+                   (trigram 分词下每个词至少 3 个字符)
+            rank: 按 bm25 相关度排序（需要 keyword 或 match）
             
         Returns:
             推文列表
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        from_clause, conditions, params, fts_query = self._build_tweet_filters(
+            author, start_date, end_date, keyword, match
+        )
         
-        query = "SELECT * FROM content WHERE 1=1"
-        params = []
+        query = f"SELECT content.* FROM {from_clause}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
         
-        if author:
-            if isinstance(author, list):
-                if author:
-                    placeholders = ', '.join(['?'] * len(author))
-                    query += f" AND author IN ({placeholders})"
-                    params.extend(author)
-            else:
-                query += " AND author = ?"
-                params.append(author)
+        if rank and fts_query:
+            query += " ORDER BY bm25(content_fts), content.publish_time_epoch DESC"
+        else:
+            query += " ORDER BY content.publish_time_epoch DESC"
         
-        if start_date:
-            query += " AND publish_time >= ?"
-            params.append(start_date)
+        if limit:
+            query += f" LIMIT {int(limit)}"
         
-        if end_date:
-            query += " AND publish_time <= ?"
-            params.append(end_date + "T23:59:59")
+        with self.db.reader() as conn:
+            rows = conn.execute(query, params).fetchall()
         
-        if keyword:
-            query += " AND text LIKE ?"
-            params.append(f"%{keyword}%")
+        return [dict(row) for row in rows]
+    
+    def iter_tweets(
+        self,
+        author: Union[str, List[str], None] = None,
+        start_date: str = None,
+        end_date: str = None,
+        keyword: str = None,
+        match: str = None,
+        columns: List[str] = None,
+        limit: int = None,
+        chunk_size: int = 500
+    ) -> Iterator[dict]:
+        """
+        流式检索推文（按发布时间倒序）
         
-        query += " ORDER BY publish_time DESC"
+        使用 (publish_time_epoch, tweet_id) 键集分页，每页单独查询并立即归还读连接，
+        内存占用只与 chunk_size 有关，与结果总量无关。
         
-        if limit:
-            query += f" LIMIT {limit}"
+        Args:
+            author / start_date / end_date / keyword / match: 同 get_tweets
+            columns: 只返回这些列（默认全部列）
+            limit: 最多返回数量
+            chunk_size: 每页行数
+            
+        Yields:
+            推文字典
+        """
+        if columns:
+            valid_columns = self.get_column_names()
+            unknown = [col for col in columns if col not in valid_columns]
+            if unknown:
+                raise ValueError(f"content 表不存在这些列: {', '.join(unknown)}")
+            select_list = ", ".join(f"content.{col}" for col in columns)
+        else:
+            select_list = "content.*"
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
+        from_clause, conditions, params, _ = self._build_tweet_filters(
+            author, start_date, end_date, keyword, match
+        )
         
-        return [dict(row) for row in rows]
+        # 排序键单独取出，保证投影不包含它们时也能翻页
+        base_query = (
+            f"SELECT content.publish_time_epoch AS _page_time, "
+            f"content.tweet_id AS _page_id, {select_list} FROM {from_clause}"
+        )
+        
+        cursor_key = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page_conditions = list(conditions)
+            page_params = list(params)
+            if cursor_key is not None:
+                page_conditions.append("(content.publish_time_epoch, content.tweet_id) < (?, ?)")
+                page_params.extend(cursor_key)
+            
+            page_size = chunk_size if remaining is None else min(chunk_size, remaining)
+            query = base_query
+            if page_conditions:
+                query += " WHERE " + " AND ".join(page_conditions)
+            query += (
+                " ORDER BY content.publish_time_epoch DESC, content.tweet_id DESC"
+                f" LIMIT {int(page_size)}"
+            )
+            
+            with self.db.reader() as conn:
+                rows = conn.execute(query, page_params).fetchmany(page_size)
+            
+            if not rows:
+                return
+            
+            cursor_key = (rows[-1]['_page_time'], rows[-1]['_page_id'])
+            for row in rows:
+                item = dict(row)
+                del item['_page_time'], item['_page_id']
+                yield item
+            
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < page_size:
+                return
+    
+    def explain_tweets_query(
+        self,
+        author: Union[str, List[str], None] = None,
+        start_date: str = None,
+        end_date: str = None,
+        keyword: str = None,
+        match: str = None
+    ) -> List[str]:
+        """
+        返回 get_tweets 对应查询的 EXPLAIN QUERY PLAN（用于检查索引是否生效）
+        
+        Returns:
+            查询计划每一步的描述，如 ["SEARCH content USING INDEX idx_author_time_epoch (...)"]
+        """
+        from_clause, conditions, params, _ = self._build_tweet_filters(
+            author, start_date, end_date, keyword, match
+        )
+        query = f"SELECT content.* FROM {from_clause}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY content.publish_time_epoch DESC"
+        
+        with self.db.reader() as conn:
+            return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+    
+    def count_tweets(
+        self,
+        author: Union[str, List[str], None] = None,
+        start_date: str = None,
+        end_date: str = None,
+        keyword: str = None,
+        match: str = None
+    ) -> int:
+        """统计符合条件的推文数量（参数同 get_tweets）"""
+        from_clause, conditions, params, _ = self._build_tweet_filters(
+            author, start_date, end_date, keyword, match
+        )
+        query = f"SELECT COUNT(*) FROM {from_clause}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        
+        with self.db.reader() as conn:
+            return conn.execute(query, params).fetchone()[0]
     
     # ==================== 核心: 时间缝隙算法 ====================
     
@@ -370,61 +951,134 @@ class StorageManager:
             本地已有 [1.5, 1.20]
             返回 [(1.1, 1.4), (1.21, 1.30)]
         """
-        manifest = self._load_manifest()
-        
-        # 获取该博主已存储的区间列表
-        stored_ranges = manifest.get(handle, [])
-        
-        if not stored_ranges:
-            # 没有任何存储，返回完整请求区间
-            return [(start_date, end_date)]
+        # 获取该博主与请求区间相交的已存储区间 (按起始日期有序)
+        with self.db.reader() as conn:
+            stored_ranges = conn.execute('''
+                SELECT start_date, end_date FROM coverage
+                WHERE handle = ? AND start_date <= ? AND end_date >= ?
+                ORDER BY start_date
+            ''', (handle, end_date, start_date)).fetchall()
         
-        # 转换为日期对象便于计算
-        req_start = datetime.strptime(start_date, "%Y-%m-%d")
-        req_end = datetime.strptime(end_date, "%Y-%m-%d")
+        req_start = _to_ordinal(start_date)
+        req_end = _to_ordinal(end_date)
+        stored = [(_to_ordinal(row[0]), _to_ordinal(row[1])) for row in stored_ranges]
         
-        # 将已存储区间排序
-        stored = []
-        for rng in stored_ranges:
-            s = datetime.strptime(rng[0], "%Y-%m-%d")
-            e = datetime.strptime(rng[1], "%Y-%m-%d")
-            stored.append((s, e))
-        stored.sort(key=lambda x: x[0])
+        return [
+            (_from_ordinal(gap_start), _from_ordinal(gap_end))
+            for gap_start, gap_end in _sweep_gaps(stored, req_start, req_end)
+        ]
+    
+    def get_missing_ranges_bulk(
+        self,
+        handles: List[str],
+        start_date: str,
+        end_date: str
+    ) -> dict:
+        """
+        一次性计算多个博主在同一请求区间内的缺口
         
-        # 计算缺口
-        missing = []
-        current = req_start
+        只查询一次 coverage 表，区间转换为序数日 (date.toordinal) 后
+        在内存中逐个博主扫描，避免对每个博主重复查询与解析日期。
         
-        for s_start, s_end in stored:
-            # 如果当前指针已经超过请求结束，停止
-            if current > req_end:
-                break
-            
-            # 存储区间在请求区间之前，跳过
-            if s_end < current:
-                continue
-            
-            # 存储区间在请求区间之后，记录缺口到存储开始
-            if s_start > current:
-                gap_end = min(s_start - timedelta(days=1), req_end)
-                if gap_end >= current:
-                    missing.append((
-                        current.strftime("%Y-%m-%d"),
-                        gap_end.strftime("%Y-%m-%d")
-                    ))
+        Args:
+            handles: 博主 screen_name 列表
+            start_date: 请求的起始日期 (YYYY-MM-DD)
+            end_date: 请求的结束日期 (YYYY-MM-DD)
             
-            # 更新当前指针到已存储区间结束的下一天
-            current = max(current, s_end + timedelta(days=1))
+        Returns:
+            {
+                "gaps": {handle: [(start_date, end_date), ...]},  # 每个博主都有键，无缺口为 []
+                "missing_days": int,        # 缺失的 博主·天 总数，用于估算抓取成本
+                "handles_with_gaps": int,
+                "gap_count": int
+            }
+        """
+        req_start = _to_ordinal(start_date)
+        req_end = _to_ordinal(end_date)
+        unique_handles = list(dict.fromkeys(handles))
         
-        # 检查尾部缺口
-        if current <= req_end:
-            missing.append((
-                current.strftime("%Y-%m-%d"),
-                req_end.strftime("%Y-%m-%d")
-            ))
+        stored = {handle: [] for handle in unique_handles}
+        with self.db.reader() as conn:
+            # 分块避免超过 SQLite 参数上限
+            for i in range(0, len(unique_handles), 500):
+                part = unique_handles[i:i + 500]
+                rows = conn.execute(f'''
+                    SELECT handle, start_date, end_date FROM coverage
+                    WHERE handle IN ({', '.join(['?'] * len(part))})
+                      AND start_date <= ? AND end_date >= ?
+                    ORDER BY handle, start_date
+                ''', part + [end_date, start_date]).fetchall()
+                for row in rows:
+                    stored[row[0]].append((_to_ordinal(row[1]), _to_ordinal(row[2])))
         
-        return missing
-    
+        gaps = {}
+        missing_days = 0
+        gap_count = 0
+        for handle in unique_handles:
+            ordinal_gaps = _sweep_gaps(stored[handle], req_start, req_end)
+            gaps[handle] = [(_from_ordinal(s), _from_ordinal(e)) for s, e in ordinal_gaps]
+            missing_days += sum(e - s + 1 for s, e in ordinal_gaps)
+            gap_count += len(ordinal_gaps)
+        
+        return {
+            "gaps": gaps,
+            "missing_days": missing_days,
+            "handles_with_gaps": sum(1 for g in gaps.values() if g),
+            "gap_count": gap_count
+        }
+
+    def get_posting_rates(self, handles: List[str], lookback_days: int = 90) -> dict:
+        """
+        估算每个博主的日均发帖量，用于决定哪些博主可以合并成一个 OR 查询抓取
+
+        日均发帖量 = 最近 lookback_days 天内的推文数 / 同期已覆盖的天数。
+        只除以已覆盖天数，避免把未抓取的日子当作“没发帖”。
+
+        Args:
+            handles: 博主 screen_name 列表
+            lookback_days: 统计窗口（天）
+
+        Returns:
+            {handle: 日均发帖量}，从未抓取过的博主为 None
+        """
+        # 与 coverage 区间、publish_time_epoch 一样按 UTC 日期计算窗口
+        today = datetime.now(timezone.utc).date()
+        window_start = (today - timedelta(days=lookback_days)).toordinal()
+        window_end = today.toordinal()
+        since_epoch = _day_start_epoch(_from_ordinal(window_start))
+        unique_handles = list(dict.fromkeys(handles))
+
+        covered_days = {handle: 0 for handle in unique_handles}
+        counts = {handle: 0 for handle in unique_handles}
+        with self.db.reader() as conn:
+            for i in range(0, len(unique_handles), 500):
+                part = unique_handles[i:i + 500]
+                placeholders = ', '.join(['?'] * len(part))
+
+                rows = conn.execute(f'''
+                    SELECT handle, start_date, end_date FROM coverage
+                    WHERE handle IN ({placeholders}) AND end_date >= ?
+                ''', part + [_from_ordinal(window_start)]).fetchall()
+                for handle, start, end in rows:
+                    s = max(_to_ordinal(start), window_start)
+                    e = min(_to_ordinal(end), window_end)
+                    if e >= s:
+                        covered_days[handle] += e - s + 1
+
+                # 走 idx_author_time_epoch 范围扫描
+                rows = conn.execute(f'''
+                    SELECT author, COUNT(*) FROM content
+                    WHERE author IN ({placeholders}) AND publish_time_epoch >= ?
+                    GROUP BY author
+                ''', part + [since_epoch]).fetchall()
+                for author, count in rows:
+                    counts[author] = count
+
+        return {
+            handle: (counts[handle] / covered_days[handle] if covered_days[handle] else None)
+            for handle in unique_handles
+        }
+
     def merge_intervals(self, intervals: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
         """
         合并重叠的时间区间
@@ -470,47 +1124,142 @@ class StorageManager:
     
     def update_manifest(self, handle: str, new_range: Tuple[str, str]):
         """
-        更新 manifest.json，添加新抓取的时间范围并合并
+        记录新抓取的时间范围，并与相交或相邻的已有区间合并
+        
+        只读取并改写与新区间有关的几行，整个合并在一个事务内完成，
+        多进程同时写入也不会互相覆盖。
         
         Args:
             handle: 博主的 screen_name
             new_range: 新抓取的区间 (start_date, end_date)
         """
-        manifest = self._load_manifest()
-        
-        existing = manifest.get(handle, [])
-        # 转换为元组列表
-        existing = [tuple(r) for r in existing]
-        existing.append(new_range)
-        
-        # 合并区间
-        merged = self.merge_intervals(existing)
+        new_start, new_end = new_range
+        # 相邻（差 1 天）的区间也需要合并
+        lower = (datetime.strptime(new_start, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        upper = (datetime.strptime(new_end, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
         
-        manifest[handle] = merged
-        self._save_manifest(manifest)
+        with self.db.transaction() as conn:
+            rows = conn.execute('''
+                SELECT rowid, start_date, end_date FROM coverage
+                WHERE handle = ? AND start_date <= ? AND end_date >= ?
+            ''', (handle, upper, lower)).fetchall()
+            
+            merged_start = min([new_start] + [row[1] for row in rows])
+            merged_end = max([new_end] + [row[2] for row in rows])
+            
+            if rows:
+                conn.executemany("DELETE FROM coverage WHERE rowid = ?", [(row[0],) for row in rows])
+            conn.execute(
+                "INSERT INTO coverage (handle, start_date, end_date) VALUES (?, ?, ?)",
+                (handle, merged_start, merged_end)
+            )
     
     def get_coverage(self, handle: str) -> List[Tuple[str, str]]:
         """获取某博主的已覆盖时间区间"""
-        manifest = self._load_manifest()
-        return manifest.get(handle, [])
+        with self.db.reader() as conn:
+            rows = conn.execute(
+                "SELECT start_date, end_date FROM coverage WHERE handle = ? ORDER BY start_date",
+                (handle,)
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    
+    def get_high_water_marks(self, handles: List[str]) -> dict:
+        """
+        批量读取增量抓取高水位
+        
+        Returns:
+            {handle: {"tweet_id", "publish_time_epoch", "checked_at"}}，没有记录的博主不出现
+        """
+        unique_handles = list(dict.fromkeys(handles))
+        marks = {}
+        with self.db.reader() as conn:
+            for i in range(0, len(unique_handles), 500):
+                part = unique_handles[i:i + 500]
+                rows = conn.execute(f'''
+                    SELECT handle, tweet_id, publish_time_epoch, checked_at FROM high_water_marks
+                    WHERE handle IN ({', '.join(['?'] * len(part))})
+                ''', part).fetchall()
+                for row in rows:
+                    marks[row[0]] = {
+                        "tweet_id": row[1],
+                        "publish_time_epoch": row[2],
+                        "checked_at": row[3]
+                    }
+        return marks
+    
+    def update_high_water_mark(self, handle: str, tweets: List[dict], checked_at: int):
+        """
+        记录一次“抓到当前时刻为止且已翻到底”的抓取
+        
+        只有完整抓取才应调用：checked_at 应取抓取开始前的时间，
+        tweet_id 只会前进，不会被更旧的推文覆盖。
+        
+        Args:
+            handle: 博主的 screen_name
+            tweets: 本次抓取到的该博主推文（可为空）
+            checked_at: 抓取开始时的 UTC epoch 秒
+        """
+        newest_id, newest_epoch = None, None
+        for tweet in tweets:
+            # 与 upsert 一致：没有 id（或 id 非数字）的行跳过，不影响其余推文
+            tweet_id = str(tweet.get('content_id') or tweet.get('tweet_id') or '')
+            if not tweet_id.isdigit():
+                continue
+            epoch = _to_epoch(tweet.get('publish_time') or tweet.get('created_at'))
+            if newest_epoch is None or (epoch, int(tweet_id)) > (newest_epoch, int(newest_id)):
+                newest_id, newest_epoch = tweet_id, epoch
+        
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT tweet_id, publish_time_epoch, checked_at FROM high_water_marks WHERE handle = ?",
+                (handle,)
+            ).fetchone()
+            if row:
+                if str(row[0] or '').isdigit() and (newest_id is None or (row[1], int(row[0])) >= (newest_epoch, int(newest_id))):
+                    newest_id, newest_epoch = row[0], row[1]
+                checked_at = max(checked_at, row[2])
+            conn.execute('''
+                INSERT INTO high_water_marks (handle, tweet_id, publish_time_epoch, checked_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(handle) DO UPDATE SET
+                    tweet_id = excluded.tweet_id,
+                    publish_time_epoch = excluded.publish_time_epoch,
+                    checked_at = excluded.checked_at
+            ''', (handle, newest_id, newest_epoch, checked_at))
 
 
 # ==================== 测试代码 ====================
+# 运行方式: python -m core.storage_manager（回归断言见 tests/test_storage_manager.py）
 if __name__ == "__main__":
-    sm = StorageManager()
-    
-    # 测试区间合并
-    intervals = [
-        ("2024-01-01", "2024-01-10"),
-        ("2024-01-08", "2024-01-20"),
-        ("2024-01-25", "2024-01-30")
-    ]
-    merged = sm.merge_intervals(intervals)
-    print(f"合并结果: {merged}")
-    # 预期: [("2024-01-01", "2024-01-20"), ("2024-01-25", "2024-01-30")]
-    
-    # 测试缺口计算
-    sm.update_manifest("test_user", ("2024-01-05", "2024-01-20"))
-    gaps = sm.get_missing_ranges("test_user", "2024-01-01", "2024-01-30")
-    print(f"缺口区间: {gaps}")
-    # 预期: [("2024-01-01", "2024-01-04"), ("2024-01-21", "2024-01-30")]
+    import tempfile
+    
+    # 演示只写临时目录，不改动 data/ 下的正式数据库
+    with tempfile.TemporaryDirectory() as tmp:
+        sm = StorageManager(data_dir=tmp)
+        
+        # 区间合并
+        intervals = [
+            ("2024-01-01", "2024-01-10"),
+            ("2024-01-08", "2024-01-20"),
+            ("2024-01-25", "2024-01-30")
+        ]
+        print(f"合并结果: {sm.merge_intervals(intervals)}")
+        
+        # 缺口计算
+        sm.update_manifest("test_user", ("2024-01-05", "2024-01-20"))
+        print(f"缺口区间: {sm.get_missing_ranges('test_user', '2024-01-01', '2024-01-30')}")
+        
+        # 高水位：只前进不后退
+        sm.update_high_water_mark("test_user", [{"content_id": "200", "publish_time": "2024-01-20T10:00:00"}], 1705800000)
+        sm.update_high_water_mark("test_user", [{"content_id": "150", "publish_time": "2024-01-19T10:00:00"}], 1705900000)
+        print(f"高水位: {sm.get_high_water_marks(['test_user'])['test_user']}")
+        
+        # 查询计划
+        plan = sm.explain_tweets_query(
+            author=["test_user", "another_user"],
+            start_date="2024-01-01",
+            end_date="2024-01-30"
+        )
+        print(f"查询计划: {plan}")
+        sm.close()
@@ -14,7 +14,6 @@ main.py - 智能内容情报 Agent 系统入口
 5. 导出报告 (Exporter)
 """
 
-import os
 import asyncio
 import argparse
 from typing import Optional
@@ -29,6 +28,7 @@ from core.query_engine import QueryEngine
 from core.storage_manager import StorageManager
 from core.exporter import Exporter
 from core.scrapers import XScraper
+from core.scrape_executor import ScrapeExecutor
 from skills import AnalysisGenerator
 from core.schema_generator import SchemaGenerator
 from core.annotator import DynamicAnnotator
@@ -37,7 +37,7 @@ from core.annotator import DynamicAnnotator
 class XSkillAgent:
     """智能内容情报 Agent 主控类"""
     
-    def __init__(self):
+    def __init__(self, scrape_concurrency: int = None):
         self.discoverer = AccountDiscoverer()
         self.query_engine = QueryEngine(discoverer=self.discoverer)
         self.storage = StorageManager()
@@ -45,6 +45,8 @@ class XSkillAgent:
         
         # 爬虫需要 auth_token，延迟初始化
         self._scraper = None
+        # 同时抓取的博主数量，None 时读取 XSKILL_SCRAPE_CONCURRENCY
+        self.scrape_concurrency = scrape_concurrency
         
         # 分析器
         self.analyzer = AnalysisGenerator()
@@ -53,11 +55,13 @@ class XSkillAgent:
     def scraper(self) -> Optional[XScraper]:
         """延迟初始化爬虫"""
         if self._scraper is None:
-            auth_token = os.getenv("TWITTER_AUTH_TOKEN")
-            if auth_token:
-                self._scraper = XScraper(auth_token=auth_token)
-            else:
-                print("⚠️ 未配置 TWITTER_AUTH_TOKEN，抓取功能不可用")
+            try:
+                # 凭据池：TWITTER_AUTH_TOKEN 与 data/credentials.json 中的全部账号
+                self._scraper = XScraper()
+                if len(self._scraper.pool) > 1:
+                    print(f"🔑 凭据池: {len(self._scraper.pool)} 个账号轮换抓取")
+            except ValueError:
+                print("⚠️ 未配置 TWITTER_AUTH_TOKEN 或 data/credentials.json，抓取功能不可用")
         return self._scraper
     
     async def run_pipeline(
@@ -136,58 +140,50 @@ class XSkillAgent:
         all_gaps = []
         
         print("📊 Step 4 & 5: 检查缺口并抓取数据...")
+        gap_plan = self.storage.get_missing_ranges_bulk(handles, start_date, end_date)
+        if gap_plan["handles_with_gaps"]:
+            print(f"   共 {gap_plan['handles_with_gaps']} 个博主存在 {gap_plan['gap_count']} 个缺口，"
+                  f"合计缺失 {gap_plan['missing_days']} 个博主·天")
+        
         for handle in handles:
-            gaps = self.storage.get_missing_ranges(handle, start_date, end_date)
+            gaps = gap_plan["gaps"].get(handle, [])
             if gaps:
                 print(f"   [ @{handle} ] 发现 {len(gaps)} 个缺口区间")
-                if self.scraper:
-                    for gap_start, gap_end in gaps:
-                        print(f"      抓取 {gap_start} 至 {gap_end}...")
-                        tweets = await self.scraper.scrape(
-                            handle, 
-                            start_date=gap_start, 
-                            end_date=gap_end,
-                            count=100
-                        )
-                        
-                        if tweets:
-                            save_tweets = [{
-                                "tweet_id": t["content_id"],
-                                "author": t["author"],
-                                "text": t["text"],
-                                "created_at": t["publish_time"],
-                                "url": t["url"],
-                                "is_retweet": t["is_retweet"],
-                                "metrics": t.get("metrics", {}),
-                                "metadata": t.get("metadata", {})
-                            } for t in tweets]
-                            
-                            saved = self.storage.save_tweets(save_tweets)
-                            self.storage.update_manifest(handle, (gap_start, gap_end))
-                            total_fetched += saved
-                            print(f"      ✅ 保存 {saved} 条推文")
                 all_gaps.extend([(handle, g) for g in gaps])
             else:
                 print(f"   [ @{handle} ] ✅ 无需抓取")
+        
+        failed_gaps = 0
+        if all_gaps and self.scraper:
+            executor = ScrapeExecutor(
+                self.scraper,
+                self.storage,
+                concurrency=self.scrape_concurrency
+            )
+            scrape_stats = await executor.run(gap_plan["gaps"])
+            total_fetched = scrape_stats["total_fetched"]
+            failed_gaps = len(scrape_stats["failed"])
 
         result["steps"].append({
             "name": "缺口计算与抓取",
             "total_fetched": total_fetched,
-            "gaps_found": len(all_gaps)
+            "gaps_found": len(all_gaps),
+            "gaps_failed": failed_gaps,
+            "missing_days": gap_plan["missing_days"]
         })
         
-        # Step 6: 获取全量本地数据
+        # Step 6: 统计本地数据（数据本身在分析/导出时流式读取）
         print("📚 Step 6: 读取本地汇总数据...")
-        data = self.storage.get_tweets(
+        data_count = self.storage.count_tweets(
             author=handles,
             start_date=start_date,
             end_date=end_date
         )
-        result["data_count"] = len(data)
-        print(f"   汇总共 {len(data)} 条数据")
+        result["data_count"] = data_count
+        print(f"   汇总共 {data_count} 条数据")
         
         # Step 7: AI 分析 (聚合分析)
-        annotated_data = data  # 默认使用原始数据
+        annotated_data = None  # 默认直接使用数据库中的原始数据
         
         # 检查是否需要动态标注（基于 query 意图）
         if "标注" in query or "看讨论" in query or "判断" in query:
@@ -199,9 +195,20 @@ class XSkillAgent:
             annotated_data = await annotator.annotate_all(author=handles)
             print(f"   ✅ 已完成 {len(annotated_data)} 条推文的即时标注")
         
-        if analyze and annotated_data:
+        has_data = bool(annotated_data) if annotated_data is not None else data_count > 0
+        
+        if analyze and has_data:
             print("🧠 Step 8: AI 聚合分析中...")
-            analysis = await self.analyzer.analyze(query, annotated_data)
+            if annotated_data is not None:
+                analysis_input = annotated_data
+            else:
+                analysis_input = self.storage.iter_tweets(
+                    author=handles,
+                    start_date=start_date,
+                    end_date=end_date,
+                    columns=['author', 'text', 'publish_time']
+                )
+            analysis = await self.analyzer.analyze(query, analysis_input)
             result["analysis"] = analysis
             
             if analysis.get("highlights"):
@@ -215,7 +222,7 @@ class XSkillAgent:
                 result["analysis_report_path"] = report_path
         
         # Step 9: 导出聚合 Excel
-        if export and annotated_data:
+        if export and has_data:
             print("📝 Step 9: 导出聚合报告...")
             filepath = self.exporter.export_to_excel(
                 author=handles,
@@ -233,8 +240,8 @@ class XSkillAgent:
         return result
     
     def update_accounts(self) -> int:
-        """仅更新账号池"""
-        new_count, _ = self.discoverer.fetch_and_update()
+        """仅更新账号池（手动触发，忽略最小刷新间隔）"""
+        new_count, _ = self.discoverer.fetch_and_update(force=True)
         return new_count
     
     def list_accounts(self):
@@ -269,10 +276,11 @@ def main():
     parser.add_argument("--no-analyze", action="store_true", help="不进行 AI 分析")
     parser.add_argument("--update-accounts", action="store_true", help="仅更新账号池")
     parser.add_argument("--list-accounts", action="store_true", help="列出所有账号")
+    parser.add_argument("--concurrency", "-c", type=int, help="同时抓取的博主数量 (默认 4)")
     
     args = parser.parse_args()
     
-    agent = XSkillAgent()
+    agent = XSkillAgent(scrape_concurrency=args.concurrency)
     
     if args.update_accounts:
         new = agent.update_accounts()
@@ -3,12 +3,15 @@ discover_following.py - 二级关注发现脚本
 
 功能：
 1. 读取 accounts_level1.json 中的一级账号
-2. 获取每个账号的 Twitter following 列表
-3. 去重并合并标签
-4. 更新 accounts_level2.json
+2. 并发获取每个账号的 Twitter following 列表（有界工作池）
+3. 每页游标与数据写入 data/follow_graph.db，中断后从最后一页继续
+4. 去重并合并标签，逐账号写入账号池 (data/accounts.db)
+5. 运行结束时导出 accounts_level2.json 供查看
 
 使用：
     python scripts/discover_following.py --max-accounts 3 --max-following 20 --dry-run
+    python scripts/discover_following.py --concurrency 8
+    python scripts/discover_following.py --rank 100   # 按关注图为二级候选排序，不抓取
 """
 
 import os
@@ -28,63 +31,53 @@ load_dotenv()
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from core.scrapers.x_scraper import XScraper
+from core.follow_store import FollowStore
+from core.follow_graph import FollowGraph
+from core.account_registry import AccountRegistry, LEVEL_PRIMARY, LEVEL_SECONDARY
 
 
 class FollowingDiscoverer:
     """二级关注发现器"""
     
-    def __init__(self, data_dir: str = None):
+    def __init__(self, data_dir: str = None, concurrency: int = None):
         if data_dir is None:
             data_dir = Path(__file__).parent.parent / "data"
         self.data_dir = Path(data_dir)
-        self.level1_accounts_path = self.data_dir / "accounts_level1.json"
         self.level2_accounts_path = self.data_dir / "accounts_level2.json"
         self.progress_path = self.data_dir / "following_discovery_progress.json"
         self.stats_path = self.data_dir.parent / "exports" / "following_discovery_stats.xlsx"
         self.scraper = XScraper()
+        self.store = FollowStore(self.data_dir)
+        self.registry = AccountRegistry(self.data_dir)
+        self.concurrency = max(1, concurrency or int(os.getenv("XSKILL_CRAWL_CONCURRENCY", "4")))
         self.stats = {}  # {screen_name: {following_count: int, discovered_at: str}}
+        
+        self._import_legacy_progress()
     
     def _load_level1_accounts(self) -> List[Dict]:
-        """加载一级账号池"""
-        if self.level1_accounts_path.exists():
-            with open(self.level1_accounts_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
-    
-    def _load_level2_accounts(self) -> List[Dict]:
-        """加载二级账号池"""
-        if self.level2_accounts_path.exists():
-            with open(self.level2_accounts_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
-    
-    def _save_level2_accounts(self, accounts: List[Dict]):
-        """保存二级账号池（原子性写入）"""
-        temp_path = self.level2_accounts_path.with_suffix('.tmp')
-        with open(temp_path, 'w', encoding='utf-8') as f:
-            json.dump(accounts, f, ensure_ascii=False, indent=2)
-        temp_path.replace(self.level2_accounts_path)
-    
-    def _load_progress(self) -> Dict:
-        """加载进度"""
-        if self.progress_path.exists():
-            with open(self.progress_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {"processed": [], "last_update": None}
-    
-    def _save_progress(self, progress: Dict):
-        """保存进度"""
-        with open(self.progress_path, 'w', encoding='utf-8') as f:
-            json.dump(progress, f, ensure_ascii=False, indent=2)
+        """加载一级账号池（accounts_level1.json 有变化时已由注册表自动导入）"""
+        return self.registry.all(level=LEVEL_PRIMARY)
     
-    def _normalize_source(self, source) -> List[str]:
-        """规范化 source 字段为列表"""
-        if isinstance(source, list):
-            return source
-        elif isinstance(source, str):
-            return [source]
-        else:
-            return []
+    def _import_legacy_progress(self):
+        """
+        一次性导入旧版进度文件：其中已处理的账号在检查点中标记为完成
+        
+        导入后文件重命名为 .imported，避免重复导入。
+        """
+        if not self.progress_path.exists():
+            return
+        
+        with open(self.progress_path, 'r', encoding='utf-8') as f:
+            progress = json.load(f)
+        
+        processed = [h for h in progress.get("processed", []) if not self.store.get_crawl(h)]
+        with self.store.db.transaction():
+            for screen_name in processed:
+                self.store.start_crawl(screen_name)
+                self.store.finish_crawl(screen_name)
+        
+        self.progress_path.rename(self.progress_path.with_suffix('.json.imported'))
+        print(f"📦 已导入旧版进度文件: {len(processed)} 个已处理账号")
     
     async def discover_from_following(
         self,
@@ -98,7 +91,7 @@ class FollowingDiscoverer:
         Args:
             max_accounts: 最多处理多少个一级账号（None = 全部）
             max_following_per_account: 每个账号最多获取多少个 following
-            dry_run: 是否为试运行（不写入文件）
+            dry_run: 是否为试运行（不写入文件，也不记录检查点）
         """
         print("=" * 60)
         print("🚀 开始二级关注发现")
@@ -112,87 +105,33 @@ class FollowingDiscoverer:
         
         print(f"📊 一级账号数量: {len(primary_accounts)}")
         print(f"📊 每个账号获取 following 数: {max_following_per_account}")
-        print(f"📊 预计总耗时: ~{len(primary_accounts) * 0.5:.1f} 分钟\n")
+        print(f"📊 并发账号数: {self.concurrency}")
+        print(f"📊 预计总耗时: ~{len(primary_accounts) * 0.5 / self.concurrency:.1f} 分钟\n")
         
-        # 2. 加载进度
-        progress = self._load_progress()
-        processed_handles = set(progress.get("processed", []))
+        # 2. 跳过已完整抓取的账号（未完成的从检查点继续）
+        processed_handles = self.store.done_sources()
+        level1_handles = self.registry.handles(level=LEVEL_PRIMARY)  # 小写
         
         # 3. 收集所有二级账号
         all_following = {}  # {screen_name: {info, sources: []}}
         
+        pending = []
         for idx, account in enumerate(primary_accounts, 1):
-            screen_name = account['screen_name']
-            
-            # 跳过已处理的
-            if screen_name in processed_handles:
-                print(f"⏭️  [{idx}/{len(primary_accounts)}] 跳过已处理: @{screen_name}")
-                continue
-            
-            print(f"\n🔍 [{idx}/{len(primary_accounts)}] 正在获取 @{screen_name} 的 following...")
-            
-            try:
-                following_list = await self.scraper.get_user_following(
-                    screen_name,
-                    count=None  # None = 获取全部
+            if account['screen_name'] in processed_handles:
+                print(f"⏭️  [{idx}/{len(primary_accounts)}] 跳过已处理: @{account['screen_name']}")
+            else:
+                pending.append((idx, account['screen_name']))
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def worker(idx: int, screen_name: str):
+            async with semaphore:
+                await self._process_account(
+                    idx, len(primary_accounts), screen_name,
+                    all_following, level1_handles, dry_run
                 )
-                
-                print(f"   ✅ 获取到 {len(following_list)} 个 following")
-                
-                # 处理每个 following
-                source_tag = f"{screen_name}推荐"
-                new_in_this_batch = 0
-                for user in following_list:
-                    user_screen_name = user['screen_name']
-                    
-                    # 跳过一级账号自己
-                    if user_screen_name in [acc['screen_name'] for acc in primary_accounts]:
-                        continue
-                    
-                    if user_screen_name in all_following:
-                        # 去重：添加新标签
-                        if source_tag not in all_following[user_screen_name]['sources']:
-                            all_following[user_screen_name]['sources'].append(source_tag)
-                    else:
-                        # 新账号
-                        all_following[user_screen_name] = {
-                            'name': user['name'],
-                            'screen_name': user_screen_name,
-                            'url': user['url'],
-                            'description': user.get('description', ''),
-                            'sources': [source_tag],
-                            'followers_count': user.get('followers_count', 0),
-                            'verified': user.get('verified', False)
-                        }
-                        new_in_this_batch += 1
-                
-                print(f"   📊 本批次新增 {new_in_this_batch} 个账号")
-                
-                # 记录统计信息
-                self.stats[screen_name] = {
-                    'following_count': len(following_list),
-                    'new_accounts': new_in_this_batch,
-                    'discovered_at': datetime.now().isoformat()
-                }
-                
-                # 更新进度
-                processed_handles.add(screen_name)
-                progress['processed'] = list(processed_handles)
-                progress['last_update'] = datetime.now().isoformat()
-                progress['total_discovered'] = len(all_following)
-                
-                if not dry_run:
-                    # 保存进度文件
-                    self._save_progress(progress)
-                    
-                    # 🔥 增量保存：每处理完一个账号就保存到 accounts_level2.json
-                    print(f"   💾 增量保存中...")
-                    self._merge_accounts(all_following)
-                    print(f"   ✅ 已保存，当前总计 {len(all_following)} 个二级账号")
-                
-            except Exception as e:
-                print(f"   ❌ 处理失败: {e}")
-                continue
+        
+        await asyncio.gather(*(worker(idx, screen_name) for idx, screen_name in pending))
         
         # 4. 统计信息
         print("\n" + "=" * 60)
@@ -209,6 +148,10 @@ class FollowingDiscoverer:
         verified = [acc for acc in all_following.values() if acc['verified']]
         print(f"认证账号数: {len(verified)}")
         
+        failed = self.store.get_crawls("failed")
+        if failed and not dry_run:
+            print(f"未完成账号数: {len(failed)}（下次运行从断点继续）")
+        
         # 显示多标签示例
         if multi_source:
             print(f"\n多标签示例（前5个）:")
@@ -222,12 +165,134 @@ class FollowingDiscoverer:
         
         # 6. 最终总结（已通过增量保存完成）
         if not dry_run:
-            print("\n✅ 所有数据已通过增量保存写入 accounts_level2.json")
+            self.registry.export_json(self.level2_accounts_path, level=LEVEL_SECONDARY)
+            print(f"\n✅ 所有数据已写入账号池，并导出 {self.level2_accounts_path.name}"
+                  f"（{self.registry.count(LEVEL_SECONDARY)} 个二级账号）")
         else:
             print("\n⚠️  试运行模式，未写入文件")
         
         print("=" * 60)
     
+    async def _process_account(
+        self,
+        idx: int,
+        total: int,
+        screen_name: str,
+        all_following: Dict[str, Dict],
+        level1_handles: Set[str],
+        dry_run: bool
+    ):
+        """抓取单个一级账号的 following，完成后合并进二级账号池"""
+        print(f"\n🔍 [{idx}/{total}] 正在获取 @{screen_name} 的 following...")
+        
+        try:
+            if dry_run:
+                following_list = await self.scraper.get_user_following(
+                    screen_name,
+                    count=None  # None = 获取全部
+                )
+            else:
+                following_list = await self._crawl_with_checkpoint(screen_name)
+        except Exception as e:
+            if not dry_run:
+                self.store.fail_crawl(screen_name, str(e))
+            print(f"   ❌ @{screen_name} 处理失败: {e}（已保存断点）")
+            return
+        
+        print(f"   ✅ @{screen_name} 获取到 {len(following_list)} 个 following")
+        
+        # 处理每个 following
+        source_tag = f"{screen_name}推荐"
+        account_following = {}
+        new_in_this_batch = 0
+        for user in following_list:
+            user_screen_name = user['screen_name']
+            
+            # 跳过一级账号自己
+            if user_screen_name.lower() in level1_handles:
+                continue
+            
+            if user_screen_name in all_following:
+                # 去重：添加新标签
+                if source_tag not in all_following[user_screen_name]['sources']:
+                    all_following[user_screen_name]['sources'].append(source_tag)
+            else:
+                # 新账号
+                all_following[user_screen_name] = {
+                    'name': user['name'],
+                    'screen_name': user_screen_name,
+                    'url': user['url'],
+                    'description': user.get('description', ''),
+                    'sources': [source_tag],
+                    'followers_count': user.get('followers_count', 0),
+                    'verified': user.get('verified', False)
+                }
+                new_in_this_batch += 1
+            account_following[user_screen_name] = dict(all_following[user_screen_name], sources=[source_tag])
+        
+        print(f"   📊 @{screen_name} 新增 {new_in_this_batch} 个账号")
+        
+        # 记录统计信息
+        self.stats[screen_name] = {
+            'following_count': len(following_list),
+            'new_accounts': new_in_this_batch,
+            'discovered_at': datetime.now().isoformat()
+        }
+        
+        if not dry_run:
+            # 🔥 增量保存：每处理完一个账号就合并到账号池
+            print(f"   💾 增量保存中...")
+            self._merge_accounts(account_following)
+            print(f"   ✅ 已保存，本次运行累计 {len(all_following)} 个二级账号")
+    
+    async def _crawl_with_checkpoint(self, screen_name: str) -> List[Dict]:
+        """
+        逐页抓取 following，每页写入检查点
+        
+        中断（崩溃、限速、网络错误）后再次调用会从最后保存的游标继续，
+        已抓取的页不会重复请求。
+        """
+        crawl = self.store.get_crawl(screen_name)
+        if crawl and crawl['pages'] and not crawl['cursor']:
+            # 最后一页已保存但未来得及标记完成
+            self.store.finish_crawl(screen_name)
+            return self.store.get_following(screen_name)
+        
+        profile = await self.scraper.get_user_info(screen_name)
+        if not profile:
+            raise ValueError(f"无法解析 @{screen_name} 的用户 ID")
+        crawl = self.store.start_crawl(screen_name, user_id=profile['id'])
+        if crawl['pages']:
+            print(f"   ↩️  @{screen_name} 从第 {crawl['pages'] + 1} 页继续（已有 {crawl['fetched']} 个）")
+        
+        async for users, next_cursor in self.scraper.iter_following_pages(
+            screen_name,
+            cursor=crawl['cursor'],
+            user_id=profile['id']
+        ):
+            self.store.save_page(screen_name, users, next_cursor)
+        
+        self.store.finish_crawl(screen_name)
+        return self.store.get_following(screen_name)
+    
+    def rank_candidates(self, top_k: int = 50, min_co_follow: int = 1) -> List[Dict]:
+        """
+        用已抓取的关注图为二级候选账号排序（个性化 PageRank，以一级账号为种子）
+        
+        Args:
+            top_k: 返回数量
+            min_co_follow: 至少被多少个一级账号关注
+        """
+        seeds = [acc['screen_name'] for acc in self._load_level1_accounts()]
+        graph = FollowGraph.from_store(self.store)
+        print(f"📊 关注图: {graph.num_nodes} 个账号，{graph.num_edges} 条关注边，{len(seeds)} 个种子")
+        
+        ranked = graph.rank_candidates(seeds, top_k=top_k, min_co_follow=min_co_follow)
+        for i, row in enumerate(ranked, 1):
+            print(f"  {i:>3}. @{row['screen_name']:<20} score={row['score']:.5f}  "
+                  f"共同关注={row['co_follow']}  加权入度={row['weighted_in_degree']:.3f}")
+        return ranked
+    
     def _export_stats(self):
         """导出统计数据到 Excel"""
         import pandas as pd
@@ -253,45 +318,10 @@ class FollowingDiscoverer:
     
     
     def _merge_accounts(self, new_following: Dict[str, Dict]):
-        """合并新账号到 accounts_level2.json"""
-        accounts = self._load_level2_accounts()
-        existing_handles = {acc['screen_name']: acc for acc in accounts}
-        
-        added_count = 0
-        updated_count = 0
-        
-        for screen_name, info in new_following.items():
-            if screen_name in existing_handles:
-                # 已存在：合并 source 标签
-                existing = existing_handles[screen_name]
-                existing_sources = self._normalize_source(existing.get('source', []))
-                new_sources = info['sources']
-                
-                # 合并去重
-                merged_sources = list(set(existing_sources + new_sources))
-                existing['source'] = merged_sources
-                existing['updated_at'] = datetime.now().isoformat()
-                
-                # 更新 description（如果之前为空）
-                if not existing.get('description') and info.get('description'):
-                    existing['description'] = info['description']
-                
-                updated_count += 1
-            else:
-                # 新账号
-                new_account = {
-                    "name": info['name'],
-                    "screen_name": screen_name,
-                    "url": info['url'],
-                    "description": info['description'],
-                    "source": info['sources'],
-                    "discovered_at": datetime.now().isoformat(),
-                    "updated_at": datetime.now().isoformat()
-                }
-                accounts.append(new_account)
-                added_count += 1
-        
-        self._save_level2_accounts(accounts)
+        """合并新账号到账号池（来源标签取并集，单事务写入）"""
+        added_count, updated_count = self.registry.upsert_many(
+            new_following.values(), level=LEVEL_SECONDARY
+        )
         print(f"   新增: {added_count} 个账号")
         print(f"   更新: {updated_count} 个账号")
 
@@ -304,10 +334,25 @@ async def main():
                         help="每个账号最多获取多少个 following（默认50）")
     parser.add_argument("--dry-run", action="store_true",
                         help="试运行模式，不写入文件")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="同时抓取的一级账号数（默认 4）")
+    parser.add_argument("--restart", action="store_true",
+                        help="忽略检查点，所有账号从头抓取")
+    parser.add_argument("--rank", type=int, default=None, metavar="N",
+                        help="不抓取，按已有关注图输出前 N 个二级候选账号")
+    parser.add_argument("--min-co-follow", type=int, default=1,
+                        help="排序时至少被多少个一级账号关注（默认1）")
     
     args = parser.parse_args()
     
-    discoverer = FollowingDiscoverer()
+    discoverer = FollowingDiscoverer(concurrency=args.concurrency)
+    if args.rank:
+        discoverer.rank_candidates(top_k=args.rank, min_co_follow=args.min_co_follow)
+        return
+    
+    if args.restart:
+        for crawl in discoverer.store.get_crawls():
+            discoverer.store.reset_crawl(crawl['source'])
     await discoverer.discover_from_following(
         max_accounts=args.max_accounts,
         max_following_per_account=args.max_following,
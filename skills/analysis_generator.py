@@ -11,11 +11,12 @@ analysis_generator.py - 元提示词分析工厂
 
 import os
 import json
-from typing import List, Dict, Optional
+from itertools import islice
+from typing import Iterable, List, Dict, Optional, Sequence, Tuple
 from datetime import datetime
 from pathlib import Path
 
-import requests
+from core.llm_client import LLMError, get_llm_client
 
 
 class AnalysisGenerator:
@@ -27,7 +28,7 @@ class AnalysisGenerator:
         model: str = "google/gemini-2.5-flash-preview-09-2025"
     ):
         self.api_key = openrouter_api_key or os.getenv("OPENROUTER_API_KEY")
-        self.api_base = "https://openrouter.ai/api/v1/chat/completions"
+        self.llm = get_llm_client(self.api_key)
         self.model = model
         
         # 加载模板
@@ -45,7 +46,7 @@ class AnalysisGenerator:
     async def analyze(
         self, 
         query: str, 
-        data: List[Dict],
+        data: Iterable[Dict],
         output_format: str = "markdown"
     ) -> Dict:
         """
@@ -53,7 +54,8 @@ class AnalysisGenerator:
         
         Args:
             query: 用户的分析需求，如 "具身智能创业信号"
-            data: 待分析的内容列表
+            data: 待分析的内容列表，也可以是 StorageManager.iter_tweets 返回的迭代器
+                  （只保留进入 Prompt 的前若干条，其余仅计数）
             output_format: 输出格式 (markdown/json)
             
         Returns:
@@ -72,11 +74,14 @@ class AnalysisGenerator:
                 "generated_at": datetime.now().isoformat()
             }
         
+        # 只保留进入 Prompt 的样本，避免把全部数据留在内存
+        sample, data_count = self._sample_data(data)
+        
         # Step 1: 生成分析 Prompt（元提示词）
         analysis_prompt = await self._generate_analysis_prompt(query)
         
         # Step 2: 应用分析 Prompt 到数据
-        report = await self._apply_analysis(analysis_prompt, data, output_format)
+        report = await self._apply_analysis(analysis_prompt, sample, output_format, data_count)
         
         # Step 3: 提取重点
         highlights = await self._extract_highlights(report, query)
@@ -86,7 +91,7 @@ class AnalysisGenerator:
             "analysis_prompt": analysis_prompt,
             "report": report,
             "highlights": highlights,
-            "data_count": len(data),
+            "data_count": data_count,
             "generated_at": datetime.now().isoformat()
         }
     
@@ -117,13 +122,17 @@ class AnalysisGenerator:
         self, 
         analysis_prompt: str, 
         data: List[Dict],
-        output_format: str
+        output_format: str,
+        total: int = None
     ) -> str:
         """
         第二阶段：应用分析框架到实际数据
         """
+        if total is None:
+            total = len(data)
+        
         # 准备数据摘要（避免 token 过多）
-        data_summary = self._prepare_data_summary(data)
+        data_summary = self._prepare_data_summary(data, total=total)
         
         apply_prompt = f"""请根据以下分析框架，对数据进行深度分析。
 
@@ -131,7 +140,7 @@ class AnalysisGenerator:
 {analysis_prompt}
 
 ## 待分析数据
-共 {len(data)} 条内容:
+共 {total} 条内容:
 {data_summary}
 
 ## 输出要求
@@ -171,8 +180,23 @@ class AnalysisGenerator:
         
         return [response]
     
-    def _prepare_data_summary(self, data: List[Dict], max_items: int = 100) -> str:
+    def _sample_data(self, data: Iterable[Dict], max_items: int = 100) -> Tuple[List[Dict], int]:
+        """
+        取出前 max_items 条作为样本，并统计总数
+        
+        对迭代器只做一次遍历，样本之外的数据读出后立即丢弃。
+        """
+        if isinstance(data, Sequence):
+            return list(data[:max_items]), len(data)
+        
+        iterator = iter(data)
+        sample = list(islice(iterator, max_items))
+        return sample, len(sample) + sum(1 for _ in iterator)
+    
+    def _prepare_data_summary(self, data: List[Dict], max_items: int = 100, total: int = None) -> str:
         """准备数据摘要，控制 token 消耗"""
+        if total is None:
+            total = len(data)
         summaries = []
         
         for item in data[:max_items]:
@@ -182,51 +206,39 @@ class AnalysisGenerator:
             
             summaries.append(f"[@{author} {time}]: {text}")
         
-        if len(data) > max_items:
-            summaries.append(f"... 还有 {len(data) - max_items} 条内容未显示")
+        if total > max_items:
+            summaries.append(f"... 还有 {total - max_items} 条内容未显示")
         
         return "\n\n".join(summaries)
     
     async def _call_llm(self, prompt: str, max_tokens: int = 2000) -> str:
         """调用 OpenRouter API"""
         try:
-            response = requests.post(
-                self.api_base,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                    "HTTP-Referer": "https://github.com/xskill",
-                    "X-Title": "XSkill Analysis"
-                },
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7,
-                    "max_tokens": max_tokens
-                },
-                timeout=120
+            return await self.llm.chat(
+                prompt,
+                model=self.model,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                timeout=120,
+                title="XSkill Analysis"
             )
-            response.raise_for_status()
-            
-            result = response.json()
-            return result['choices'][0]['message']['content']
-            
-        except Exception as e:
+        except LLMError as e:
             print(f"❌ LLM 调用失败: {e}")
             return f"分析生成失败: {str(e)}"
     
-    async def quick_summary(self, data: List[Dict]) -> str:
+    async def quick_summary(self, data: Iterable[Dict]) -> str:
         """快速数据摘要（不进行深度分析）"""
-        if not data:
+        sample, total = self._sample_data(data, max_items=20)
+        if not total:
             return "没有数据可供分析"
         
-        prompt = f"""请对以下 {len(data)} 条社交媒体内容做一个简要总结，包括：
+        prompt = f"""请对以下 {total} 条社交媒体内容做一个简要总结，包括：
 1. 主要话题
 2. 情绪倾向
 3. 值得关注的信号
 
 数据:
-{self._prepare_data_summary(data, max_items=20)}"""
+{self._prepare_data_summary(sample, max_items=20, total=total)}"""
 
         return await self._call_llm(prompt, max_tokens=800)
     
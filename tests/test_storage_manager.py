@@ -0,0 +1,118 @@
+"""
+test_storage_manager.py - StorageManager 回归测试
+
+所有用例都在 tmp_path 下的临时数据库中运行，不触碰 data/。
+"""
+
+import pytest
+
+from core.storage_manager import StorageManager
+
+
+@pytest.fixture
+def sm(tmp_path):
+    manager = StorageManager(data_dir=tmp_path)
+    yield manager
+    manager.close()
+
+
+def test_merge_intervals(sm):
+    merged = sm.merge_intervals([
+        ("2024-01-01", "2024-01-10"),
+        ("2024-01-08", "2024-01-20"),
+        ("2024-01-25", "2024-01-30"),
+    ])
+    assert merged == [("2024-01-01", "2024-01-20"), ("2024-01-25", "2024-01-30")]
+
+
+def test_missing_ranges(sm):
+    sm.update_manifest("test_user", ("2024-01-05", "2024-01-20"))
+    gaps = sm.get_missing_ranges("test_user", "2024-01-01", "2024-01-30")
+    assert gaps == [("2024-01-01", "2024-01-04"), ("2024-01-21", "2024-01-30")]
+
+
+def test_high_water_mark_only_moves_forward(sm):
+    sm.update_high_water_mark("test_user", [{"content_id": "200", "publish_time": "2024-01-20T10:00:00"}], 1705800000)
+    sm.update_high_water_mark("test_user", [{"content_id": "150", "publish_time": "2024-01-19T10:00:00"}], 1705900000)
+    mark = sm.get_high_water_marks(["test_user"])["test_user"]
+    assert mark["tweet_id"] == "200"
+    assert mark["checked_at"] == 1705900000
+
+
+def test_multi_author_date_range_uses_author_time_index(sm):
+    """多作者日期区间读取必须是 (author, publish_time_epoch) 索引范围扫描"""
+    plan = sm.explain_tweets_query(
+        author=["test_user", "another_user"],
+        start_date="2024-01-01",
+        end_date="2024-01-30"
+    )
+    assert any("idx_author_time_epoch" in step and "publish_time_epoch>?" in step for step in plan), \
+        f"日期过滤未走 idx_author_time_epoch 索引: {plan}"
+
+
+def test_high_water_mark_skips_rows_without_numeric_id(sm):
+    sm.update_high_water_mark("test_user", [
+        {"content_id": None, "publish_time": "2024-01-21T10:00:00"},
+        {"tweet_id": "abc", "publish_time": "2024-01-22T10:00:00"},
+        {"content_id": "300", "publish_time": "2024-01-20T10:00:00"},
+    ], 1705800000)
+    mark = sm.get_high_water_marks(["test_user"])["test_user"]
+    assert mark["tweet_id"] == "300"
+
+
+def test_posting_rates_use_utc_window(sm, monkeypatch):
+    """本地时区与 UTC 不在同一天时，窗口仍按 UTC 日期计算"""
+    import core.storage_manager as storage_module
+    from datetime import date, datetime, timedelta, timezone
+
+    utc_today = datetime.now(timezone.utc).date()
+
+    class LocalDate(date):
+        @classmethod
+        def today(cls):
+            return utc_today + timedelta(days=1)
+
+    monkeypatch.setattr(storage_module, "date", LocalDate)
+    sm.update_manifest("test_user", (utc_today.isoformat(), utc_today.isoformat()))
+    assert sm.get_posting_rates(["test_user"], lookback_days=0) == {"test_user": 0.0}
+
+
+def test_incremental_scrape_not_used_for_days_before_the_mark_window(sm):
+    """
+    高水位只由今天的窗口建立时，更早的尾部缺口必须按窗口抓取；
+    否则 since_id 只抓到高水位之后的推文，更早的日子却被记为已覆盖。
+    """
+    import asyncio
+    from datetime import datetime, timedelta, timezone
+
+    from core.scrape_executor import ScrapeExecutor
+
+    now = datetime.now(timezone.utc)
+    today = now.strftime("%Y-%m-%d")
+    six_days_ago = (now - timedelta(days=5)).strftime("%Y-%m-%d")
+    calls = []
+
+    class FakeScraper:
+        async def scrape_window(self, handle, start_date=None, end_date=None, max_pages=None):
+            calls.append(("window", start_date, end_date))
+            tweet_id = str(len(calls) * 100)
+            return [{"content_id": tweet_id, "tweet_id": tweet_id, "author": handle,
+                     "text": "t", "publish_time": now.isoformat()}], True
+
+        async def scrape_since(self, handle, since_id, max_pages=None):
+            calls.append(("since", since_id))
+            return [], True
+
+        def pack_handles(self, handles):
+            return [handles]
+
+        def flush(self):
+            pass
+
+    executor = ScrapeExecutor(FakeScraper(), sm, concurrency=1, batch_max_rate=0)
+    asyncio.run(executor.run({"test_user": [(today, today)]}))
+    assert sm.get_high_water_marks(["test_user"])["test_user"]["tweet_id"]
+
+    calls.clear()
+    asyncio.run(executor.run({"test_user": [(six_days_ago, today)]}))
+    assert calls == [("window", six_days_ago, today)]